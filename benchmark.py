@@ -0,0 +1,320 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from datos import SHEET_NAME, clean_invoices, compact_invoices, load_workbooks, read_snapshot, write_snapshot
+from diagnostico import max_rss_bytes
+from filtros import ROLLING_WINDOWS, DateRangeIndex, FilterIndex
+from resumenes import IncrementalSummaries
+
+# Tamaños por defecto de la suite (filas)
+BENCHMARK_SIZES = [10_000, 1_000_000, 10_000_000]
+
+# Hasta este tamaño los datos sintéticos se escriben como libro de Excel y se mide la
+# carga completa (parseo + snapshot); arriba de esto (Excel no admite más de ~1M filas
+# y openpyxl tardaría horas) se mide la limpieza desde el DataFrame crudo y el snapshot
+WORKBOOK_MAX_ROWS = 100_000
+
+# Selecciones al azar de la barra lateral que se miden por tamaño
+FILTER_SAMPLES = 20
+
+# Fracción de filas agregadas al final en la etapa de actualización incremental (se
+# compara contra create_summaries, el recálculo completo del mismo tamaño)
+APPEND_FRACTION = 0.01
+
+# Una etapa es una regresión si tarda más que este factor respecto a la base
+REGRESSION_FACTOR = 1.2
+
+# Muestra real: 5.5k filas, 24 clientes, 34 brokers, 41 proyectos, ~9 filas por factura.
+# Las cardinalidades sintéticas crecen de forma sublineal a partir de esa muestra
+SAMPLE_ROWS = 5_500
+
+
+def _scaled(base, num_rows, exponent, low, high):
+    return int(np.clip(round(base * (num_rows / SAMPLE_ROWS) ** exponent), low, high))
+
+
+def generate_invoices(num_rows, seed=0):
+    # Facturas sintéticas con las columnas de la hoja 'Facturas Generales' (nombres
+    # originales, antes del renombrado). Cada factura tiene un cliente, proyecto y broker;
+    # clientes y brokers siguen una distribución de Zipf como en la muestra
+    rng = np.random.default_rng(seed)
+    num_facturas = max(1, num_rows // 9)
+    num_clientes = _scaled(24, num_rows, 0.5, 5, 5_000)
+    num_brokers = _scaled(34, num_rows, 0.3, 5, 1_000)
+    num_camiones = _scaled(100, num_rows, 0.3, 10, 5_000)
+    dias = int(np.clip(num_rows // 17, 90, 3_650))
+
+    def zipf_choice(k, size):
+        pesos = 1.0 / np.arange(1, k + 1) ** 1.1
+        return rng.choice(k, size=size, p=pesos / pesos.sum())
+
+    # Atributos por factura (las facturas se numeran en orden de fecha)
+    inicio = np.datetime64('2020-01-01')
+    fecha_factura = np.sort(inicio + rng.integers(0, dias, num_facturas).astype('timedelta64[D]'))
+    cliente_factura = zipf_choice(num_clientes, num_facturas)
+    proyecto_factura = rng.integers(0, 3, num_facturas)
+    broker_factura = zipf_choice(num_brokers, num_facturas)
+
+    # Filas repartidas entre facturas, en orden
+    factura = np.sort(rng.integers(0, num_facturas, num_rows))
+    clientes = np.array([f'Cliente {i:04d}' for i in range(num_clientes)], dtype=object)
+    brokers = np.array([f'BR{i:03d}' for i in range(num_brokers)], dtype=object)
+    proyectos = np.array([f'{c} - P{k}' for c in clientes for k in range(3)], dtype=object)
+    cliente = clientes[cliente_factura[factura]]
+    proyecto = proyectos[cliente_factura[factura] * 3 + proyecto_factura[factura]]
+
+    horas = rng.integers(1, 13, num_rows).astype('float64')
+    tarifas = np.round(rng.uniform(60, 180, 130), 2)
+    costo = tarifas[rng.integers(0, len(tarifas), num_rows)]
+    total = np.round(horas * costo, 2)
+    pago = np.where(rng.random(num_rows) < 0.2, 0.0, np.round(total * rng.uniform(0.5, 0.8, num_rows), 2))
+    camion = rng.integers(1, num_camiones + 1, num_rows)
+
+    def sparse(values, fraction):
+        # Columna de texto con pocos valores y mayoría de nulos
+        data = np.array(values, dtype=object)[rng.integers(0, len(values), num_rows)]
+        data[rng.random(num_rows) >= fraction] = None
+        return data
+
+    numero = factura + 1000
+    return pd.DataFrame({
+        'Fecha': fecha_factura[factura].astype('datetime64[ns]'),
+        'Key_Fact': (pd.Series(numero).astype(str) + '|' + pd.Series(np.arange(num_rows)).astype(str)).to_numpy(),
+        'Factura': numero,
+        'Truck': camion,
+        'Broker': brokers[broker_factura[factura]],
+        'Observaciones': sparse([f'Obs {i}' for i in range(10)], 0.05),
+        'Camion': camion,
+        'Ticket': rng.integers(10_000, 10_000 + 10 * num_rows, num_rows),
+        'Clientes': cliente,
+        'Proyecto': proyecto,
+        'Proyecto OK': proyecto,
+        'Job Ok': sparse([f'Job {i}' for i in range(40)], 0.3),
+        'Volcadero': sparse([f'Volcadero {i}' for i in range(30)], 0.4),
+        'TicketVolcadero': sparse([str(i) for i in range(800)], 0.2),
+        'Material': sparse([f'Material {i}' for i in range(23)], 0.3),
+        'Horas o Viaje': horas,
+        'Costo unitario': costo,
+        'Total Cobrado': total,
+        'Pago a Broker': pago,
+        'Unamed': np.round(np.cumsum(total - pago), 2),
+    })
+
+
+def write_workbook(raw, path):
+    raw.to_excel(path, sheet_name=SHEET_NAME, index=False)
+
+
+class StageTimer:
+    # Mide tiempo (perf_counter) y, opcionalmente, el pico de memoria asignada (tracemalloc,
+    # que incluye los arreglos de numpy/pandas) de cada etapa. tracemalloc agrega
+    # sobrecosto a los tiempos: --sin-memoria da tiempos limpios
+
+    def __init__(self, num_rows, motor, memory=True):
+        self.num_rows = num_rows
+        self.motor = motor
+        self.memory = memory
+        self.results = []
+
+    def measure(self, etapa, fn, repeat=1, **extra):
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        seconds = (time.perf_counter() - start) / repeat
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        self.results.append({
+            'filas': self.num_rows, 'motor': self.motor, 'etapa': etapa,
+            'segundos': seconds, 'memoria_pico_mb': peak, **extra,
+        })
+        print(f"  {etapa:<32} {seconds * 1000:>10.1f} ms" + (f"  {peak:>9.1f} MB" if peak is not None else ''))
+        return result
+
+
+def _load(raw, workdir, timer):
+    # Carga: libro real (parseo en frío y snapshot en caliente) o limpieza + snapshot
+    cache_dir = os.path.join(workdir, 'cache')
+    if len(raw) <= WORKBOOK_MAX_ROWS:
+        path = os.path.join(workdir, 'facturas.xlsx')
+        write_workbook(raw, path)
+        timer.measure('load_data_frio', lambda: load_workbooks(path, cache_dir))
+        return timer.measure('load_data_snapshot', lambda: load_workbooks(path, cache_dir))
+    df = timer.measure('limpieza', lambda: compact_invoices(clean_invoices(raw.copy())))
+    snapshot_path = os.path.join(workdir, 'facturas.feather')
+    timer.measure('snapshot_escritura', lambda: write_snapshot(df, snapshot_path))
+    return timer.measure('load_data_snapshot', lambda: read_snapshot(snapshot_path))
+
+
+def _selections(fuente, rng, count):
+    opciones = {col: fuente.options(col) for col in ('CLIENTE', 'PERIODO', 'BROKER')}
+    selecciones = []
+    for _ in range(count):
+        seleccion = []
+        for col in ('CLIENTE', 'PERIODO', 'BROKER'):
+            valores = opciones[col]
+            if valores and rng.random() < 0.5:
+                seleccion.append(rng.sample(valores, min(len(valores), rng.randint(1, 3))))
+            else:
+                seleccion.append('Todos')
+        selecciones.append(tuple(seleccion))
+    return selecciones
+
+
+def run_size(num_rows, motor='pandas', memory=True, seed=0):
+    # Todas las etapas del dashboard para un tamaño; devuelve los resultados por etapa
+    from consultas import DuckDBBackend, PandasQueries
+    from graficas import (
+        build_brokers, build_clientes, build_periodos, build_proyectos, build_resumen_general,
+        payload_report, project_clients
+    )
+
+    print(f'{num_rows:,} filas ({motor})')
+    timer = StageTimer(num_rows, motor, memory)
+    with tempfile.TemporaryDirectory() as workdir:
+        raw = timer.measure('generar', lambda: generate_invoices(num_rows, seed))
+        df = _load(raw, workdir, timer)
+        del raw
+
+        if motor == 'duckdb':
+            backend = DuckDBBackend(os.path.join(workdir, 'facturas.duckdb'))
+            # El backend agrega ARCHIVO/FILA por su cuenta (como con snapshot_tables)
+            tablas = [('facturas.xlsx', df.drop(columns='ARCHIVO', errors='ignore'))]
+            timer.measure('carga_duckdb', lambda: backend.load(tablas, 'benchmark'))
+            fuente = backend.queries()
+        else:
+            estado = timer.measure('create_summaries', lambda: IncrementalSummaries(df, 'benchmark'))
+            # Misma versión como actualización de la anterior con APPEND_FRACTION filas menos
+            agregadas = max(1, int(len(df) * APPEND_FRACTION))
+            previo = IncrementalSummaries(df.iloc[:len(df) - agregadas], 'previo')
+            info = timer.measure('resumenes_incremental', lambda: previo.update(df, 'benchmark'),
+                                 filas_nuevas=agregadas)
+            timer.results[-1]['modo'] = info['modo']
+            del previo
+            _, df, cubo, _, carga = estado.current
+            filtros = timer.measure('indice_filtros', lambda: FilterIndex(df))
+            fechas = timer.measure('indice_fechas', lambda: DateRangeIndex(df))
+            fuente = PandasQueries('benchmark', df, cubo, filtros, fechas, carga)
+
+        rng = random.Random(seed)
+        selecciones = _selections(fuente, rng, FILTER_SAMPLES)
+        timer.measure('opciones_filtros', lambda: [fuente.options(col) for col in ('CLIENTE', 'PERIODO', 'BROKER')])
+        timer.measure('filtrado_resumenes', lambda: [fuente.summaries(*s)['resumen_cliente'] for s in selecciones],
+                      selecciones=len(selecciones))
+        ventanas = [fuente.window(name) for name in ROLLING_WINDOWS if ROLLING_WINDOWS[name] != 'RANGO']
+        timer.measure('kpis', lambda: [fuente.kpis(*ventana) for ventana in ventanas], ventanas=len(ventanas))
+
+        for nombre, builder, args in (('resumen_general', build_resumen_general, ()),
+                                      ('clientes', build_clientes, ()),
+                                      ('proyectos', build_proyectos, ()),
+                                      ('periodos', build_periodos, ()),
+                                      ('brokers', build_brokers, ())):
+            vista = timer.measure(f'figuras_{nombre}', lambda: builder(fuente.summaries(), *args))
+            timer.results[-1]['bytes_figuras'] = sum(payload_report(vista).values())
+        timer.measure('opciones_proyectos', lambda: project_clients(fuente.summaries()))
+
+        timer.measure('detalle_pagina', lambda: [
+            (fuente.detail_count(*s), fuente.detail_page(*s, pagina=0, tamano_pagina=100)) for s in selecciones
+        ], selecciones=len(selecciones))
+        if motor == 'duckdb':
+            backend.close()
+    return timer.results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(sizes=BENCHMARK_SIZES, motores=('pandas',), memory=True, seed=0):
+    resultados = []
+    for num_rows in sizes:
+        for motor in motores:
+            resultados.extend(run_size(num_rows, motor, memory, seed))
+    rss = max_rss_bytes()
+    return {
+        'meta': {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'maquina': platform.platform(),
+            'cpus': os.cpu_count(),
+            'memoria_medida': memory,
+            'semilla': seed,
+            'rss_max_mb': None if rss is None else rss / 2 ** 20,
+        },
+        'resultados': resultados,
+    }
+
+
+def compare_results(base, actual, factor=REGRESSION_FACTOR):
+    # Etapas comparables (mismo tamaño, motor y etapa) con su razón de tiempos;
+    # devuelve (filas de la comparación, regresiones)
+    previos = {(r['filas'], r['motor'], r['etapa']): r for r in base['resultados']}
+    filas, regresiones = [], []
+    for r in actual['resultados']:
+        previo = previos.get((r['filas'], r['motor'], r['etapa']))
+        if previo is None or not previo['segundos']:
+            continue
+        razon = r['segundos'] / previo['segundos']
+        fila = (r['filas'], r['motor'], r['etapa'], previo['segundos'], r['segundos'], razon)
+        filas.append(fila)
+        if razon > factor:
+            regresiones.append(fila)
+    return filas, regresiones
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark del dashboard con facturas sintéticas')
+    parser.add_argument('--filas', type=int, nargs='+', default=BENCHMARK_SIZES, help='Tamaños a medir')
+    parser.add_argument('--motor', nargs='+', choices=('pandas', 'duckdb'), default=['pandas'],
+                        help='Motores de consulta a medir')
+    parser.add_argument('--salida', default='benchmark.json', help='Archivo JSON con los resultados')
+    parser.add_argument('--comparar', help='Resultados anteriores (JSON) para buscar regresiones')
+    parser.add_argument('--sin-memoria', action='store_true', help='No medir memoria (tiempos sin tracemalloc)')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--generar', help='Solo escribir un libro sintético de --filas[0] filas en esta ruta')
+    args = parser.parse_args()
+
+    if args.generar:
+        write_workbook(generate_invoices(args.filas[0], args.semilla), args.generar)
+        print(f'{args.generar}: {args.filas[0]:,} filas')
+        raise SystemExit(0)
+
+    resultados = run_benchmark(args.filas, args.motor, not args.sin_memoria, args.semilla)
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, indent=2)
+    print(f'Resultados en {args.salida}')
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        if base['meta'].get('memoria_medida') != resultados['meta']['memoria_medida']:
+            print('Aviso: solo una de las corridas midió memoria (tracemalloc altera los tiempos)')
+        filas, regresiones = compare_results(base, resultados)
+        for num_rows, motor, etapa, antes, ahora, razon in filas:
+            marca = '  <-- regresión' if razon > REGRESSION_FACTOR else ''
+            print(f'{num_rows:>10,} {motor:<7} {etapa:<32} {antes * 1000:>9.1f} -> {ahora * 1000:>9.1f} ms '
+                  f'({razon:.2f}x){marca}')
+        if regresiones:
+            raise SystemExit(1)
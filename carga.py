@@ -0,0 +1,384 @@
+import contextlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# Script del dashboard que se prueba
+DASHBOARD_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard2.py')
+
+# Servidores (streamlit run, uno por proceso como los workers del servicio), sesiones
+# simultáneas por servidor y clics por sesión
+LOAD_WORKERS = 2
+LOAD_SESSIONS = 8
+LOAD_STEPS = 25
+
+# Segundos máximos de un rerun antes de darlo por fallido
+RERUN_TIMEOUT = 120
+
+# Segundos máximos para que un servidor responda en /_stcore/health
+SERVER_START_TIMEOUT = 60
+
+# Pausa media entre clics de una sesión (segundos; 0 = clics seguidos)
+THINK_SECONDS = 0.0
+
+# Percentiles de latencia del reporte
+PERCENTILES = (50, 95, 99)
+
+# Etiquetas de los widgets que se cambian
+FILTER_LABELS = ('Cliente', 'Período', 'Broker')
+VISTA_LABEL = 'Vista'
+CLIENTE_PROYECTO_LABEL = 'Filtrar por Cliente (opcional)'
+
+# Vista con el filtro adicional cliente_proyecto (tab 3)
+VISTA_PROYECTOS = "🏗️ Proyectos"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss_bytes(pid):
+    # Memoria residente máxima de otro proceso (VmHWM de /proc; None fuera de Linux)
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+@contextlib.contextmanager
+def streamlit_server(script=DASHBOARD_SCRIPT, env=None, timeout=SERVER_START_TIMEOUT):
+    # Un `streamlit run` real en un puerto libre; entrega (url del websocket, proceso)
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', script, '--server.port', str(port),
+         '--server.address', '127.0.0.1', '--server.headless', 'true',
+         '--browser.gatherUsageStats', 'false', '--server.fileWatcherType', 'none'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        limite = time.monotonic() + timeout
+        while True:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=5):
+                    break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > limite:
+                    raise RuntimeError(f'El servidor de {script} no arrancó en el puerto {port}')
+                time.sleep(0.2)
+        yield f'ws://127.0.0.1:{port}/_stcore/stream', server
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+class StreamlitSession:
+    # Una pestaña del navegador: websocket al servidor, valores de los widgets cambiados
+    # (se reenvían en cada rerun como hace el frontend) y selectbox/radio de la última página
+
+    def __init__(self, url, timeout=RERUN_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self._stack = contextlib.ExitStack()
+        self._socket = None
+        self._states = {}
+        self.widgets = {}
+
+    def __enter__(self):
+        from websockets.sync.client import connect
+
+        self._socket = self._stack.enter_context(
+            connect(self.url, subprotocols=['streamlit'], max_size=None, open_timeout=self.timeout))
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+
+    def set(self, label, value):
+        self._states[self.widgets[label]['id']] = value
+
+    def value(self, label):
+        widget = self.widgets[label]
+        if widget['id'] in self._states:
+            return self._states[widget['id']]
+        return widget['options'][widget['default']] if widget['options'] else None
+
+    def rerun(self):
+        # Pide un rerun y lee la página hasta script_finished; devuelve los errores
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        mensaje = BackMsg()
+        mensaje.rerun_script.query_string = ''
+        mensaje.rerun_script.page_script_hash = ''
+        for widget_id, value in self._states.items():
+            estado = mensaje.rerun_script.widget_states.widgets.add()
+            estado.id = widget_id
+            estado.string_value = value
+        self._socket.send(mensaje.SerializeToString())
+        widgets, errores = {}, []
+        while True:
+            respuesta = ForwardMsg()
+            respuesta.ParseFromString(self._socket.recv(timeout=self.timeout))
+            tipo = respuesta.WhichOneof('type')
+            if tipo == 'delta' and respuesta.delta.WhichOneof('type') == 'new_element':
+                elemento = respuesta.delta.new_element
+                nombre = elemento.WhichOneof('type')
+                if nombre in ('selectbox', 'radio'):
+                    widget = getattr(elemento, nombre)
+                    widgets[widget.label] = {'id': widget.id, 'options': list(widget.options),
+                                             'default': widget.default}
+                elif nombre == 'exception':
+                    errores.append(elemento.exception.message)
+            elif tipo == 'script_finished':
+                status = ForwardMsg.ScriptFinishedStatus.Name(respuesta.script_finished)
+                if status != 'FINISHED_SUCCESSFULLY':
+                    errores.append(status)
+                self.widgets = widgets
+                return errores
+
+
+def _choose(rng, options, current):
+    # Otro valor del selectbox (cualquiera si solo hay uno)
+    others = [option for option in options if option != current] or list(options)
+    return rng.choice(others)
+
+
+def _step(session, rng):
+    # Un clic al azar: Cliente, Período o Broker de la barra lateral, cambio de vista,
+    # o cliente_proyecto cuando la vista activa es la de proyectos
+    acciones = list(FILTER_LABELS) + ['vista']
+    if session.value(VISTA_LABEL) == VISTA_PROYECTOS and CLIENTE_PROYECTO_LABEL in session.widgets:
+        acciones.append('cliente_proyecto')
+    accion = rng.choice(acciones)
+    if accion == 'vista':
+        # Las sesiones pasan más tiempo en la de proyectos para ejercitar su filtro
+        opciones = session.widgets[VISTA_LABEL]['options'] + [VISTA_PROYECTOS] * 2
+        session.set(VISTA_LABEL, _choose(rng, opciones, session.value(VISTA_LABEL)))
+    else:
+        label = CLIENTE_PROYECTO_LABEL if accion == 'cliente_proyecto' else accion
+        session.set(label, _choose(rng, session.widgets[label]['options'], session.value(label)))
+    return accion
+
+
+class InFlight:
+    # Reruns en curso en el servidor a la vez: el máximo dice cuánta concurrencia se midió
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.maximum = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.maximum = max(self.maximum, self.current)
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+def run_session(url, steps, seed, timeout=RERUN_TIMEOUT, think=THINK_SECONDS, en_vuelo=None, start=None):
+    # Una sesión simulada: primer run y luego clics al azar. Las sesiones de un servidor
+    # corren a la vez (cada una con su hilo de script en el servidor), así que la latencia
+    # incluye la contención real del proceso: GIL, candados de los cachés y del estado
+    rng = random.Random(seed)
+    en_vuelo = en_vuelo or InFlight()
+    latencias, acciones, errores = [], [], []
+    with StreamlitSession(url, timeout) as session:
+        if start is not None:
+            start.wait()
+        inicio = time.perf_counter()
+        with en_vuelo:
+            errores.extend(session.rerun())
+        primera = time.perf_counter() - inicio
+        for _ in range(steps):
+            if think:
+                time.sleep(rng.uniform(0, 2 * think))
+            try:
+                accion = _step(session, rng)
+                inicio = time.perf_counter()
+                with en_vuelo:
+                    errores.extend(session.rerun())
+                latencias.append(time.perf_counter() - inicio)
+                acciones.append(accion)
+            except Exception as error:
+                errores.append(f'{type(error).__name__}: {error}')
+    return {'primera': primera, 'latencias': latencias, 'acciones': acciones, 'errores': errores}
+
+
+def run_worker(worker, sessions, steps, seed=0, script=DASHBOARD_SCRIPT, think=THINK_SECONDS):
+    # Un servidor con sus sesiones en hilos de este proceso. Una sesión de calentamiento
+    # carga los datos antes de empezar; el primer run de cada sesión no cuenta en las latencias
+    with streamlit_server(script) as (url, server):
+        calentamiento = run_session(url, 0, seed)['primera']
+        resultados = [None] * sessions
+        en_vuelo = InFlight()
+        # Todas las sesiones conectadas antes del primer rerun para que arranquen juntas
+        start = threading.Barrier(sessions)
+
+        def session(i):
+            try:
+                resultados[i] = run_session(url, steps, seed * 1_000_003 + worker * 1_000 + i,
+                                            think=think, en_vuelo=en_vuelo, start=start)
+            except Exception as error:
+                start.abort()
+                resultados[i] = {'primera': None, 'latencias': [], 'acciones': [],
+                                 'errores': [f'{type(error).__name__}: {error}']}
+
+        hilos = [threading.Thread(target=session, args=(i,), name=f'sesion-{i}') for i in range(sessions)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        segundos = time.perf_counter() - inicio
+        rss = peak_rss_bytes(server.pid)
+    latencias = [latencia for r in resultados for latencia in r['latencias']]
+    return {
+        'worker': worker,
+        'pid': server.pid,
+        'sesiones': sessions,
+        'calentamiento_segundos': calentamiento,
+        'segundos': segundos,
+        'reruns': len(latencias),
+        'en_vuelo_max': en_vuelo.maximum,
+        'errores': [error for r in resultados for error in r['errores']],
+        'primera_segundos': [r['primera'] for r in resultados if r['primera'] is not None],
+        'latencias': latencias,
+        'acciones': [accion for r in resultados for accion in r['acciones']],
+        'rss_max_bytes': rss,
+    }
+
+
+def latency_summary(latencias, segundos=None):
+    # Percentiles (ms), media y throughput (reruns por segundo) de una lista de latencias
+    if not latencias:
+        return {'reruns': 0}
+    valores = np.asarray(latencias) * 1000
+    resumen = {'reruns': len(valores), 'media_ms': float(valores.mean()), 'max_ms': float(valores.max())}
+    resumen.update({f'p{p}_ms': float(np.percentile(valores, p)) for p in PERCENTILES})
+    if segundos:
+        resumen['reruns_por_segundo'] = len(valores) / segundos
+    return resumen
+
+
+def run_load_test(workers=LOAD_WORKERS, sessions=LOAD_SESSIONS, steps=LOAD_STEPS, seed=0,
+                  script=DASHBOARD_SCRIPT, think=THINK_SECONDS):
+    # Lanza los servidores y sus sesiones en paralelo y junta el reporte: global, por
+    # servidor y por acción
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_worker, worker, sessions, steps, seed, script, think)
+                   for worker in range(workers)]
+        resultados = [future.result() for future in futures]
+    segundos = time.perf_counter() - start
+
+    latencias = [latencia for r in resultados for latencia in r['latencias']]
+    por_accion = {}
+    for r in resultados:
+        for accion, latencia in zip(r['acciones'], r['latencias']):
+            por_accion.setdefault(accion, []).append(latencia)
+    return {
+        'meta': {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'script': script,
+            'workers': workers,
+            'sesiones_por_worker': sessions,
+            'clics_por_sesion': steps,
+            'pausa_segundos': think,
+            'semilla': seed,
+            'cpus': os.cpu_count(),
+            'motor': os.environ.get('DASHBOARD_BACKEND', 'pandas'),
+            # Lo que se midió: servidores reales y sesiones websocket sin turnos entre ellas
+            'concurrencia': (f'{workers} servidores streamlit run × {sessions} sesiones websocket '
+                             f'simultáneas; máx. {max(r["en_vuelo_max"] for r in resultados)} '
+                             f'reruns en curso a la vez en un servidor'),
+        },
+        'total': {
+            **latency_summary(latencias, max(r['segundos'] for r in resultados)),
+            'segundos': segundos,
+            'errores': sum(len(r['errores']) for r in resultados),
+        },
+        'workers': [
+            {
+                'worker': r['worker'],
+                'pid': r['pid'],
+                **latency_summary(r['latencias'], r['segundos']),
+                'en_vuelo_max': r['en_vuelo_max'],
+                'errores': len(r['errores']),
+                # Algunos mensajes distintos para diagnosticar
+                'ejemplos_errores': sorted(set(r['errores']))[:5],
+                'calentamiento_segundos': r['calentamiento_segundos'],
+                'primera_p50_ms': float(np.median(r['primera_segundos']) * 1000) if r['primera_segundos'] else None,
+                'rss_max_mb': None if r['rss_max_bytes'] is None else r['rss_max_bytes'] / 2 ** 20,
+            }
+            for r in resultados
+        ],
+        'acciones': {accion: latency_summary(valores) for accion, valores in sorted(por_accion.items())},
+    }
+
+
+def print_report(reporte):
+    total = reporte['total']
+    meta = reporte['meta']
+    print(f"{meta['concurrencia']} · {meta['clics_por_sesion']} clics por sesión ({meta['motor']})")
+
+    def linea(nombre, r):
+        if not r['reruns']:
+            return f'{nombre:<20} sin reruns'
+        texto = f"{nombre:<20} {r['reruns']:>6} reruns  " + '  '.join(
+            f"p{p} {r[f'p{p}_ms']:>8.1f} ms" for p in PERCENTILES)
+        if 'reruns_por_segundo' in r:
+            texto += f"  {r['reruns_por_segundo']:>6.1f} reruns/s"
+        return texto
+
+    print(linea('total', total) + f"  errores {total['errores']}")
+    for w in reporte['workers']:
+        rss = f"  RSS máx. {w['rss_max_mb']:,.0f} MB" if w['rss_max_mb'] is not None else ''
+        print(linea(f"worker {w['worker']}", w) + f"  en curso máx. {w['en_vuelo_max']}" + rss)
+    for accion, r in reporte['acciones'].items():
+        print(linea(f'  {accion}', r))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Prueba de carga del dashboard: servidores streamlit run con sesiones websocket simultáneas')
+    parser.add_argument('--workers', type=int, default=LOAD_WORKERS, help='Servidores (procesos) en paralelo')
+    parser.add_argument('--sesiones', type=int, default=LOAD_SESSIONS, help='Sesiones simultáneas por servidor')
+    parser.add_argument('--clics', type=int, default=LOAD_STEPS, help='Clics (reruns) por sesión')
+    parser.add_argument('--pausa', type=float, default=THINK_SECONDS, help='Pausa media entre clics (segundos)')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--script', default=DASHBOARD_SCRIPT)
+    parser.add_argument('--salida', help='Archivo JSON con el reporte')
+    args = parser.parse_args()
+
+    reporte = run_load_test(args.workers, args.sesiones, args.clics, args.semilla, args.script, args.pausa)
+    print_report(reporte)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f'Reporte en {args.salida}')
@@ -0,0 +1,206 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from datos import CACHE_DIR
+
+# Caché en disco compartido por los procesos (workers) de la misma máquina: datos,
+# cubos y resúmenes de cada versión en archivos Arrow sin compresión. Un worker los
+# calcula y los demás los leen con memory-map en lugar de volver a parsear los libros
+SHARED_CACHE = os.environ.get('DASHBOARD_SHARED_CACHE', '1') == '1'
+SHARED_CACHE_DIR = os.environ.get('DASHBOARD_SHARED_CACHE_DIR', os.path.join(CACHE_DIR, 'compartido'))
+
+# Límites: tamaño total, número de versiones guardadas y segundos de vida (0 = sin límite)
+SHARED_CACHE_MAX_MB = float(os.environ.get('DASHBOARD_SHARED_CACHE_MB', '2048'))
+SHARED_CACHE_MAX_ENTRIES = int(os.environ.get('DASHBOARD_SHARED_CACHE_ENTRIES', '4'))
+SHARED_CACHE_TTL = float(os.environ.get('DASHBOARD_SHARED_CACHE_TTL', '0'))
+
+# Segundos que un worker espera a que otro termine de construir una entrada; un
+# candado más viejo se considera abandonado (el proceso murió)
+SHARED_CACHE_LOCK_TIMEOUT = 600
+
+MANIFEST = 'manifest.json'
+
+
+def _entry_name(key):
+    # Nombre de directorio seguro para cualquier llave
+    return hashlib.sha1(str(key).encode('utf-8')).hexdigest()[:24]
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            with contextlib.suppress(OSError):
+                total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+class SharedCache:
+    # Cada entrada es un directorio con un .feather por DataFrame y un manifiesto que
+    # se escribe al final (una entrada sin manifiesto está incompleta). La fecha de
+    # modificación del manifiesto marca el último uso para expulsar por LRU
+
+    def __init__(self, directory=SHARED_CACHE_DIR, max_bytes=SHARED_CACHE_MAX_MB * 2 ** 20,
+                 max_entries=SHARED_CACHE_MAX_ENTRIES, ttl=SHARED_CACHE_TTL,
+                 lock_timeout=SHARED_CACHE_LOCK_TIMEOUT):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, _entry_name(key))
+
+    def get(self, key):
+        # {nombre: DataFrame} de la entrada o None. Los archivos se abren con memory-map:
+        # las páginas las comparte el sistema operativo entre los procesos
+        import pyarrow.feather as feather
+
+        path = self._path(key)
+        manifest_path = os.path.join(path, MANIFEST)
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if self.ttl and time.time() - manifest['creado'] > self.ttl:
+                raise FileNotFoundError(manifest_path)
+            frames = {
+                name: feather.read_table(os.path.join(path, f'{name}.feather'), memory_map=True)
+                .to_pandas(split_blocks=True)
+                for name in manifest['tablas']
+            }
+            os.utime(manifest_path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return frames
+
+    def put(self, key, frames):
+        # Escribe la entrada en un directorio temporal y la publica con un rename.
+        # Devuelve False si no se pudo escribir (sin pyarrow o sin permisos)
+        try:
+            import pyarrow as pa
+            import pyarrow.feather as feather
+
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            for name, frame in frames.items():
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                feather.write_feather(table, os.path.join(tmp_path, f'{name}.feather'),
+                                      compression='uncompressed')
+            with open(os.path.join(tmp_path, MANIFEST), 'w', encoding='utf-8') as f:
+                json.dump({'llave': str(key), 'tablas': list(frames), 'creado': time.time()}, f)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+        except (ImportError, OSError):
+            return False
+        self.evict(keep=path)
+        return True
+
+    @contextlib.contextmanager
+    def building(self, key):
+        # Candado entre procesos (archivo creado con O_EXCL) mientras se construye una
+        # entrada; los demás esperan y después leen la entrada ya publicada
+        os.makedirs(self.directory, exist_ok=True)
+        lock_path = self._path(key) + '.lock'
+        deadline = time.time() + self.lock_timeout
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode('ascii'))
+                os.close(fd)
+                break
+            except FileExistsError:
+                with contextlib.suppress(OSError):
+                    if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                        os.remove(lock_path)
+                        continue
+                if time.time() > deadline:
+                    # Se construye sin candado antes que bloquear al usuario indefinidamente
+                    lock_path = None
+                    break
+                time.sleep(0.2)
+        try:
+            yield
+        finally:
+            if lock_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(lock_path)
+
+    def get_or_build(self, key, builder):
+        # Entrada del caché o, si falta, la construye un solo proceso y la publica
+        frames = self.get(key)
+        if frames is not None:
+            return frames
+        with self.building(key):
+            frames = self.get(key)
+            if frames is None:
+                frames = builder()
+                self.put(key, frames)
+        return frames
+
+    def _entries(self):
+        # (último uso, creado, ruta) de las entradas completas
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            manifest_path = os.path.join(self.directory, name, MANIFEST)
+            try:
+                with open(manifest_path, encoding='utf-8') as f:
+                    creado = json.load(f)['creado']
+                entries.append((os.path.getmtime(manifest_path), creado, os.path.join(self.directory, name)))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        # Borra las entradas vencidas y luego las de uso más antiguo hasta respetar los
+        # límites de entradas y tamaño. En Linux un archivo borrado sigue disponible
+        # para los procesos que ya lo tienen mapeado
+        entries = sorted(self._entries(), reverse=True)
+        now = time.time()
+        kept, total = 0, 0
+        for usado, creado, path in entries:
+            size = _dir_size(path)
+            expired = self.ttl and now - creado > self.ttl
+            over = kept >= self.max_entries or (self.max_bytes and total + size > self.max_bytes)
+            if path != keep and (expired or over):
+                shutil.rmtree(path, ignore_errors=True)
+                with self._lock:
+                    self.evictions += 1
+                continue
+            kept += 1
+            total += size
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entradas': len(entries),
+                'max_entradas': self.max_entries,
+                'bytes': sum(_dir_size(path) for _, _, path in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'tasa_hits': self.hits / total if total else 0.0,
+                'expulsiones': self.evictions,
+            }
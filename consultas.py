@@ -0,0 +1,539 @@
+import math
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from datos import CACHE_DIR, DATA_SOURCE
+from exportar import EXPORT_FORMATS, export_invoices
+from filtros import RANGE_MEASURES, normalize_selection, rolling_window, selection_key
+from resumenes import SUMMARY_KEYS, CubeSummaries, slice_cube
+
+# Motor de consultas del dashboard: 'pandas' (todo en memoria) o 'duckdb' (las
+# agregaciones, KPIs, top-N y el detalle se resuelven en el motor y a pandas solo
+# llegan los resultados). duckdb es opcional: pip install duckdb
+QUERY_BACKENDS = ('pandas', 'duckdb')
+QUERY_BACKEND = os.environ.get('DASHBOARD_BACKEND', 'pandas')
+if QUERY_BACKEND not in QUERY_BACKENDS:
+    QUERY_BACKEND = 'pandas'
+
+# Base DuckDB: por defecto en memoria, una por proceso, cargada desde los snapshots Feather
+# (lo que se comparte en disco). Con DASHBOARD_DUCKDB=<archivo> la base persiste entre
+# reinicios, pero DuckDB admite un solo proceso con el archivo abierto para escritura:
+# un segundo worker (o cualquier otro proceso que lo abra) falla por el lock del archivo
+DUCKDB_FILE = os.environ.get('DASHBOARD_DUCKDB', ':memory:')
+
+# Columnas de la tabla de detalle (los números se quedan numéricos)
+DETALLE_VISTA_COLS = [
+    'FECHA', 'FACTURA', 'CLIENTE', 'PROYECTO_OK',
+    'HORAS_VIAJE', 'COSTO_UNITARIO', 'TOTAL_COBRADO',
+    'PAGO_BROKER', 'UTILIDAD_BRUTA', 'MARGEN_BRUTO', 'BROKER'
+]
+
+# Las dos clases *Queries responden lo mismo para una versión de los datos:
+# options, date_limits, window, kpis, summaries (con top-N), detail_totals,
+# detail_count, detail_page y export
+
+
+class PandasQueries:
+    # Consultas sobre una versión en memoria: cubo colapsado para los resúmenes e índices
+    # de filtros y fechas para KPIs y detalle. cache (LRUCache opcional) guarda el orden
+    # de las filas del detalle por filtros
+
+    def __init__(self, version, df, cube, filter_index, date_index, carga=None, cache=None):
+        self.version = version
+        self.df = df
+        self.cube = cube
+        self.filter_index = filter_index
+        self.date_index = date_index
+        self.carga = carga
+        self.cache = cache
+
+    def options(self, col, reverse=False):
+        return sorted(self.df[col].dropna().unique().tolist(), reverse=reverse)
+
+    def date_limits(self):
+        return self.date_index.min_date, self.date_index.max_date
+
+    def window(self, name, start=None, end=None):
+        return rolling_window(name, self.date_index.max_date, start, end)
+
+    def kpis(self, start=None, end=None):
+        # Sumas acumuladas del rango (búsqueda binaria, sin recorrer filas)
+        totales = self.date_index.totals(start, end)
+        totales['NUM_FACTURAS'] = self.date_index.nunique('FACTURA', start, end)
+        totales['NUM_CLIENTES'] = self.date_index.nunique('CLIENTE', start, end)
+        return totales
+
+    def summaries(self, cliente='Todos', periodo='Todos', broker='Todos'):
+        # Los filtros se aplican al cubo (sin recorrer las facturas)
+        return CubeSummaries(slice_cube(self.cube, cliente, periodo, broker))
+
+    def _rows(self, cliente, periodo, broker, start, end):
+        # Intersección de las listas del índice, sin copiar los datos
+        return self.filter_index.rows(
+            within=self.date_index.rows(start, end), CLIENTE=cliente, PERIODO=periodo, BROKER=broker
+        )
+
+    def detail_totals(self, cliente='Todos', periodo='Todos', broker='Todos', start=None, end=None):
+        if normalize_selection(cliente) is None and normalize_selection(broker) is None:
+            # Sin filtros de cliente/broker los totales salen de las sumas acumuladas
+            return self.date_index.totals_for_periods(normalize_selection(periodo), start, end)
+        # Las filas filtradas ya están restringidas a los períodos y fechas seleccionados
+        filas = self._rows(cliente, periodo, broker, start, end)
+        medidas = self.df[RANGE_MEASURES]
+        medidas = medidas if filas is None else medidas.iloc[filas]
+        totales = medidas.sum().to_dict()
+        totales['NUM_FILAS'] = len(medidas)
+        return totales
+
+    def _sorted_rows(self, cliente, periodo, broker, start, end):
+        # Posiciones por FECHA descendente, en caché por filtros
+        def build():
+            return self.date_index.sort_desc(self._rows(cliente, periodo, broker, start, end))
+        if self.cache is None:
+            return build()
+        key = ('detalle_orden', self.version, selection_key(cliente), selection_key(periodo),
+               selection_key(broker), start, end)
+        return self.cache.get_or_build(key, build)
+
+    def detail_count(self, cliente='Todos', periodo='Todos', broker='Todos', start=None, end=None):
+        return len(self._sorted_rows(cliente, periodo, broker, start, end))
+
+    def detail_page(self, cliente='Todos', periodo='Todos', broker='Todos', start=None, end=None,
+                    pagina=0, tamano_pagina=100):
+        # Se cortan las posiciones ya ordenadas y solo se materializan esas filas
+        filas = self._sorted_rows(cliente, periodo, broker, start, end)
+        inicio = pagina * tamano_pagina
+        return self.df.iloc[filas[inicio:inicio + tamano_pagina]][DETALLE_VISTA_COLS]
+
+    def export(self, cliente='Todos', periodo='Todos', broker='Todos', start=None, end=None,
+               columns=None, formato='CSV'):
+        filas = self._rows(cliente, periodo, broker, start, end)
+        return export_invoices(self.df, filas, columns, formato)
+
+
+def _quote(col):
+    return '"' + col.replace('"', '""') + '"'
+
+
+def _arrow_for_duckdb(table, nombre, offset):
+    # Categóricas a sus valores y enteros a int64 (cada libro trae sus propios tipos
+    # reducidos), más ARCHIVO y FILA (posición en la concatenación, como en pandas)
+    import numpy as np
+    import pyarrow as pa
+
+    if isinstance(table, pd.DataFrame):
+        table = pa.Table.from_pandas(table, preserve_index=False)
+    columns = []
+    for field, column in zip(table.schema, table.columns):
+        if pa.types.is_dictionary(field.type):
+            column = column.cast(field.type.value_type)
+        if pa.types.is_integer(column.type):
+            column = column.cast(pa.int64())
+        columns.append(column)
+    columns.append(pa.array([nombre] * table.num_rows, pa.string()))
+    columns.append(pa.array(np.arange(offset, offset + table.num_rows, dtype=np.int64)))
+    return pa.table(columns, names=table.schema.names + ['ARCHIVO', 'FILA'])
+
+
+class DuckDBBackend:
+    # Facturas en un archivo DuckDB local. Cada versión se carga en su propia tabla
+    # (facturas_<n>) y se publica cambiando la fila de meta en una transacción; las
+    # consultas de un rerun quedan atadas a la tabla de su versión, así que un refresco
+    # no la cambia a la mitad. Al abrir un archivo existente se reutiliza la última
+    # versión cargada. Con un archivo, solo un proceso puede abrirlo (ver DUCKDB_FILE)
+
+    # Tablas de versiones anteriores que se conservan para los reruns en curso
+    KEEP_TABLES = 2
+
+    def __init__(self, path=DUCKDB_FILE):
+        import duckdb
+
+        directory = os.path.dirname(path)
+        if directory and path != ':memory:':
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = duckdb.connect(path)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (version VARCHAR, tabla VARCHAR, numero INTEGER, cargado TIMESTAMP)'
+        )
+        row = self._conn.execute('SELECT version, tabla, numero, cargado FROM meta').fetchone()
+        self.current = None if row is None else (row[0], row[1], {'numero': row[2], 'cargado': row[3]})
+
+    @property
+    def version(self):
+        return None if self.current is None else self.current[0]
+
+    def cursor(self):
+        # Un cursor por consulta: la conexión se comparte entre los hilos de las sesiones
+        return self._conn.cursor()
+
+    def close(self):
+        self._conn.close()
+
+    def refresh(self, version, loader):
+        # Carga la versión nueva si cambió (misma interfaz que IncrementalSummaries)
+        with self._lock:
+            if version == self.version:
+                return None
+            return self.load(loader(), version)
+
+    def load(self, tables, version=None):
+        # tables: pares (nombre del libro, tabla Arrow o DataFrame), p. ej. snapshot_tables()
+        numero = 1 if self.current is None else self.current[2]['numero'] + 1
+        tabla = f'facturas_{numero}'
+        con = self.cursor()
+        try:
+            con.execute(f'DROP TABLE IF EXISTS {tabla}')
+            filas, columnas = 0, None
+            for nombre, table in tables:
+                entrada = _arrow_for_duckdb(table, nombre, filas)
+                filas += entrada.num_rows
+                con.register('entrada', entrada)
+                if columnas is None:
+                    con.execute(f'CREATE TABLE {tabla} AS SELECT * FROM entrada')
+                    columnas = set(entrada.schema.names)
+                else:
+                    # Columnas que solo trae este libro
+                    for name, tipo, *_ in con.execute('DESCRIBE SELECT * FROM entrada').fetchall():
+                        if name not in columnas:
+                            con.execute(f'ALTER TABLE {tabla} ADD COLUMN {_quote(name)} {tipo}')
+                            columnas.add(name)
+                    con.execute(f'INSERT INTO {tabla} BY NAME SELECT * FROM entrada')
+                con.unregister('entrada')
+            if columnas is None:
+                raise ValueError('No hay libros que cargar')
+
+            cargado = datetime.now()
+            con.execute('BEGIN TRANSACTION')
+            con.execute('DELETE FROM meta')
+            con.execute('INSERT INTO meta VALUES (?, ?, ?, ?)', [version, tabla, numero, cargado])
+            con.execute('COMMIT')
+            self.current = (version, tabla, {'numero': numero, 'cargado': cargado})
+
+            for (name,) in con.execute(
+                "SELECT table_name FROM information_schema.tables WHERE table_name LIKE 'facturas_%'"
+            ).fetchall():
+                sufijo = name.rsplit('_', 1)[-1]
+                if sufijo.isdigit() and int(sufijo) <= numero - self.KEEP_TABLES:
+                    con.execute(f'DROP TABLE IF EXISTS {name}')
+        finally:
+            con.close()
+        return {'modo': 'completo', 'filas_nuevas': filas, 'diferencias': []}
+
+    def queries(self):
+        # Consultas atadas a la versión publicada en este momento
+        version, tabla, carga = self.current
+        return DuckDBQueries(self, version, tabla, carga)
+
+
+# Columnas de cada resumen sobre la agregación por sus llaves (las mismas de resumenes.py)
+_MARGEN = ('CASE WHEN TOTAL_COBRADO > 0 THEN (UTILIDAD_BRUTA / TOTAL_COBRADO) * 100 ELSE 0 END '
+           'AS MARGEN_PORCENTAJE')
+SUMMARY_SELECT = {
+    'resumen_cliente': 'CLIENTE, NUM_FACTURAS, TOTAL_COBRADO, PAGO_BROKER, UTILIDAD_BRUTA, ' + _MARGEN,
+    'resumen_proyecto': ('CLIENTE, PROYECTO_OK AS PROYECTO, NUM_FACTURAS, TOTAL_COBRADO, PAGO_BROKER, '
+                         'UTILIDAD_BRUTA, ' + _MARGEN),
+    'resumen_periodo': 'PERIODO, NUM_FACTURAS, TOTAL_COBRADO, PAGO_BROKER, UTILIDAD_BRUTA, ' + _MARGEN,
+    'resumen_broker': 'BROKER, NUM_FACTURAS AS NUM_SERVICIOS, PAGO_BROKER AS TOTAL_PAGADO, TOTAL_COBRADO',
+}
+
+# Orden del detalle: FECHA descendente (empates: la fila posterior primero, como el
+# argsort estable del índice de fechas) y las filas sin fecha al final en su orden
+_DETAIL_ORDER = 'FECHA DESC NULLS LAST, CASE WHEN FECHA IS NULL THEN FILA ELSE -FILA END'
+
+
+def _measure_sums():
+    # Los nulos cuentan como cero, igual que en sum()
+    return ', '.join(f'COALESCE(SUM({col}), 0) AS {col}' for col in RANGE_MEASURES)
+
+
+class DuckDBSummaries:
+    # Resúmenes de un corte resueltos en DuckDB (misma interfaz que CubeSummaries):
+    # cada resumen es un GROUP BY con COUNT(DISTINCT FACTURA) y top() un ORDER BY ... LIMIT
+
+    def __init__(self, queries, where, params):
+        self.queries = queries
+        self.where = where
+        self.params = params
+        self._frames = {}
+
+    def _sql(self, nombre):
+        cube_keys = SUMMARY_KEYS[nombre][1]
+        keys = ', '.join(cube_keys)
+        not_null = ' AND '.join(f'{col} IS NOT NULL' for col in cube_keys)
+        where = f'{self.where} AND {not_null}' if self.where else f' WHERE {not_null}'
+        return (f'WITH agregado AS (SELECT {keys}, COUNT(DISTINCT FACTURA) AS NUM_FACTURAS, '
+                f'{_measure_sums()} FROM {self.queries.tabla}{where} GROUP BY {keys}) '
+                f'SELECT {SUMMARY_SELECT[nombre]} FROM agregado ORDER BY {keys}')
+
+    def __getitem__(self, nombre):
+        if nombre not in self._frames:
+            self._frames[nombre] = self.queries.fetch(self._sql(nombre), self.params)
+        return self._frames[nombre]
+
+    def top(self, nombre, columna, n, positive=None, **equal):
+        # positive: columna que debe ser > 0; equal: columnas con un valor fijo.
+        # Empates en el orden del resumen, como nlargest
+        conditions, params = [f'{columna} IS NOT NULL'], list(self.params)
+        for col, value in equal.items():
+            conditions.append(f'{col} = ?')
+            params.append(value)
+        if positive is not None:
+            conditions.append(f'{positive} > 0')
+        summary_keys = ', '.join(SUMMARY_KEYS[nombre][2])
+        sql = (f'SELECT * FROM ({self._sql(nombre)}) AS resumen WHERE {" AND ".join(conditions)} '
+               f'ORDER BY {columna} DESC, {summary_keys} LIMIT {int(n)}')
+        return self.queries.fetch(sql, params)
+
+
+class DuckDBQueries:
+    # Consultas sobre la tabla de una versión en DuckDB
+
+    def __init__(self, backend, version, tabla, carga=None):
+        self.backend = backend
+        self.version = version
+        self.tabla = tabla
+        self.carga = carga
+
+    def fetch(self, sql, params=()):
+        con = self.backend.cursor()
+        try:
+            return con.execute(sql, list(params)).df()
+        finally:
+            con.close()
+
+    def _fetchone(self, sql, params=()):
+        con = self.backend.cursor()
+        try:
+            return con.execute(sql, list(params)).fetchone()
+        finally:
+            con.close()
+
+    def _where(self, cliente='Todos', periodo='Todos', broker='Todos', start=None, end=None):
+        # Filtros de la barra lateral y rango de fechas (end inclusivo, día completo)
+        conditions, params = [], []
+        for col, value in (('CLIENTE', cliente), ('PERIODO', periodo), ('BROKER', broker)):
+            values = normalize_selection(value)
+            if values is not None:
+                conditions.append(f'{col} IN ({", ".join("?" * len(values))})')
+                params.extend(values)
+        if start is not None:
+            conditions.append('FECHA >= ?')
+            params.append(pd.Timestamp(start).normalize().to_pydatetime())
+        if end is not None:
+            conditions.append('FECHA < ?')
+            params.append((pd.Timestamp(end).normalize() + pd.Timedelta(days=1)).to_pydatetime())
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', params
+
+    def options(self, col, reverse=False):
+        orden = 'DESC' if reverse else 'ASC'
+        frame = self.fetch(f'SELECT DISTINCT {_quote(col)} AS valor FROM {self.tabla} '
+                           f'WHERE {_quote(col)} IS NOT NULL ORDER BY valor {orden}')
+        return frame['valor'].tolist()
+
+    def date_limits(self):
+        min_date, max_date = self._fetchone(f'SELECT MIN(FECHA), MAX(FECHA) FROM {self.tabla}')
+        if min_date is None:
+            return None, None
+        return pd.Timestamp(min_date), pd.Timestamp(max_date)
+
+    def window(self, name, start=None, end=None):
+        return rolling_window(name, self.date_limits()[1], start, end)
+
+    def kpis(self, start=None, end=None):
+        where, params = self._where(start=start, end=end)
+        row = self._fetchone(
+            f'SELECT {_measure_sums()}, COUNT(*), COUNT(DISTINCT FACTURA), COUNT(DISTINCT CLIENTE) '
+            f'FROM {self.tabla}{where}', params
+        )
+        totales = {col: float(value) for col, value in zip(RANGE_MEASURES, row)}
+        totales['NUM_FILAS'], totales['NUM_FACTURAS'], totales['NUM_CLIENTES'] = (int(v) for v in row[-3:])
+        return totales
+
+    def summaries(self, cliente='Todos', periodo='Todos', broker='Todos'):
+        return DuckDBSummaries(self, *self._where(cliente, periodo, broker))
+
+    def detail_totals(self, cliente='Todos', periodo='Todos', broker='Todos', start=None, end=None):
+        where, params = self._where(cliente, periodo, broker, start, end)
+        row = self._fetchone(f'SELECT {_measure_sums()}, COUNT(*) FROM {self.tabla}{where}', params)
+        totales = {col: float(value) for col, value in zip(RANGE_MEASURES, row)}
+        totales['NUM_FILAS'] = int(row[-1])
+        return totales
+
+    def detail_count(self, cliente='Todos', periodo='Todos', broker='Todos', start=None, end=None):
+        where, params = self._where(cliente, periodo, broker, start, end)
+        return int(self._fetchone(f'SELECT COUNT(*) FROM {self.tabla}{where}', params)[0])
+
+    def detail_page(self, cliente='Todos', periodo='Todos', broker='Todos', start=None, end=None,
+                    pagina=0, tamano_pagina=100):
+        # Solo viaja la página visible (ORDER BY ... LIMIT/OFFSET en el motor)
+        where, params = self._where(cliente, periodo, broker, start, end)
+        columnas = ', '.join(_quote(col) for col in DETALLE_VISTA_COLS)
+        return self.fetch(
+            f'SELECT {columnas} FROM {self.tabla}{where} ORDER BY {_DETAIL_ORDER} '
+            f'LIMIT {int(tamano_pagina)} OFFSET {int(pagina) * int(tamano_pagina)}', params
+        )
+
+    def export(self, cliente='Todos', periodo='Todos', broker='Todos', start=None, end=None,
+               columns=None, formato='CSV'):
+        # COPY escribe el archivo desde el motor; se devuelve como export_invoices,
+        # un archivo temporal listo para leer
+        where, params = self._where(cliente, periodo, broker, start, end)
+        columnas = '*' if columns is None else ', '.join(_quote(col) for col in columns)
+        extension, _ = EXPORT_FORMATS[formato]
+        opciones = 'FORMAT parquet' if formato == 'Parquet' else 'FORMAT csv, HEADER'
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f'exportacion.{extension}')
+            con = self.backend.cursor()
+            try:
+                con.execute(f"COPY (SELECT {columnas} FROM {self.tabla}{where} ORDER BY FILA) "
+                            f"TO '{path.replace(chr(39), chr(39) * 2)}' ({opciones})", params)
+            finally:
+                con.close()
+            target = tempfile.TemporaryFile()
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, target)
+        target.seek(0)
+        return target
+
+
+def _comparable(frame):
+    # Categóricas y texto como object, números como float64 y fechas en ns
+    frame = frame.reset_index(drop=True).copy()
+    for col in frame.columns:
+        dtype = frame[col].dtype
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            frame[col] = frame[col].astype('datetime64[ns]')
+        elif pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            frame[col] = frame[col].astype('float64')
+        else:
+            frame[col] = frame[col].astype(object).where(frame[col].notna(), None)
+    return frame
+
+
+def _differences(nombre, esperado, obtenido, diferencias):
+    # Igualdad salvo el orden de suma de los flotantes (tolerancia de centavos)
+    try:
+        if isinstance(esperado, pd.DataFrame):
+            pd.testing.assert_frame_equal(_comparable(esperado), _comparable(obtenido),
+                                          check_dtype=False, rtol=1e-9, atol=1e-6)
+        elif isinstance(esperado, dict):
+            for key, value in esperado.items():
+                if not math.isclose(value, obtenido[key], rel_tol=1e-9, abs_tol=1e-6):
+                    raise AssertionError(f'{key}: {value} != {obtenido[key]}')
+        elif esperado != obtenido:
+            raise AssertionError(f'{esperado!r} != {obtenido!r}')
+    except (AssertionError, KeyError) as error:
+        diferencias.append((nombre, str(error)))
+
+
+def compare_backends(source=DATA_SOURCE, cache_dir=CACHE_DIR, samples=30, seed=0):
+    # Paridad pandas vs DuckDB sobre los mismos libros: opciones de filtros, KPIs por
+    # ventana, los cuatro resúmenes y sus top-N, totales, páginas del detalle y la
+    # exportación para selecciones al azar. Devuelve la lista de diferencias
+    import random
+
+    from datos import load_workbooks, snapshot_tables
+    from filtros import ROLLING_WINDOWS, DateRangeIndex, FilterIndex
+    from resumenes import invoice_cube
+
+    df = load_workbooks(source, cache_dir)
+    en_memoria = PandasQueries(None, df, invoice_cube(df, 'exacto'), FilterIndex(df), DateRangeIndex(df))
+    diferencias = []
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = DuckDBBackend(os.path.join(tmp, 'paridad.duckdb'))
+        try:
+            backend.load(snapshot_tables(source, cache_dir))
+            motor = backend.queries()
+            opciones = {}
+            for col, reverse in (('CLIENTE', False), ('PERIODO', True), ('BROKER', False)):
+                opciones[col] = en_memoria.options(col, reverse)
+                _differences(f'opciones {col}', opciones[col], motor.options(col, reverse), diferencias)
+            _differences('fechas', en_memoria.date_limits(), motor.date_limits(), diferencias)
+
+            min_date, max_date = en_memoria.date_limits()
+            rangos = [en_memoria.window(name) for name in ROLLING_WINDOWS if ROLLING_WINDOWS[name] != 'RANGO']
+            if min_date is not None:
+                rangos.append((min_date + (max_date - min_date) / 3, max_date - (max_date - min_date) / 3))
+            for start, end in rangos:
+                _differences(f'kpis {start}-{end}', en_memoria.kpis(start, end), motor.kpis(start, end),
+                             diferencias)
+
+            rng = random.Random(seed)
+            selecciones = [('Todos', 'Todos', 'Todos', None, None)]
+            for _ in range(samples):
+                seleccion = []
+                for col in ('CLIENTE', 'PERIODO', 'BROKER'):
+                    valores = opciones[col]
+                    if valores and rng.random() < 0.5:
+                        seleccion.append(rng.sample(valores, min(len(valores), rng.randint(1, 3))))
+                    else:
+                        seleccion.append('Todos')
+                seleccion += list(rng.choice(rangos))
+                selecciones.append(tuple(seleccion))
+
+            for cliente, periodo, broker, start, end in selecciones:
+                etiqueta = f'{cliente}/{periodo}/{broker}/{start}-{end}'
+                esperados = en_memoria.summaries(cliente, periodo, broker)
+                obtenidos = motor.summaries(cliente, periodo, broker)
+                for nombre in SUMMARY_KEYS:
+                    _differences(f'{nombre} {etiqueta}', esperados[nombre], obtenidos[nombre], diferencias)
+                for args, kwargs in ((('resumen_cliente', 'TOTAL_COBRADO', 10), {}),
+                                     (('resumen_cliente', 'MARGEN_PORCENTAJE', 15), {'positive': 'TOTAL_COBRADO'}),
+                                     (('resumen_proyecto', 'UTILIDAD_BRUTA', 10), {}),
+                                     (('resumen_broker', 'TOTAL_PAGADO', 15), {})):
+                    _differences(f'top {args} {etiqueta}', esperados.top(*args, **kwargs),
+                                 obtenidos.top(*args, **kwargs), diferencias)
+
+                filtros = (cliente, periodo, broker, start, end)
+                _differences(f'totales {etiqueta}', en_memoria.detail_totals(*filtros),
+                             motor.detail_totals(*filtros), diferencias)
+                total = en_memoria.detail_count(*filtros)
+                _differences(f'filas {etiqueta}', total, motor.detail_count(*filtros), diferencias)
+                for pagina in {0, max(0, (total - 1) // 100)}:
+                    _differences(f'detalle p{pagina} {etiqueta}',
+                                 en_memoria.detail_page(*filtros, pagina=pagina, tamano_pagina=100),
+                                 motor.detail_page(*filtros, pagina=pagina, tamano_pagina=100), diferencias)
+
+            for cliente, periodo, broker, start, end in selecciones[:3]:
+                filtros = (cliente, periodo, broker, start, end)
+                with en_memoria.export(*filtros, columns=DETALLE_VISTA_COLS, formato='Parquet') as a, \
+                        motor.export(*filtros, columns=DETALLE_VISTA_COLS, formato='Parquet') as b:
+                    _differences(f'exportación {cliente}/{periodo}/{broker}', pd.read_parquet(a),
+                                 pd.read_parquet(b), diferencias)
+        finally:
+            backend.close()
+    return diferencias
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Carga en DuckDB y paridad con pandas')
+    parser.add_argument('archivo', nargs='?', default=DATA_SOURCE, help='Archivo, directorio o patrón glob')
+    parser.add_argument('--paridad', action='store_true', help='Comparar los resultados de pandas y DuckDB')
+    parser.add_argument('--muestras', type=int, default=30, help='Selecciones al azar para la paridad')
+    args = parser.parse_args()
+
+    if args.paridad:
+        diferencias = compare_backends(args.archivo, samples=args.muestras)
+        for nombre, error in diferencias:
+            print(f'DIFERENCIA en {nombre}:\n{error}')
+        if diferencias:
+            raise SystemExit(1)
+        print('Paridad: pandas y DuckDB devuelven los mismos resultados')
+    else:
+        from datos import data_version, snapshot_tables
+
+        backend = DuckDBBackend()
+        info = backend.refresh(data_version(args.archivo), lambda: snapshot_tables(args.archivo))
+        version, tabla, carga = backend.current
+        estado = 'sin cambios' if info is None else f"{info['filas_nuevas']} filas"
+        print(f"{backend.path}: {tabla} (versión {carga['numero']}, {estado})")
+        backend.close()
@@ -1,145 +1,132 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import numpy as np
+import os
 from datetime import datetime
 
+from compartido import SHARED_CACHE, SharedCache
+from consultas import QUERY_BACKEND, DuckDBBackend, PandasQueries
+from datos import DATA_SOURCE, data_version, load_workbooks, snapshot_tables, source_signature
+from diagnostico import (
+    Metrics, RerunProfile, RerunTrace, diagnostics_enabled, frame_memory, max_rss_bytes, process_uptime
+)
+from exportar import EXPORT_FORMATS, EXPORT_MAX_ROWS, read_export
+from filtros import ROLLING_WINDOWS, DateRangeIndex, FilterIndex, selection_key, selection_label
+from graficas import (
+    build_brokers, build_clientes, build_periodos, build_proyectos,
+    build_resumen_general, payload_report, project_clients
+)
+from memo import LRUCache
+from precalculo import read_filter_options
+from refresco import REFRESH_SECONDS, DataRefresher
+from resumenes import IncrementalSummaries
+
+# Límites del caché de figuras y tablas (entradas y segundos de vida)
+VIEW_CACHE_MAX_ENTRIES = 128
+VIEW_CACHE_TTL = 3600
+
+# Comparar cada actualización incremental contra un recálculo completo
+VERIFY_INCREMENTAL = os.environ.get('DASHBOARD_VERIFY_INCREMENTAL') == '1'
+
+# Tamaños de página de la tabla de detalle
+DETALLE_PAGE_SIZES = [50, 100, 250, 500]
+
 # Configurar página
 st.set_page_config(page_title="Dashboard Facturas", layout="wide", initial_sidebar_state="expanded")
 
-# Cargar datos desde el archivo proporcionado
-@st.cache_data
+# Diagnóstico opcional: panel en la barra lateral (DASHBOARD_DIAGNOSTICS=1, o
+# ?diagnostico=<token> con DASHBOARD_DIAGNOSTICS_TOKEN) y perfil con cProfile de las etapas
+# del rerun (?perfil=1, solo con el panel activo; lo encienden los spans de la traza)
+diagnostico = diagnostics_enabled(st.query_params.get('diagnostico'))
+perfil = RerunProfile() if diagnostico and st.query_params.get('perfil') == '1' else None
+
+# Métricas del proceso (todas las sesiones y el hilo de refresco) y spans de este rerun
+@st.cache_resource
+def load_metrics():
+    return Metrics()
+
+metricas = load_metrics()
+traza = RerunTrace(metricas, perfil)
+
+# Loader de los libros para IncrementalSummaries y el hilo de refresco; no lleva caché
+# propio: la copia única por proceso es la de load_state (de solo lectura)
 def load_data():
-    # Leer el archivo Excel
-    file_path = 'Copia de Facturas generales_compartir.xlsx'
-    
-    # Leer la hoja 'Facturas Generales'
-    df = pd.read_excel(file_path, sheet_name='Facturas Generales')
-    
-    # Limpiar nombres de columnas
-    df.columns = [col.strip() if isinstance(col, str) else col for col in df.columns]
-    
-    # Renombrar columnas para mayor claridad
-    column_mapping = {
-        'Fecha': 'FECHA',
-        'Factura': 'FACTURA',
-        'Truck': 'CAMION_ID',
-        'Broker': 'BROKER',
-        'Camion': 'CAMION_NUM',
-        'Ticket': 'TICKET',
-        'Clientes': 'CLIENTE',
-        'Proyecto': 'PROYECTO',
-        'Proyecto OK': 'PROYECTO_OK',
-        'Horas o Viaje': 'HORAS_VIAJE',
-        'Costo unitario': 'COSTO_UNITARIO',
-        'Total Cobrado': 'TOTAL_COBRADO',
-        'Pago a Broker': 'PAGO_BROKER',
-        'Unamed': 'ACUMULADO'  # Parece ser un acumulado
-    }
-    
-    # Aplicar renombrado
-    df = df.rename(columns=column_mapping)
-    
-    # Convertir tipos de datos
-    df['FECHA'] = pd.to_datetime(df['FECHA'], errors='coerce')
-    
-    # Convertir columnas numéricas
-    numeric_cols = ['FACTURA', 'HORAS_VIAJE', 'COSTO_UNITARIO', 'TOTAL_COBRADO', 'PAGO_BROKER', 'ACUMULADO']
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # Crear columna de periodo (mes-año)
-    df['PERIODO'] = df['FECHA'].dt.strftime('%Y-%m')
-    
-    # Calcular utilidad bruta
-    df['UTILIDAD_BRUTA'] = df['TOTAL_COBRADO'] - df['PAGO_BROKER']
-    
-    # Calcular margen bruto (evitar división por cero)
-    df['MARGEN_BRUTO'] = np.where(
-        df['TOTAL_COBRADO'] > 0,
-        (df['UTILIDAD_BRUTA'] / df['TOTAL_COBRADO']) * 100,
-        0
-    )
-    
-    return df
-
-# Cargar datos
-df = load_data()
-
-# Crear resúmenes para los diferentes análisis
-@st.cache_data
-def create_summaries(df):
-    # Resumen por cliente
-    resumen_cliente = df.groupby('CLIENTE').agg({
-        'FACTURA': 'nunique',
-        'TOTAL_COBRADO': 'sum',
-        'PAGO_BROKER': 'sum',
-        'UTILIDAD_BRUTA': 'sum'
-    }).reset_index()
-    resumen_cliente = resumen_cliente.rename(columns={'FACTURA': 'NUM_FACTURAS'})
-    resumen_cliente['MARGEN_PORCENTAJE'] = np.where(
-        resumen_cliente['TOTAL_COBRADO'] > 0,
-        (resumen_cliente['UTILIDAD_BRUTA'] / resumen_cliente['TOTAL_COBRADO']) * 100,
-        0
-    )
-    
-    # Resumen por proyecto
-    resumen_proyecto = df.groupby(['CLIENTE', 'PROYECTO_OK']).agg({
-        'FACTURA': 'nunique',
-        'TOTAL_COBRADO': 'sum',
-        'PAGO_BROKER': 'sum',
-        'UTILIDAD_BRUTA': 'sum'
-    }).reset_index()
-    resumen_proyecto = resumen_proyecto.rename(columns={
-        'PROYECTO_OK': 'PROYECTO',
-        'FACTURA': 'NUM_FACTURAS'
-    })
-    resumen_proyecto['MARGEN_PORCENTAJE'] = np.where(
-        resumen_proyecto['TOTAL_COBRADO'] > 0,
-        (resumen_proyecto['UTILIDAD_BRUTA'] / resumen_proyecto['TOTAL_COBRADO']) * 100,
-        0
-    )
-    
-    # Resumen por período
-    resumen_periodo = df.groupby('PERIODO').agg({
-        'FACTURA': 'nunique',
-        'TOTAL_COBRADO': 'sum',
-        'PAGO_BROKER': 'sum',
-        'UTILIDAD_BRUTA': 'sum'
-    }).reset_index()
-    resumen_periodo = resumen_periodo.rename(columns={'FACTURA': 'NUM_FACTURAS'})
-    resumen_periodo['MARGEN_PORCENTAJE'] = np.where(
-        resumen_periodo['TOTAL_COBRADO'] > 0,
-        (resumen_periodo['UTILIDAD_BRUTA'] / resumen_periodo['TOTAL_COBRADO']) * 100,
-        0
-    )
-    
-    # Resumen por broker
-    resumen_broker = df.groupby('BROKER').agg({
-        'FACTURA': 'nunique',
-        'PAGO_BROKER': 'sum',
-        'TOTAL_COBRADO': 'sum'
-    }).reset_index()
-    resumen_broker = resumen_broker.rename(columns={
-        'FACTURA': 'NUM_SERVICIOS',
-        'PAGO_BROKER': 'TOTAL_PAGADO'
-    })
-    
-    # Datos detallados para tabla principal
-    datos_detallados = df[[
-        'FECHA', 'FACTURA', 'CLIENTE', 'PROYECTO_OK',
-        'HORAS_VIAJE', 'COSTO_UNITARIO', 'TOTAL_COBRADO',
-        'PAGO_BROKER', 'UTILIDAD_BRUTA', 'MARGEN_BRUTO',
-        'PERIODO', 'BROKER'
-    ]].copy()
-    
-    return datos_detallados, resumen_cliente, resumen_proyecto, resumen_periodo, resumen_broker
+    # Lee el snapshot columnar (Feather) si el Excel no cambió; si no, lo parsea y lo reconstruye
+    # DATA_SOURCE puede ser un libro, un directorio o un patrón glob (DASHBOARD_DATA).
+    # Los libros vencidos se parsean en serie: dentro de Streamlit este script es __main__
+    # y un pool con spawn lo volvería a ejecutar en cada worker (precalculo.py sí usa el pool)
+    with metricas.span('load_data'):
+        return load_workbooks(DATA_SOURCE, max_workers=1)
+
+# Con DASHBOARD_BACKEND=duckdb los libros se cargan desde sus snapshots Arrow a una
+# base DuckDB del proceso y las consultas se resuelven ahí, sin tener todas las filas en pandas
+def load_tables():
+    # Generador: el span cubre también la carga a DuckDB, que consume libro por libro
+    with metricas.span('load_data'):
+        yield from snapshot_tables(DATA_SOURCE, max_workers=1)
+
+# Datos, cubo y resúmenes de la versión actual. Si los libros cambian y solo se
+# agregaron facturas al final, se fusionan únicamente las filas nuevas.
+# Un hilo por proceso vigila los libros y publica la versión nueva cuando está lista
+@st.cache_resource
+def load_state():
+    firma = source_signature(DATA_SOURCE)
+    if QUERY_BACKEND == 'duckdb':
+        estado = DuckDBBackend()
+        estado.refresh(data_version(DATA_SOURCE), load_tables)
+        refresco = DataRefresher(estado, DATA_SOURCE, load_tables, signature=firma).start()
+    else:
+        # Con varios workers, el caché compartido en disco evita que cada uno parsee
+        # y agregue los mismos libros
+        compartido = SharedCache() if SHARED_CACHE else None
+        # Incluye load_data (o la lectura del caché compartido) y create_summaries
+        with metricas.span('cargar_estado'):
+            estado = IncrementalSummaries.load(data_version(DATA_SOURCE), load_data, verify=VERIFY_INCREMENTAL,
+                                               shared=compartido)
+        refresco = DataRefresher(estado, DATA_SOURCE, load_data, signature=firma).start()
+    return estado, refresco
+
+with traza.span('estado'):
+    estado, refresco = load_state()
+if not refresco.running:
+    # Sin hilo (DASHBOARD_REFRESH_SECONDS=0) se revisa en cada rerun
+    with traza.span('revisar_refresco'):
+        refresco.check()
+
+# Caché de figuras y tablas formateadas, compartido por las sesiones del proceso
+# (LRU + TTL); la llave combina la versión de los datos con los filtros activos
+@st.cache_resource
+def load_view_cache():
+    return LRUCache(max_entries=VIEW_CACHE_MAX_ENTRIES, ttl=VIEW_CACHE_TTL)
+
+cache_vistas = load_view_cache()
+
+# Índice de filtros (listas de filas por Cliente, Período y Broker)
+@st.cache_resource(max_entries=2)
+def load_filter_index(_df, version):
+    return FilterIndex(_df)
+
+# Índice de fechas ordenadas con sumas acumuladas para rangos y ventanas móviles
+@st.cache_resource(max_entries=2)
+def load_date_index(_df, version):
+    return DateRangeIndex(_df)
+
+# Una sola lectura de current por rerun: toda la página consulta la misma versión
+with traza.span('indices'):
+    if QUERY_BACKEND == 'duckdb':
+        fuente = estado.queries()
+    else:
+        version_datos, df, cubo, _, carga_datos = estado.current
+        fuente = PandasQueries(version_datos, df, cubo, load_filter_index(df, version_datos),
+                               load_date_index(df, version_datos), carga_datos, cache=cache_vistas)
+version_datos, carga_datos = fuente.version, fuente.carga
 
-# Crear resúmenes
-datos_detallados, resumen_cliente, resumen_proyecto, resumen_periodo, resumen_broker = create_summaries(df)
+# Columnas de la tabla principal de detalle
+DETALLE_COLS = [
+    'FECHA', 'FACTURA', 'CLIENTE', 'PROYECTO_OK',
+    'HORAS_VIAJE', 'COSTO_UNITARIO', 'TOTAL_COBRADO',
+    'PAGO_BROKER', 'UTILIDAD_BRUTA', 'MARGEN_BRUTO',
+    'PERIODO', 'BROKER'
+]
 
 # Título principal
 st.title("📊 Dashboard de Facturas - Análisis Financiero")
@@ -148,117 +135,142 @@ st.markdown("---")
 # KPIs generales en la barra lateral
 st.sidebar.header("📈 KPIs Principales")
 
-# Calcular KPIs
-total_ingresos = datos_detallados['TOTAL_COBRADO'].sum()
-total_pagos_broker = datos_detallados['PAGO_BROKER'].sum()
-total_utilidad = datos_detallados['UTILIDAD_BRUTA'].sum()
-total_facturas = datos_detallados['FACTURA'].nunique()
-total_clientes = datos_detallados['CLIENTE'].nunique()
-
-# Evitar división por cero
-margen_promedio = (total_utilidad / total_ingresos * 100) if total_ingresos > 0 else 0
-
-st.sidebar.metric("Total Ingresos", f"${total_ingresos:,.2f}")
-st.sidebar.metric("Total Pagos Broker", f"${total_pagos_broker:,.2f}")
-st.sidebar.metric("Utilidad Bruta", f"${total_utilidad:,.2f}")
-st.sidebar.metric("Margen Promedio", f"{margen_promedio:.2f}%")
-st.sidebar.metric("Número de Facturas", f"{total_facturas}")
-st.sidebar.metric("Número de Clientes", f"{total_clientes}")
+# Los KPIs se llenan después de leer el rango de fechas de los filtros
+kpis_sidebar = st.sidebar.container()
 
 # Filtros en la barra lateral
 st.sidebar.markdown("---")
 st.sidebar.header("🔎 Filtros")
 
+# Selección múltiple opcional: con ella cada filtro acepta varios valores
+seleccion_multiple = st.sidebar.toggle("Selección múltiple", value=False)
+
+def sidebar_filter(label, options):
+    # Selectbox con 'Todos' o multiselect (vacío equivale a 'Todos')
+    if seleccion_multiple:
+        return st.sidebar.multiselect(label, options, placeholder="Todos") or 'Todos'
+    return st.sidebar.selectbox(label, ['Todos'] + options)
+
+# Opciones de los filtros generadas en el build (precalculo.py); None si no hay artefacto
+# de esta versión (por ejemplo, después de un refresco)
+@st.cache_resource(max_entries=2)
+def load_precomputed_options(version):
+    return read_filter_options(version)
+
+def filter_options(col, reverse=False):
+    # Valores de un filtro: del artefacto de arranque o en caché por versión de los datos
+    with traza.span(f'opciones:{col}'):
+        precalculadas = load_precomputed_options(version_datos)
+        if precalculadas is not None and col in precalculadas:
+            return precalculadas[col][::-1] if reverse else precalculadas[col]
+        return cache_vistas.get_or_build(('opciones', version_datos, col, reverse),
+                                         lambda: fuente.options(col, reverse))
+
 # Filtro por cliente
-clientes = ['Todos'] + sorted(datos_detallados['CLIENTE'].dropna().unique().tolist())
-cliente_seleccionado = st.sidebar.selectbox("Cliente", clientes)
+clientes = filter_options('CLIENTE')
+cliente_seleccionado = sidebar_filter("Cliente", clientes)
 
 # Filtro por período
-periodos = ['Todos'] + sorted(datos_detallados['PERIODO'].dropna().unique().tolist(), reverse=True)
-periodo_seleccionado = st.sidebar.selectbox("Período", periodos)
+periodos = filter_options('PERIODO', reverse=True)
+periodo_seleccionado = sidebar_filter("Período", periodos)
 
 # Filtro por broker
-brokers = ['Todos'] + sorted(datos_detallados['BROKER'].dropna().unique().tolist())
-broker_seleccionado = st.sidebar.selectbox("Broker", brokers)
+brokers = filter_options('BROKER')
+broker_seleccionado = sidebar_filter("Broker", brokers)
+
+# Rango de fechas: ventanas móviles o rango personalizado (aplica a KPIs y Detalle)
+ventana_seleccionada = st.sidebar.selectbox("Rango de fechas", list(ROLLING_WINDOWS))
+rango_personalizado = (None, None)
+fecha_minima, fecha_maxima = fuente.date_limits()
+if ventana_seleccionada == 'Rango personalizado' and fecha_minima is not None:
+    rango_personalizado = st.sidebar.slider(
+        "Fechas",
+        min_value=fecha_minima.date(),
+        max_value=fecha_maxima.date(),
+        value=(fecha_minima.date(), fecha_maxima.date()),
+        format="DD/MM/YYYY",
+    )
+fecha_inicio, fecha_fin = fuente.window(ventana_seleccionada, *rango_personalizado)
+
+# Calcular KPIs del rango (sumas acumuladas en memoria o una consulta en DuckDB)
+with traza.span('kpis'):
+    totales_rango = fuente.kpis(fecha_inicio, fecha_fin)
+total_ingresos = totales_rango['TOTAL_COBRADO']
+total_pagos_broker = totales_rango['PAGO_BROKER']
+total_utilidad = totales_rango['UTILIDAD_BRUTA']
+total_facturas = totales_rango['NUM_FACTURAS']
+total_clientes = totales_rango['NUM_CLIENTES']
+
+# Evitar división por cero
+margen_promedio = (total_utilidad / total_ingresos * 100) if total_ingresos > 0 else 0
 
-# Aplicar filtros
-datos_filtrados = datos_detallados.copy()
+kpis_sidebar.metric("Total Ingresos", f"${total_ingresos:,.2f}")
+kpis_sidebar.metric("Total Pagos Broker", f"${total_pagos_broker:,.2f}")
+kpis_sidebar.metric("Utilidad Bruta", f"${total_utilidad:,.2f}")
+kpis_sidebar.metric("Margen Promedio", f"{margen_promedio:.2f}%")
+kpis_sidebar.metric("Número de Facturas", f"{total_facturas}")
+kpis_sidebar.metric("Número de Clientes", f"{total_clientes}")
 
-if cliente_seleccionado != 'Todos':
-    datos_filtrados = datos_filtrados[datos_filtrados['CLIENTE'] == cliente_seleccionado]
+clave_filtros = (
+    version_datos,
+    selection_key(cliente_seleccionado),
+    selection_key(periodo_seleccionado),
+    selection_key(broker_seleccionado),
+)
 
-if periodo_seleccionado != 'Todos':
-    datos_filtrados = datos_filtrados[datos_filtrados['PERIODO'] == periodo_seleccionado]
+def filtered_summaries():
+    # Resúmenes del corte (cubo filtrado o consultas en DuckDB); solo se calculan
+    # cuando la vista no está en caché
+    return fuente.summaries(cliente_seleccionado, periodo_seleccionado, broker_seleccionado)
 
-if broker_seleccionado != 'Todos':
-    datos_filtrados = datos_filtrados[datos_filtrados['BROKER'] == broker_seleccionado]
+# Bytes del JSON de cada figura de la vista mostrada (se miden al construirla)
+tamanos_figuras = {}
 
-# Tabs principales
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-    "📊 Resumen General", 
-    "🎯 Clientes", 
-    "🏗️ Proyectos", 
-    "📅 Períodos", 
-    "💼 Brokers",
-    "📄 Detalle"
-])
+def cached_view(nombre, builder, *args):
+    def build():
+        traza.count('vistas_construidas')
+        with traza.span('filtrado'):
+            resumenes = filtered_summaries()
+        with traza.span(f'figuras:{nombre}'):
+            vista = builder(resumenes, *args)
+            if isinstance(vista, dict):
+                vista['tamanos'] = payload_report(vista)
+        return vista
+    traza.count('vistas_pedidas')
+    vista = cache_vistas.get_or_build((nombre,) + clave_filtros + args, build)
+    if isinstance(vista, dict):
+        tamanos_figuras.update(vista['tamanos'])
+    return vista
 
 # Tab 1: Resumen General
-with tab1:
+def render_resumen_general():
+    vista = cached_view('resumen_general', build_resumen_general, selection_key(cliente_seleccionado))
+    
     col1, col2 = st.columns(2)
     
     with col1:
-        # Gráfico de pastel: Distribución de ingresos por cliente
-        if cliente_seleccionado == 'Todos':
-            top_clientes = resumen_cliente.nlargest(10, 'TOTAL_COBRADO')
-            fig_pie = px.pie(top_clientes, values='TOTAL_COBRADO', names='CLIENTE', 
-                             title='Top 10 Clientes por Ingresos',
-                             hole=0.3)
-            st.plotly_chart(fig_pie, use_container_width=True)
-        else:
-            # Para un cliente específico, mostrar distribución por proyecto
-            cliente_data = resumen_proyecto[resumen_proyecto['CLIENTE'] == cliente_seleccionado]
-            if not cliente_data.empty:
-                fig_pie = px.pie(cliente_data, values='TOTAL_COBRADO', names='PROYECTO',
-                                 title=f'Distribución de Ingresos por Proyecto - {cliente_seleccionado}',
-                                 hole=0.3)
-                st.plotly_chart(fig_pie, use_container_width=True)
+        # Gráfico de pastel: Distribución de ingresos por cliente (o por proyecto del cliente)
+        if vista['fig_pie'] is not None:
+            st.plotly_chart(vista['fig_pie'], use_container_width=True)
     
     with col2:
         # Gráfico de barras: Margen por cliente
-        margen_data = resumen_cliente[resumen_cliente['TOTAL_COBRADO'] > 0].nlargest(15, 'MARGEN_PORCENTAJE')
-        fig_margen = px.bar(margen_data, 
-                           x='MARGEN_PORCENTAJE', y='CLIENTE', orientation='h',
-                           title='Top 15 Clientes por Margen (%)',
-                           labels={'MARGEN_PORCENTAJE': 'Margen (%)'},
-                           color='MARGEN_PORCENTAJE',
-                           color_continuous_scale='RdYlGn')
-        st.plotly_chart(fig_margen, use_container_width=True)
+        st.plotly_chart(vista['fig_margen'], use_container_width=True)
     
     # Evolución temporal de ingresos y pagos
-    fig_evolucion = px.line(resumen_periodo, x='PERIODO', y=['TOTAL_COBRADO', 'PAGO_BROKER'],
-                           title='Evolución de Ingresos y Pagos a Brokers por Período',
-                           markers=True)
-    fig_evolucion.update_layout(xaxis_title="Período", yaxis_title="Monto ($)")
-    st.plotly_chart(fig_evolucion, use_container_width=True)
+    st.plotly_chart(vista['fig_evolucion'], use_container_width=True)
 
 # Tab 2: Análisis por Cliente
-with tab2:
+def render_clientes():
+    vista = cached_view('clientes', build_clientes)
+    
     st.header("Análisis Detallado por Cliente")
     
     col1, col2 = st.columns([2, 1])
     
     with col1:
         # Tabla interactiva de clientes
-        display_clients = resumen_cliente[['CLIENTE', 'NUM_FACTURAS', 'TOTAL_COBRADO', 
-                                          'PAGO_BROKER', 'UTILIDAD_BRUTA', 'MARGEN_PORCENTAJE']].copy()
-        display_clients = display_clients.sort_values('UTILIDAD_BRUTA', ascending=False)
-        display_clients['TOTAL_COBRADO'] = display_clients['TOTAL_COBRADO'].map('${:,.2f}'.format)
-        display_clients['PAGO_BROKER'] = display_clients['PAGO_BROKER'].map('${:,.2f}'.format)
-        display_clients['UTILIDAD_BRUTA'] = display_clients['UTILIDAD_BRUTA'].map('${:,.2f}'.format)
-        display_clients['MARGEN_PORCENTAJE'] = display_clients['MARGEN_PORCENTAJE'].map('{:.2f}%'.format)
-        
-        st.dataframe(display_clients, 
+        st.dataframe(vista['display_clients'], 
                      height=400, 
                      use_container_width=True,
                      column_config={
@@ -272,76 +284,35 @@ with tab2:
     
     with col2:
         # Gráfico de barras de ingresos por cliente
-        fig_ingresos = px.bar(resumen_cliente.nlargest(10, 'TOTAL_COBRADO'), 
-                             x='TOTAL_COBRADO', y='CLIENTE', orientation='h',
-                             title='Top 10 Ingresos por Cliente',
-                             color='TOTAL_COBRADO',
-                             color_continuous_scale='Blues')
-        st.plotly_chart(fig_ingresos, use_container_width=True)
+        st.plotly_chart(vista['fig_ingresos'], use_container_width=True)
     
     # Scatter plot: Ingresos vs Margen
-    fig_scatter = px.scatter(resumen_cliente, 
-                            x='TOTAL_COBRADO', 
-                            y='MARGEN_PORCENTAJE',
-                            size='NUM_FACTURAS', 
-                            color='CLIENTE',
-                            title='Ingresos vs Margen por Cliente',
-                            hover_name='CLIENTE',
-                            hover_data=['NUM_FACTURAS', 'UTILIDAD_BRUTA'])
-    fig_scatter.update_layout(xaxis_title="Total Cobrado ($)", yaxis_title="Margen (%)")
-    st.plotly_chart(fig_scatter, use_container_width=True)
+    st.plotly_chart(vista['fig_scatter'], use_container_width=True)
 
 # Tab 3: Análisis por Proyecto
-with tab3:
+def render_proyectos():
     st.header("Análisis por Proyecto")
     
     # Filtro adicional por cliente para proyectos
     cliente_proyecto = st.selectbox("Filtrar por Cliente (opcional)", 
-                                   ['Todos'] + sorted(resumen_proyecto['CLIENTE'].unique().tolist()),
+                                   ['Todos'] + cached_view('proyectos_clientes', project_clients),
                                    key="cliente_proyecto")
-    
-    if cliente_proyecto != 'Todos':
-        proyectos_data = resumen_proyecto[resumen_proyecto['CLIENTE'] == cliente_proyecto]
-    else:
-        proyectos_data = resumen_proyecto
+    vista = cached_view('proyectos', build_proyectos, cliente_proyecto)
     
     # Top proyectos más rentables
     col1, col2 = st.columns(2)
     
     with col1:
-        top_proyectos_utilidad = proyectos_data.nlargest(10, 'UTILIDAD_BRUTA')
-        if not top_proyectos_utilidad.empty:
-            fig_proy_utilidad = px.bar(top_proyectos_utilidad, 
-                                      x='UTILIDAD_BRUTA', y='PROYECTO', orientation='h',
-                                      title='Top 10 Proyectos por Utilidad Bruta',
-                                      color='UTILIDAD_BRUTA',
-                                      color_continuous_scale='Greens')
-            st.plotly_chart(fig_proy_utilidad, use_container_width=True)
+        if vista['fig_proy_utilidad'] is not None:
+            st.plotly_chart(vista['fig_proy_utilidad'], use_container_width=True)
     
     with col2:
-        top_proyectos_margen = proyectos_data.nlargest(10, 'MARGEN_PORCENTAJE')
-        if not top_proyectos_margen.empty:
-            fig_proy_margen = px.bar(top_proyectos_margen, 
-                                    x='MARGEN_PORCENTAJE', y='PROYECTO', orientation='h',
-                                    title='Top 10 Proyectos por Margen (%)',
-                                    color='MARGEN_PORCENTAJE',
-                                    color_continuous_scale='RdYlGn')
-            st.plotly_chart(fig_proy_margen, use_container_width=True)
+        if vista['fig_proy_margen'] is not None:
+            st.plotly_chart(vista['fig_proy_margen'], use_container_width=True)
     
     # Tabla filtrable de proyectos
     st.subheader("Detalle de Proyectos")
-    display_proyectos = proyectos_data[['CLIENTE', 'PROYECTO', 'NUM_FACTURAS', 
-                                       'TOTAL_COBRADO', 'PAGO_BROKER', 
-                                       'UTILIDAD_BRUTA', 'MARGEN_PORCENTAJE']].copy()
-    display_proyectos = display_proyectos.sort_values('UTILIDAD_BRUTA', ascending=False)
-    
-    # Formatear valores
-    display_proyectos['TOTAL_COBRADO'] = display_proyectos['TOTAL_COBRADO'].map('${:,.2f}'.format)
-    display_proyectos['PAGO_BROKER'] = display_proyectos['PAGO_BROKER'].map('${:,.2f}'.format)
-    display_proyectos['UTILIDAD_BRUTA'] = display_proyectos['UTILIDAD_BRUTA'].map('${:,.2f}'.format)
-    display_proyectos['MARGEN_PORCENTAJE'] = display_proyectos['MARGEN_PORCENTAJE'].map('{:.2f}%'.format)
-    
-    st.dataframe(display_proyectos, 
+    st.dataframe(vista['display_proyectos'], 
                  height=300, 
                  use_container_width=True,
                  column_config={
@@ -355,100 +326,45 @@ with tab3:
                  })
 
 # Tab 4: Análisis por Período
-with tab4:
+def render_periodos():
+    vista = cached_view('periodos', build_periodos)
+    
     st.header("Análisis Temporal por Período")
     
     # Métricas por período
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        fig_periodo_ingresos = px.bar(resumen_periodo, x='PERIODO', y='TOTAL_COBRADO',
-                                     title='Ingresos por Período',
-                                     color='TOTAL_COBRADO',
-                                     color_continuous_scale='Blues')
-        st.plotly_chart(fig_periodo_ingresos, use_container_width=True)
+        st.plotly_chart(vista['fig_periodo_ingresos'], use_container_width=True)
     
     with col2:
-        fig_periodo_utilidad = px.bar(resumen_periodo, x='PERIODO', y='UTILIDAD_BRUTA',
-                                     title='Utilidad Bruta por Período',
-                                     color='UTILIDAD_BRUTA',
-                                     color_continuous_scale='Greens')
-        st.plotly_chart(fig_periodo_utilidad, use_container_width=True)
+        st.plotly_chart(vista['fig_periodo_utilidad'], use_container_width=True)
     
     with col3:
-        fig_periodo_margen = px.line(resumen_periodo, x='PERIODO', y='MARGEN_PORCENTAJE',
-                                    title='Margen % por Período',
-                                    markers=True)
-        fig_periodo_margen.update_traces(line=dict(color='orange', width=3))
-        st.plotly_chart(fig_periodo_margen, use_container_width=True)
+        st.plotly_chart(vista['fig_periodo_margen'], use_container_width=True)
     
     # Análisis de tendencia
-    resumen_periodo_sorted = resumen_periodo.sort_values('PERIODO')
-    resumen_periodo_sorted['TENDENCIA_INGRESOS'] = resumen_periodo_sorted['TOTAL_COBRADO'].pct_change() * 100
-    resumen_periodo_sorted['TENDENCIA_UTILIDAD'] = resumen_periodo_sorted['UTILIDAD_BRUTA'].pct_change() * 100
-    
-    fig_tendencia = make_subplots(rows=2, cols=1, 
-                                  subplot_titles=('Tendencia de Crecimiento de Ingresos (%)', 
-                                                  'Tendencia de Crecimiento de Utilidad (%)'))
-    
-    fig_tendencia.add_trace(
-        go.Scatter(x=resumen_periodo_sorted['PERIODO'], 
-                  y=resumen_periodo_sorted['TENDENCIA_INGRESOS'],
-                  name='Ingresos',
-                  line=dict(color='blue', width=2)),
-        row=1, col=1
-    )
-    
-    fig_tendencia.add_trace(
-        go.Scatter(x=resumen_periodo_sorted['PERIODO'], 
-                  y=resumen_periodo_sorted['TENDENCIA_UTILIDAD'],
-                  name='Utilidad',
-                  line=dict(color='green', width=2)),
-        row=2, col=1
-    )
-    
-    fig_tendencia.update_layout(height=600, showlegend=True)
-    fig_tendencia.update_xaxes(title_text="Período", row=2, col=1)
-    fig_tendencia.update_yaxes(title_text="Crecimiento (%)", row=1, col=1)
-    fig_tendencia.update_yaxes(title_text="Crecimiento (%)", row=2, col=1)
-    
-    st.plotly_chart(fig_tendencia, use_container_width=True)
+    st.plotly_chart(vista['fig_tendencia'], use_container_width=True)
 
 # Tab 5: Análisis por Broker
-with tab5:
+def render_brokers():
+    vista = cached_view('brokers', build_brokers)
+    
     st.header("Análisis de Pagos por Broker")
     
     col1, col2 = st.columns([2, 1])
     
     with col1:
         # Top brokers por pago
-        top_brokers = resumen_broker.nlargest(15, 'TOTAL_PAGADO')
-        fig_broker = px.bar(top_brokers, x='TOTAL_PAGADO', y='BROKER', orientation='h',
-                           title='Top 15 Brokers por Total Pagado',
-                           color='TOTAL_PAGADO',
-                           color_continuous_scale='Purples')
-        fig_broker.update_layout(xaxis_title="Total Pagado ($)", yaxis_title="Broker")
-        st.plotly_chart(fig_broker, use_container_width=True)
+        st.plotly_chart(vista['fig_broker'], use_container_width=True)
     
     with col2:
         # Distribución de brokers
-        top_10_brokers = resumen_broker.nlargest(10, 'TOTAL_PAGADO')
-        fig_broker_pie = px.pie(top_10_brokers, 
-                               values='TOTAL_PAGADO', names='BROKER',
-                               title='Distribución Top 10 Brokers',
-                               hole=0.4)
-        st.plotly_chart(fig_broker_pie, use_container_width=True)
+        st.plotly_chart(vista['fig_broker_pie'], use_container_width=True)
     
     # Tabla de brokers
     st.subheader("Detalle de Brokers")
-    display_brokers = resumen_broker[['BROKER', 'NUM_SERVICIOS', 'TOTAL_PAGADO', 'TOTAL_COBRADO']].copy()
-    display_brokers = display_brokers.sort_values('TOTAL_PAGADO', ascending=False)
-    
-    # Formatear valores
-    display_brokers['TOTAL_PAGADO'] = display_brokers['TOTAL_PAGADO'].map('${:,.2f}'.format)
-    display_brokers['TOTAL_COBRADO'] = display_brokers['TOTAL_COBRADO'].map('${:,.2f}'.format)
-    
-    st.dataframe(display_brokers, 
+    st.dataframe(vista['display_brokers'], 
                  height=400, 
                  use_container_width=True,
                  column_config={
@@ -459,68 +375,235 @@ with tab5:
                  })
 
 # Tab 6: Detalle de Facturas
-with tab6:
+def render_detalle():
+    # Filtros de la barra lateral y rango de fechas
+    filtros_detalle = (cliente_seleccionado, periodo_seleccionado, broker_seleccionado,
+                       fecha_inicio, fecha_fin)
+    
     st.header("📄 Detalle de Facturas")
     
-    # Mostrar métricas del período seleccionado
-    if periodo_seleccionado != 'Todos':
-        periodo_data = datos_filtrados[datos_filtrados['PERIODO'] == periodo_seleccionado]
-        if not periodo_data.empty:
+    # Mostrar métricas del período o rango de fechas seleccionado
+    if periodo_seleccionado != 'Todos' or fecha_inicio is not None:
+        if periodo_seleccionado != 'Todos':
+            etiqueta_periodo = selection_label(periodo_seleccionado)
+        else:
+            etiqueta_periodo = f"{fecha_inicio:%d/%m/%Y} - {fecha_fin:%d/%m/%Y}"
+        totales_periodo = fuente.detail_totals(*filtros_detalle)
+        if totales_periodo['NUM_FILAS'] > 0:
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric(f"Ingresos {periodo_seleccionado}", 
-                         f"${periodo_data['TOTAL_COBRADO'].sum():,.2f}")
+                st.metric(f"Ingresos {etiqueta_periodo}", 
+                         f"${totales_periodo['TOTAL_COBRADO']:,.2f}")
             with col2:
-                st.metric(f"Pagos Broker {periodo_seleccionado}", 
-                         f"${periodo_data['PAGO_BROKER'].sum():,.2f}")
+                st.metric(f"Pagos Broker {etiqueta_periodo}", 
+                         f"${totales_periodo['PAGO_BROKER']:,.2f}")
             with col3:
-                st.metric(f"Utilidad {periodo_seleccionado}", 
-                         f"${periodo_data['UTILIDAD_BRUTA'].sum():,.2f}")
+                st.metric(f"Utilidad {etiqueta_periodo}", 
+                         f"${totales_periodo['UTILIDAD_BRUTA']:,.2f}")
             with col4:
-                margen = (periodo_data['UTILIDAD_BRUTA'].sum() / periodo_data['TOTAL_COBRADO'].sum() * 100) if periodo_data['TOTAL_COBRADO'].sum() > 0 else 0
-                st.metric(f"Margen {periodo_seleccionado}", 
+                margen = (totales_periodo['UTILIDAD_BRUTA'] / totales_periodo['TOTAL_COBRADO'] * 100) if totales_periodo['TOTAL_COBRADO'] > 0 else 0
+                st.metric(f"Margen {etiqueta_periodo}", 
                          f"{margen:.2f}%")
     
-    # Tabla detallada
-    display_detalle = datos_filtrados[[
-        'FECHA', 'FACTURA', 'CLIENTE', 'PROYECTO_OK',
-        'HORAS_VIAJE', 'COSTO_UNITARIO', 'TOTAL_COBRADO',
-        'PAGO_BROKER', 'UTILIDAD_BRUTA', 'MARGEN_BRUTO', 'BROKER'
-    ]].copy()
-    
-    # Formatear valores
-    display_detalle['COSTO_UNITARIO'] = display_detalle['COSTO_UNITARIO'].map('${:,.2f}'.format)
-    display_detalle['TOTAL_COBRADO'] = display_detalle['TOTAL_COBRADO'].map('${:,.2f}'.format)
-    display_detalle['PAGO_BROKER'] = display_detalle['PAGO_BROKER'].map('${:,.2f}'.format)
-    display_detalle['UTILIDAD_BRUTA'] = display_detalle['UTILIDAD_BRUTA'].map('${:,.2f}'.format)
-    display_detalle['MARGEN_BRUTO'] = display_detalle['MARGEN_BRUTO'].map('{:.2f}%'.format)
-    
-    st.dataframe(display_detalle.sort_values('FECHA', ascending=False), 
-                 height=500, 
-                 use_container_width=True,
-                 column_config={
-                     "FECHA": "Fecha",
-                     "FACTURA": "Factura",
-                     "CLIENTE": "Cliente",
-                     "PROYECTO_OK": "Proyecto",
-                     "HORAS_VIAJE": "Horas/Viaje",
-                     "COSTO_UNITARIO": "Costo Unitario",
-                     "TOTAL_COBRADO": "Total Cobrado",
-                     "PAGO_BROKER": "Pago Broker",
-                     "UTILIDAD_BRUTA": "Utilidad Bruta",
-                     "MARGEN_BRUTO": "Margen %",
-                     "BROKER": "Broker"
-                 })
+    # Tabla detallada paginada: se ordena en el servidor (por FECHA descendente)
+    # y se envía solo la página visible
+    with traza.span('detalle_conteo'):
+        total_filas = fuente.detail_count(*filtros_detalle)
+    
+    col_pagina, col_tamano = st.columns([3, 1])
+    with col_tamano:
+        tamano_pagina = st.selectbox("Filas por página", DETALLE_PAGE_SIZES, index=1, key="detalle_tamano")
+    num_paginas = max(1, -(-total_filas // tamano_pagina))
+    with col_pagina:
+        pagina = st.number_input(f"Página (de {num_paginas})", min_value=1, max_value=num_paginas,
+                                 value=1, step=1, key="detalle_pagina")
+    pagina = min(int(pagina), num_paginas) - 1
+    primera_fila = pagina * tamano_pagina
+    st.caption(f"Mostrando filas {min(primera_fila + 1, total_filas):,} - "
+               f"{min(primera_fila + tamano_pagina, total_filas):,} de {total_filas:,}")
+    
+    with traza.span('detalle_pagina'):
+        pagina_detalle = fuente.detail_page(*filtros_detalle, pagina=pagina, tamano_pagina=tamano_pagina)
+    with traza.span('tabla_detalle'):
+        st.dataframe(pagina_detalle, 
+                     height=500, 
+                     use_container_width=True,
+                     hide_index=True,
+                     column_config={
+                         "FECHA": st.column_config.DateColumn("Fecha", format="DD/MM/YYYY"),
+                         "FACTURA": "Factura",
+                         "CLIENTE": "Cliente",
+                         "PROYECTO_OK": "Proyecto",
+                         "HORAS_VIAJE": "Horas/Viaje",
+                         "COSTO_UNITARIO": st.column_config.NumberColumn("Costo Unitario", format="dollar"),
+                         "TOTAL_COBRADO": st.column_config.NumberColumn("Total Cobrado", format="dollar"),
+                         "PAGO_BROKER": st.column_config.NumberColumn("Pago Broker", format="dollar"),
+                         "UTILIDAD_BRUTA": st.column_config.NumberColumn("Utilidad Bruta", format="dollar"),
+                         "MARGEN_BRUTO": st.column_config.NumberColumn("Margen %", format="%.2f%%"),
+                         "BROKER": "Broker"
+                     })
     
-    # Opción para descargar datos filtrados
-    csv = datos_filtrados.to_csv(index=False).encode('utf-8')
-    st.download_button(
-        label="📥 Descargar datos filtrados como CSV",
-        data=csv,
-        file_name=f"facturas_filtradas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-        mime="text/csv",
+    # Opción para descargar datos filtrados: el archivo se genera solo cuando se pulsa el
+    # botón (no en cada rerun). Streamlit guarda los bytes completos en memoria, por eso la
+    # descarga se limita a EXPORT_MAX_ROWS filas
+    formato_exportacion = st.radio("Formato de descarga", list(EXPORT_FORMATS), horizontal=True,
+                                   key="detalle_formato")
+    extension, mime = EXPORT_FORMATS[formato_exportacion]
+    if total_filas > EXPORT_MAX_ROWS:
+        st.warning(f"La descarga está limitada a {EXPORT_MAX_ROWS:,} filas y la selección tiene "
+                   f"{total_filas:,}: aplica más filtros o un rango de fechas.")
+    else:
+        st.download_button(
+            label=f"📥 Descargar datos filtrados como {formato_exportacion}",
+            data=metricas.timed(f'exportar:{formato_exportacion}',
+                                lambda: read_export(fuente.export(*filtros_detalle, columns=DETALLE_COLS,
+                                                                  formato=formato_exportacion))),
+            file_name=f"facturas_filtradas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+            mime=mime,
+        )
+
+# Solo se ejecuta la vista activa: resúmenes, figuras y tablas de las demás no se calculan
+VISTAS = {
+    "📊 Resumen General": render_resumen_general,
+    "🎯 Clientes": render_clientes,
+    "🏗️ Proyectos": render_proyectos,
+    "📅 Períodos": render_periodos,
+    "💼 Brokers": render_brokers,
+    "📄 Detalle": render_detalle,
+}
+vista_seleccionada = st.radio("Vista", list(VISTAS), horizontal=True, key="vista", label_visibility="collapsed")
+with traza.span(f'vista:{vista_seleccionada}'):
+    VISTAS[vista_seleccionada]()
+
+# Tamaño de las figuras enviadas al navegador
+if tamanos_figuras:
+    with st.sidebar.expander("📦 Tamaño de las figuras"):
+        st.caption(" · ".join(f"{nombre}: {tamano / 1024:,.1f} KB" for nombre, tamano in tamanos_figuras.items()))
+        st.caption(f"Total: {sum(tamanos_figuras.values()) / 1024:,.1f} KB")
+
+# Versión de los datos en pantalla y aviso cuando el hilo de refresco publica una nueva
+st.sidebar.markdown("---")
+st.sidebar.caption(
+    f"🗂️ Datos versión {carga_datos['numero']} ({version_datos[:8]}) · "
+    f"cargados {carga_datos['cargado']:%d/%m/%Y %H:%M:%S}"
+)
+
+@st.fragment(run_every=REFRESH_SECONDS if refresco.running else None)
+def aviso_version():
+    if estado.version != version_datos:
+        st.info("Hay una versión nueva de los datos.")
+        if st.button("Cargar versión nueva"):
+            st.rerun()
+    elif refresco.refreshing:
+        st.caption("🔄 Cargando una versión nueva de los datos…")
+    if refresco.error:
+        st.warning(f"No se pudo cargar la versión nueva: {refresco.error}")
+    # Con DASHBOARD_VERIFY_INCREMENTAL=1, tablas en que la fusión incremental difirió del
+    # recálculo completo (la versión publicada usa el recálculo)
+    diferencias = [name for name, _ in getattr(estado, 'last_update', {}).get('diferencias', [])]
+    if diferencias:
+        st.warning(f"La actualización incremental difirió del recálculo completo en: {', '.join(diferencias)}")
+
+with st.sidebar:
+    aviso_version()
+
+# Contadores del caché de vistas
+with st.sidebar.expander("⚙️ Caché de vistas"):
+    estadisticas_cache = cache_vistas.stats()
+    st.caption(
+        f"Hits: {estadisticas_cache['hits']} · Misses: {estadisticas_cache['misses']} · "
+        f"Tasa: {estadisticas_cache['tasa_hits']:.0%} · "
+        f"Entradas: {estadisticas_cache['entradas']}/{estadisticas_cache['max_entradas']} · "
+        f"Expulsiones: {estadisticas_cache['expulsiones']} · Expiraciones: {estadisticas_cache['expiraciones']}"
     )
+    # Caché en disco compartido entre workers (solo con el motor en memoria)
+    if getattr(estado, 'shared', None) is not None:
+        compartido = estado.shared.stats()
+        st.caption(
+            f"Compartido: {compartido['entradas']}/{compartido['max_entradas']} versiones · "
+            f"{compartido['bytes'] / 2 ** 20:,.1f} MB · Hits: {compartido['hits']} · "
+            f"Misses: {compartido['misses']} · Expulsiones: {compartido['expulsiones']}"
+        )
+
+# Filas y memoria de la versión cargada (una vez por versión) y cachés, para el panel
+# y el archivo de métricas
+def data_footprint():
+    if QUERY_BACKEND == 'duckdb':
+        return {'filas': fuente.detail_count(), 'bytes': None}
+    return frame_memory(df)
+
+huella_datos = cache_vistas.get_or_build(('huella', version_datos), data_footprint)
+estadisticas_cache = cache_vistas.stats()
+metricas.gauge('datos_filas', huella_datos['filas'])
+metricas.gauge('datos_memoria_bytes', huella_datos['bytes'])
+metricas.gauge('rss_max_bytes', max_rss_bytes())
+if 'arranque_segundos' not in metricas.gauges:
+    # Primer rerun del proceso: desde que arrancó hasta esta página (incluye la espera del
+    # primer request) y lo que tardó el propio rerun con la carga de datos
+    metricas.gauge('arranque_segundos', process_uptime())
+    metricas.gauge('primer_rerun_segundos', traza.seconds)
+metricas.gauge('cache_vistas_hits', estadisticas_cache['hits'])
+metricas.gauge('cache_vistas_misses', estadisticas_cache['misses'])
+metricas.gauge('cache_vistas_entradas', estadisticas_cache['entradas'])
+if getattr(estado, 'shared', None) is not None:
+    metricas.gauge('cache_compartido_hits', compartido['hits'])
+    metricas.gauge('cache_compartido_misses', compartido['misses'])
+
+# Panel de diagnóstico: spans del rerun, contadores, datos y etapas acumuladas del proceso
+if diagnostico:
+    with st.sidebar.expander("🩺 Diagnóstico", expanded=True):
+        st.caption(f"Rerun hasta aquí: {traza.seconds * 1000:,.1f} ms")
+        st.dataframe(
+            pd.DataFrame(
+                [{'Etapa': '\u2003' * nivel + etapa, 'ms': segundos * 1000} for etapa, nivel, segundos in traza.spans],
+                columns=['Etapa', 'ms'],
+            ),
+            hide_index=True, use_container_width=True,
+            column_config={'ms': st.column_config.NumberColumn(format="%.1f")},
+        )
+        contadores = traza.counters
+        st.caption(
+            f"Vistas: {contadores.get('vistas_pedidas', 0)} pedidas · "
+            f"{contadores.get('vistas_construidas', 0)} construidas"
+        )
+        memoria = f"{huella_datos['bytes'] / 2 ** 20:,.1f} MB" if huella_datos['bytes'] is not None else "en DuckDB"
+        rss = max_rss_bytes()
+        st.caption(
+            f"Datos: {huella_datos['filas']:,} filas · {memoria}"
+            + (f" · RSS máx. del proceso: {rss / 2 ** 20:,.0f} MB" if rss is not None else "")
+        )
+        etapas, _, medidas = metricas.snapshot()
+        if medidas.get('arranque_segundos') is not None:
+            st.caption(
+                f"Arranque del proceso hasta la primera página: {medidas['arranque_segundos']:,.1f} s "
+                f"(primer rerun {medidas['primer_rerun_segundos']:,.2f} s)"
+            )
+        st.caption("Acumulado del proceso")
+        st.dataframe(
+            pd.DataFrame(
+                [{'Etapa': etapa, 'Veces': veces, 'Media ms': total / veces * 1000, 'Máx ms': maximo * 1000}
+                 for etapa, (veces, total, maximo) in sorted(etapas.items())],
+                columns=['Etapa', 'Veces', 'Media ms', 'Máx ms'],
+            ),
+            hide_index=True, use_container_width=True,
+            column_config={'Media ms': st.column_config.NumberColumn(format="%.1f"),
+                           'Máx ms': st.column_config.NumberColumn(format="%.1f")},
+        )
+        if perfil is not None:
+            st.caption("Perfil del rerun (cProfile)")
+            st.code(perfil.report(), language=None)
+            st.download_button("Descargar perfil (.prof)", data=perfil.dump(),
+                               file_name=f"rerun_{datetime.now():%Y%m%d_%H%M%S}.prof",
+                               mime="application/octet-stream")
+        else:
+            st.caption("Agrega ?perfil=1 a la URL para perfilar un rerun con cProfile.")
 
 # Footer
 st.markdown("---")
-st.markdown("**Dashboard de Facturas** | Generado con Streamlit | Datos actualizados")
\ No newline at end of file
+st.markdown(
+    f"**Dashboard de Facturas** | Generado con Streamlit | "
+    f"Datos versión {carga_datos['numero']} · cargados {carga_datos['cargado']:%d/%m/%Y %H:%M:%S}"
+)
+
+# Cierre del rerun: total, línea de log estructurada y archivo de métricas
+traza.finish(vista=vista_seleccionada, version=version_datos)
\ No newline at end of file
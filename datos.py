@@ -0,0 +1,501 @@
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Archivo y hoja de origen
+DATA_FILE = 'Copia de Facturas generales_compartir.xlsx'
+
+# Origen de los datos: un archivo, un directorio o un patrón glob de libros
+DATA_SOURCE = os.environ.get('DASHBOARD_DATA', DATA_FILE)
+SHEET_NAME = 'Facturas Generales'
+
+# Directorio para los snapshots columnares (se puede cambiar con una variable de entorno)
+CACHE_DIR = os.environ.get('DASHBOARD_CACHE_DIR', '.cache_facturas')
+
+# Versión del formato del snapshot: subirla cuando cambie la limpieza de datos
+SNAPSHOT_VERSION = 3
+
+# Renombrar columnas para mayor claridad
+COLUMN_MAPPING = {
+    'Fecha': 'FECHA',
+    'Factura': 'FACTURA',
+    'Truck': 'CAMION_ID',
+    'Broker': 'BROKER',
+    'Camion': 'CAMION_NUM',
+    'Ticket': 'TICKET',
+    'Clientes': 'CLIENTE',
+    'Proyecto': 'PROYECTO',
+    'Proyecto OK': 'PROYECTO_OK',
+    'Horas o Viaje': 'HORAS_VIAJE',
+    'Costo unitario': 'COSTO_UNITARIO',
+    'Total Cobrado': 'TOTAL_COBRADO',
+    'Pago a Broker': 'PAGO_BROKER',
+    'Unamed': 'ACUMULADO'  # Parece ser un acumulado
+}
+
+NUMERIC_COLS = ['FACTURA', 'HORAS_VIAJE', 'COSTO_UNITARIO', 'TOTAL_COBRADO', 'PAGO_BROKER', 'ACUMULADO']
+
+# Identificadores que el libro mezcla como números y texto (camión, job, ticket de
+# volcadero): se guardan como texto, con 123 y 123.0 como '123'
+TEXT_COLS = ['CAMION_NUM', 'Job Ok', 'TicketVolcadero']
+
+# Dimensiones que siempre se guardan como categóricas (codificación por diccionario)
+DIMENSION_COLS = ['CLIENTE', 'BROKER', 'PROYECTO_OK', 'CAMION_ID', 'TICKET']
+
+# Medidas que se suman: se quedan en float64 para no cambiar los totales
+MEASURE_COLS = ['TOTAL_COBRADO', 'PAGO_BROKER', 'UTILIDAD_BRUTA']
+
+# Otras columnas de texto se vuelven categóricas si tienen pocos valores distintos
+CATEGORY_MAX_RATIO = 0.5
+
+
+def read_workbook(file_path=DATA_FILE, sheet_name=SHEET_NAME):
+    # Leer la hoja del archivo Excel (parseo XML con openpyxl, la parte lenta)
+    return pd.read_excel(file_path, sheet_name=sheet_name)
+
+
+def _id_text(value):
+    # Texto de un identificador; un número entero leído como float no lleva '.0'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def clean_invoices(df):
+    # Limpiar nombres de columnas
+    df.columns = [col.strip() if isinstance(col, str) else col for col in df.columns]
+
+    # Aplicar renombrado
+    df = df.rename(columns=COLUMN_MAPPING)
+
+    # Convertir tipos de datos
+    df['FECHA'] = pd.to_datetime(df['FECHA'], errors='coerce')
+
+    # Convertir columnas numéricas
+    for col in NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Convertir identificadores a texto
+    for col in TEXT_COLS:
+        if col in df.columns:
+            df[col] = df[col].map(_id_text, na_action='ignore')
+
+    # Crear columna de periodo (mes-año)
+    df['PERIODO'] = df['FECHA'].dt.strftime('%Y-%m')
+
+    # Calcular utilidad bruta
+    df['UTILIDAD_BRUTA'] = df['TOTAL_COBRADO'] - df['PAGO_BROKER']
+
+    # Calcular margen bruto (evitar división por cero)
+    df['MARGEN_BRUTO'] = np.where(
+        df['TOTAL_COBRADO'] > 0,
+        (df['UTILIDAD_BRUTA'] / df['TOTAL_COBRADO']) * 100,
+        0
+    )
+
+    return df
+
+
+def _downcast_numeric(series):
+    # Solo cambios sin pérdida: flotantes con valores enteros pasan al entero más chico
+    if series.name in MEASURE_COLS or not pd.api.types.is_float_dtype(series):
+        return series
+    values = series.dropna()
+    if values.empty or not (values == np.floor(values)).all():
+        return series
+    lo, hi = values.min(), values.max()
+    for bits in (8, 16, 32, 64):
+        info = np.iinfo(f'int{bits}')
+        if info.min <= lo and hi <= info.max:
+            dtype = f'int{bits}' if len(values) == len(series) else f'Int{bits}'
+            return series.astype(dtype)
+    return series
+
+
+def _numeric_category(series):
+    # Categórica con categorías numpy: las categorías nunca son nulas y un entero con
+    # nulos (Int16) volvería del snapshot como int16
+    series = series.astype('category')
+    categories = series.cat.categories
+    if hasattr(categories.dtype, 'numpy_dtype'):
+        series = series.cat.rename_categories(categories.to_numpy(categories.dtype.numpy_dtype))
+    return series
+
+
+def compact_invoices(df):
+    # Representación compacta en memoria: categóricas para dimensiones y texto repetido,
+    # PERIODO como categórica ordenada (código entero por mes) y enteros reducidos
+    df = df.copy()
+    for col in df.columns:
+        series = df[col]
+        if col == 'PERIODO':
+            periodos = sorted(series.dropna().unique())
+            df[col] = pd.Categorical(series, categories=periodos, ordered=True)
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            if col in DIMENSION_COLS:
+                df[col] = _numeric_category(_downcast_numeric(series))
+            else:
+                df[col] = _downcast_numeric(series)
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if col in DIMENSION_COLS or series.nunique() <= CATEGORY_MAX_RATIO * len(series):
+                df[col] = series.astype('category')
+    return df
+
+
+def memory_report(before, after):
+    # Bytes por columna antes y después de compactar
+    antes = before.memory_usage(deep=True, index=False)
+    despues = after.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'COLUMNA': antes.index,
+        'DTYPE_ANTES': [str(before[col].dtype) for col in antes.index],
+        'DTYPE_DESPUES': [str(after[col].dtype) if col in after.columns else '' for col in antes.index],
+        'BYTES_ANTES': antes.values,
+        'BYTES_DESPUES': despues.reindex(antes.index).fillna(0).astype('int64').values,
+    })
+    total = pd.DataFrame([{
+        'COLUMNA': 'TOTAL',
+        'DTYPE_ANTES': '',
+        'DTYPE_DESPUES': '',
+        'BYTES_ANTES': report['BYTES_ANTES'].sum(),
+        'BYTES_DESPUES': report['BYTES_DESPUES'].sum(),
+    }])
+    report = pd.concat([report, total], ignore_index=True)
+    report['AHORRO_PORCENTAJE'] = np.where(
+        report['BYTES_ANTES'] > 0,
+        (1 - report['BYTES_DESPUES'] / report['BYTES_ANTES']) * 100,
+        0
+    )
+    return report
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    # Hash del contenido del archivo, leído por bloques
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_key(file_path, content_hash=None):
+    # Llave del archivo de origen: ruta, tamaño, fecha de modificación y hash del contenido
+    stat = os.stat(file_path)
+    return {
+        'path': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': content_hash if content_hash is not None else file_hash(file_path),
+        'version': SNAPSHOT_VERSION,
+    }
+
+
+def _snapshot_paths(file_path, cache_dir):
+    # Un snapshot por ruta absoluta del archivo de origen
+    name = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(cache_dir, name)
+    return base + '.feather', base + '.json'
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _check_snapshot(file_path, manifest):
+    # Devuelve (vigente, llave nueva o None si el manifiesto no cambia).
+    # Primero se compara tamaño y mtime (barato); si solo cambió la fecha, decide el hash
+    if manifest is None or manifest.get('version') != SNAPSHOT_VERSION:
+        return False, None
+    if manifest.get('path') != os.path.abspath(file_path):
+        return False, None
+    stat = os.stat(file_path)
+    if stat.st_size != manifest.get('size'):
+        return False, None
+    if stat.st_mtime_ns == manifest.get('mtime_ns'):
+        return True, None
+    # Mismo tamaño y distinta fecha (por ejemplo, el archivo se copió de nuevo)
+    current = source_key(file_path)
+    return current['sha256'] == manifest.get('sha256'), current
+
+
+def _to_arrow_safe(df):
+    # Copia para escribir en Arrow: las columnas object con tipos mezclados (números y
+    # texto) no se pueden escribir y pasan a texto conservando los nulos
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed'):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def write_snapshot(df, snapshot_path):
+    # Feather sin compresión: se lee con memory-map y sin descomprimir
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    table = pa.Table.from_pandas(_to_arrow_safe(df), preserve_index=False)
+    tmp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    # Ida y vuelta: si el snapshot no devuelve el mismo DataFrame (p. ej. una columna
+    # nueva con números y texto, que Arrow solo guarda como texto) no se publica
+    leido = read_snapshot(tmp_path)
+    if not (leido.equals(df) and leido.dtypes.equals(df.dtypes)):
+        os.remove(tmp_path)
+        distintas = [col for col in df.columns if col not in leido.columns
+                     or leido[col].dtype != df[col].dtype or not leido[col].equals(df[col])]
+        raise ValueError(f'El snapshot no conserva las columnas {distintas}')
+    os.replace(tmp_path, snapshot_path)
+
+
+def read_snapshot(snapshot_path):
+    import pyarrow.feather as feather
+
+    # El memory-map evita copiar el archivo a un buffer Arrow antes de convertirlo, pero
+    # to_pandas() sí copia los datos al DataFrame (split_blocks/self_destruct no bajan
+    # el tiempo ni el pico de memoria: casi todas las columnas son categóricas)
+    table = feather.read_table(snapshot_path, memory_map=True)
+    return table.to_pandas()
+
+
+def fresh_snapshot(file_path, cache_dir=CACHE_DIR):
+    # Ruta del snapshot si sigue vigente para el archivo; None si hay que reconstruirlo
+    snapshot_path, manifest_path = _snapshot_paths(file_path, cache_dir)
+    fresh, key = _check_snapshot(file_path, _read_manifest(manifest_path))
+    if not fresh or not os.path.exists(snapshot_path):
+        return None
+    if key is not None:
+        _write_json_atomic(manifest_path, key)
+    return snapshot_path
+
+
+def cached_invoices(file_path, cache_dir=CACHE_DIR):
+    # Datos del snapshot si sigue vigente para el archivo; None si hay que reconstruirlo
+    snapshot_path = fresh_snapshot(file_path, cache_dir)
+    if snapshot_path is None:
+        return None
+    try:
+        return read_snapshot(snapshot_path)
+    except Exception:
+        return None
+
+
+def rebuild_invoices(file_path, cache_dir=CACHE_DIR):
+    # Parsear el Excel y reconstruir el snapshot. Devuelve (df, snapshot escrito).
+    # La llave se toma antes de leer para que un cambio durante la lectura se detecte
+    snapshot_path, manifest_path = _snapshot_paths(file_path, cache_dir)
+    key = source_key(file_path)
+    df = compact_invoices(clean_invoices(read_workbook(file_path)))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_snapshot(df, snapshot_path)
+        _write_json_atomic(manifest_path, key)
+    except (ImportError, OSError, ValueError):
+        # Sin pyarrow, sin permisos de escritura o si el snapshot no conserva los datos
+        # se sigue sin snapshot
+        return df, False
+    return df, True
+
+
+def resolve_sources(source=DATA_FILE):
+    # Un archivo, un directorio (todos sus .xlsx) o un patrón glob; ordenados por nombre.
+    # Se ignoran los archivos de bloqueo de Excel (~$...)
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, '*.xlsx'))
+    elif glob.has_magic(source):
+        paths = glob.glob(source)
+    else:
+        paths = [source]
+    return sorted(p for p in paths if not os.path.basename(p).startswith('~$'))
+
+
+def _rebuild_in_worker(file_path, cache_dir):
+    # Se ejecuta en el pool: el DataFrame solo regresa por pickle si no se pudo escribir el snapshot
+    df, written = rebuild_invoices(file_path, cache_dir)
+    return None if written else df
+
+
+def _rebuild_stale(stale, cache_dir, max_workers=None):
+    # Pares (libro, resultado de _rebuild_in_worker). Con varios workers se usa un pool con
+    # spawn: un fork desde un proceso con hilos (Streamlit, el hilo de refresco) copia locks
+    # tomados y el hijo puede quedarse bloqueado. Spawn vuelve a importar __main__ en cada
+    # worker, así que solo sirve desde scripts con guarda `if __name__ == '__main__'`;
+    # el dashboard pasa max_workers=1 y parsea en serie
+    workers = min(len(stale), max_workers or os.cpu_count() or 1)
+    if workers <= 1:
+        return [(path, _rebuild_in_worker(path, cache_dir)) for path in stale]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(zip(stale, pool.map(_rebuild_in_worker, stale, [cache_dir] * len(stale))))
+
+
+def concat_invoices(frames):
+    # Une los DataFrames de cada archivo conservando las categóricas (categorías unidas)
+    frames = [f for f in frames if f is not None]
+    if len(frames) == 1:
+        return frames[0]
+    categorical_cols = {
+        col for f in frames for col in f.columns if isinstance(f[col].dtype, pd.CategoricalDtype)
+    }
+    aligned = [f.copy(deep=False) for f in frames]
+    for col in categorical_cols:
+        categories = set()
+        for f in aligned:
+            if col in f.columns:
+                values = f[col].cat.categories if isinstance(f[col].dtype, pd.CategoricalDtype) else f[col].dropna().unique()
+                categories.update(values)
+        dtype = pd.CategoricalDtype(sorted(categories, key=str), ordered=(col == 'PERIODO'))
+        for f in aligned:
+            if col in f.columns:
+                f[col] = f[col].astype(dtype)
+    return pd.concat(aligned, ignore_index=True)
+
+
+def load_workbooks(source=DATA_FILE, cache_dir=CACHE_DIR, max_workers=None):
+    # Carga uno o varios libros: los que no cambiaron salen de su snapshot y los nuevos
+    # o modificados se parsean en paralelo en un pool de procesos (en serie con
+    # max_workers=1). Se agrega ARCHIVO con el nombre del libro de origen de cada fila
+    paths = resolve_sources(source)
+    if not paths:
+        raise FileNotFoundError(f'No se encontraron libros de Excel en {source!r}')
+
+    frames = {path: cached_invoices(path, cache_dir) for path in paths}
+    stale = [path for path, df in frames.items() if df is None]
+    if len(stale) == 1:
+        frames[stale[0]], _ = rebuild_invoices(stale[0], cache_dir)
+    elif stale:
+        for path, df in _rebuild_stale(stale, cache_dir, max_workers):
+            frames[path] = df if df is not None else cached_invoices(path, cache_dir)
+
+    nombres = [os.path.basename(path) for path in paths]
+    for path, nombre in zip(paths, nombres):
+        frames[path] = frames[path].assign(
+            ARCHIVO=pd.Categorical([nombre] * len(frames[path]), categories=sorted(nombres))
+        )
+    return concat_invoices([frames[path] for path in paths])
+
+
+def snapshot_tables(source=DATA_FILE, cache_dir=CACHE_DIR, max_workers=None):
+    # Tablas Arrow (memory-map, sin pasar por pandas) de cada libro, para cargarlas en
+    # otro motor. Los snapshots vencidos se reconstruyen primero (pool de procesos o en serie).
+    # Devuelve pares (nombre del libro, tabla)
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    paths = resolve_sources(source)
+    if not paths:
+        raise FileNotFoundError(f'No se encontraron libros de Excel en {source!r}')
+    stale = [path for path in paths if fresh_snapshot(path, cache_dir) is None]
+    unwritten = {}
+    for path, df in _rebuild_stale(stale, cache_dir, max_workers):
+        if df is not None:
+            unwritten[path] = df
+    for path in paths:
+        if path in unwritten:
+            table = pa.Table.from_pandas(_to_arrow_safe(unwritten.pop(path)), preserve_index=False)
+        else:
+            table = feather.read_table(_snapshot_paths(path, cache_dir)[0], memory_map=True)
+        yield os.path.basename(path), table
+
+
+def _same_column(old, new):
+    # Mismos valores en el mismo orden, sin importar la codificación: las categóricas se
+    # comparan por códigos tras llevar las viejas a las categorías nuevas y los números
+    # como float64 (un downcast distinto no cuenta como cambio); vectorizado, sin hashes
+    old_cat = isinstance(old.dtype, pd.CategoricalDtype)
+    new_cat = isinstance(new.dtype, pd.CategoricalDtype)
+    if old_cat and new_cat:
+        old_codes = old.cat.codes.to_numpy()
+        recoded = pd.Categorical(old, categories=new.cat.categories).codes
+        # Un valor viejo que ya no está en las categorías nuevas queda en -1 (cambió)
+        if (recoded[old_codes != -1] == -1).any():
+            return False
+        return np.array_equal(recoded, new.cat.codes.to_numpy())
+    if old_cat or new_cat:
+        old, new = old.astype(object), new.astype(object)
+    numeric = [pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col) for col in (old, new)]
+    if all(numeric):
+        return np.array_equal(old.to_numpy('float64', na_value=np.nan), new.to_numpy('float64', na_value=np.nan),
+                              equal_nan=True)
+    return old.reset_index(drop=True).equals(new.reset_index(drop=True))
+
+
+def find_appended_rows(old_df, new_df, columns=None):
+    # Si new_df es old_df con filas agregadas al final (las filas viejas con los mismos
+    # valores en columns, en el mismo orden), devuelve la posición donde empiezan las
+    # nuevas; si no (incluso si solo cambió un monto de una fila vieja), None.
+    # Sin columns se comparan todas las columnas de datos (ARCHIVO solo dice de qué libro viene)
+    if columns is None:
+        columns = [col for col in old_df.columns if col != 'ARCHIVO']
+    if len(new_df) < len(old_df) or any(col not in old_df.columns or col not in new_df.columns for col in columns):
+        return None
+    prefix = new_df.iloc[:len(old_df)]
+    if not all(_same_column(old_df[col], prefix[col]) for col in columns):
+        return None
+    return len(old_df)
+
+
+def data_version(source=DATA_FILE, cache_dir=CACHE_DIR):
+    # Versión de los datos: hash de las llaves (ruta y hash de contenido) de todos los libros.
+    # Usa el manifiesto del snapshot cuando está vigente para no volver a leer los archivos
+    digest = hashlib.sha256()
+    for path in resolve_sources(source):
+        _, manifest_path = _snapshot_paths(path, cache_dir)
+        manifest = _read_manifest(manifest_path)
+        fresh, key = _check_snapshot(path, manifest)
+        if fresh:
+            content_hash = (key or manifest)['sha256']
+        else:
+            content_hash = file_hash(path)
+        digest.update(f'{os.path.abspath(path)}:{content_hash}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def source_signature(source=DATA_FILE):
+    # Firma barata de los libros (ruta, tamaño y fecha de modificación, sin leerlos)
+    # para detectar cambios; un archivo que desaparece también cambia la firma
+    signature = []
+    for path in resolve_sources(source):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append((os.path.abspath(path), None, None))
+            continue
+        signature.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Carga de facturas y reporte de memoria')
+    parser.add_argument('archivo', nargs='?', default=DATA_SOURCE, help='Archivo, directorio o patrón glob')
+    parser.add_argument('--memoria', action='store_true', help='Mostrar bytes por columna antes y después de compactar')
+    args = parser.parse_args()
+
+    if args.memoria:
+        original = pd.concat([clean_invoices(read_workbook(p)) for p in resolve_sources(args.archivo)],
+                             ignore_index=True)
+        with pd.option_context('display.width', 200, 'display.max_rows', None):
+            print(memory_report(original, compact_invoices(original)).to_string(index=False))
+    else:
+        df = load_workbooks(args.archivo)
+        print(f'{len(resolve_sources(args.archivo))} libros, {len(df)} filas, {df.memory_usage(deep=True).sum():,} bytes')
@@ -0,0 +1,248 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Panel de diagnóstico en la barra lateral para todas las sesiones
+DIAGNOSTICS = os.environ.get('DASHBOARD_DIAGNOSTICS') == '1'
+
+# Con un token, solo las sesiones con ?diagnostico=<token> ven el panel; el parámetro
+# sin token configurado no hace nada (un deploy público no expone internos ni perfiles)
+DIAGNOSTICS_TOKEN = os.environ.get('DASHBOARD_DIAGNOSTICS_TOKEN') or None
+
+# Una línea JSON por rerun en el logger 'dashboard.metricas' (stderr si no hay handler)
+METRICS_LOG = os.environ.get('DASHBOARD_METRICS_LOG') == '1'
+
+# Archivo de métricas en formato de texto de Prometheus para un scraper local
+METRICS_FILE = os.environ.get('DASHBOARD_METRICS_FILE')
+
+# Segundos mínimos entre escrituras del archivo de métricas
+METRICS_WRITE_SECONDS = 5
+
+# Funciones del perfil (cProfile) que se muestran en el panel
+PROFILE_TOP = 25
+
+logger = logging.getLogger('dashboard.metricas')
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def diagnostics_enabled(query_token=None):
+    # Panel activo por entorno o por token en la URL (comparación de tiempo constante)
+    if DIAGNOSTICS:
+        return True
+    if DIAGNOSTICS_TOKEN is None or not query_token:
+        return False
+    import hmac
+
+    return hmac.compare_digest(query_token.encode('utf-8'), DIAGNOSTICS_TOKEN.encode('utf-8'))
+
+
+def max_rss_bytes():
+    # Memoria residente máxima del proceso (solo Unix; en Linux ru_maxrss está en KB)
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def process_uptime():
+    # Segundos desde que arrancó el proceso (solo Linux: /proc; None en otros sistemas)
+    try:
+        with open('/proc/self/stat') as f:
+            # starttime es el campo 22; el nombre del comando (campo 2) puede tener espacios
+            inicio = int(f.read().rsplit(')', 1)[1].split()[19]) / os.sysconf('SC_CLK_TCK')
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0]) - inicio
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def frame_memory(df):
+    # Filas y bytes de un DataFrame (deep: incluye categorías y texto)
+    return {'filas': len(df), 'bytes': int(df.memory_usage(index=True, deep=True).sum())}
+
+
+class Metrics:
+    # Métricas acumuladas del proceso (todas las sesiones y el hilo de refresco):
+    # por etapa, número de veces, segundos totales y máximo; contadores y valores sueltos
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self._written = 0.0
+
+    def observe(self, etapa, seconds):
+        with self._lock:
+            count, total, maximum = self.stages.get(etapa, (0, 0.0, 0.0))
+            self.stages[etapa] = (count + 1, total + seconds, max(maximum, seconds))
+
+    @contextlib.contextmanager
+    def span(self, etapa):
+        # Etapas fuera de un rerun (carga de datos, hilo de refresco, exportación)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(etapa, time.perf_counter() - start)
+
+    def timed(self, etapa, fn):
+        # fn envuelta en un span (para loaders y callbacks)
+        def wrapper(*args, **kwargs):
+            with self.span(etapa):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def count(self, nombre, value=1):
+        with self._lock:
+            self.counters[nombre] = self.counters.get(nombre, 0) + value
+
+    def gauge(self, nombre, value):
+        with self._lock:
+            self.gauges[nombre] = value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stages), dict(self.counters), dict(self.gauges)
+
+    def prometheus(self):
+        # Texto en el formato de exposición de Prometheus
+        stages, counters, gauges = self.snapshot()
+        lines = [
+            '# TYPE dashboard_etapa_segundos summary',
+        ]
+        for etapa, (count, total, _) in sorted(stages.items()):
+            lines.append(f'dashboard_etapa_segundos_count{{etapa="{etapa}"}} {count}')
+            lines.append(f'dashboard_etapa_segundos_sum{{etapa="{etapa}"}} {total:.6f}')
+        lines.append('# TYPE dashboard_etapa_segundos_max gauge')
+        for etapa, (_, _, maximum) in sorted(stages.items()):
+            lines.append(f'dashboard_etapa_segundos_max{{etapa="{etapa}"}} {maximum:.6f}')
+        for nombre, value in sorted(counters.items()):
+            lines.append(f'# TYPE dashboard_{nombre}_total counter')
+            lines.append(f'dashboard_{nombre}_total {value}')
+        for nombre, value in sorted(gauges.items()):
+            if value is not None:
+                lines.append(f'# TYPE dashboard_{nombre} gauge')
+                lines.append(f'dashboard_{nombre} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path=METRICS_FILE, force=False):
+        # Reemplazo atómico del archivo; a lo más una escritura cada METRICS_WRITE_SECONDS
+        if not path:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._written < METRICS_WRITE_SECONDS:
+                return False
+            self._written = now
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+        return True
+
+
+class RerunTrace:
+    # Spans con nombre de un rerun: se acumulan en orden (con su profundidad para
+    # mostrarlos anidados) y al terminar se agregan a las métricas del proceso
+
+    def __init__(self, metrics=None, profile=None):
+        self.metrics = metrics
+        self.profile = profile
+        self.spans = []
+        self.counters = {}
+        self._depth = 0
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, etapa):
+        entry = [etapa, self._depth, 0.0]
+        self.spans.append(entry)
+        # Con perfil, los spans de primer nivel lo encienden y lo apagan al salir
+        perfilado = self.profile.section() if self.profile is not None and self._depth == 0 \
+            else contextlib.nullcontext()
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            with perfilado:
+                yield
+        finally:
+            entry[2] = time.perf_counter() - start
+            self._depth -= 1
+            if self.metrics is not None:
+                self.metrics.observe(etapa, entry[2])
+
+    def count(self, nombre, value=1):
+        self.counters[nombre] = self.counters.get(nombre, 0) + value
+        if self.metrics is not None:
+            self.metrics.count(nombre, value)
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self._start
+
+    def finish(self, **extra):
+        # Cierra el rerun: métrica total, línea de log y archivo de métricas
+        seconds = self.seconds
+        if self.metrics is not None:
+            self.metrics.observe('rerun', seconds)
+            self.metrics.count('reruns')
+            if METRICS_FILE:
+                with contextlib.suppress(OSError):
+                    self.metrics.write()
+        if METRICS_LOG:
+            logger.info(json.dumps({
+                'evento': 'rerun',
+                'segundos': round(seconds, 6),
+                'etapas': [{'etapa': etapa, 'nivel': nivel, 'segundos': round(segundos, 6)}
+                           for etapa, nivel, segundos in self.spans],
+                'contadores': self.counters,
+                **extra,
+            }, default=str, ensure_ascii=False))
+        return seconds
+
+
+class RerunProfile:
+    # cProfile de las etapas de un rerun (se activa con ?perfil=1 junto al panel). Solo
+    # está encendido dentro de section(): si el rerun se interrumpe (cambio de un widget,
+    # st.stop) o falla, el finally lo apaga y el hilo del script no queda perfilado
+
+    def __init__(self):
+        import cProfile
+
+        self._profile = cProfile.Profile()
+
+    @contextlib.contextmanager
+    def section(self):
+        self._profile.enable()
+        try:
+            yield
+        finally:
+            self._profile.disable()
+
+    def report(self, top=PROFILE_TOP, sort='cumulative'):
+        import io
+        import pstats
+
+        output = io.StringIO()
+        pstats.Stats(self._profile, stream=output).strip_dirs().sort_stats(sort).print_stats(top)
+        return output.getvalue()
+
+    def dump(self):
+        # Bytes del .prof (se abre con pstats, snakeviz, etc.)
+        import marshal
+        import pstats
+
+        return marshal.dumps(pstats.Stats(self._profile).stats)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# Conteo de facturas distintas con estructuras que se pueden unir entre grupos:
+# - 'exacto': arreglo ordenado de ids de factura por celda del cubo (unión de conjuntos)
+# - 'hll': registros HyperLogLog por celda (unión = máximo elemento a elemento),
+#   tamaño fijo por celda sin importar cuántas facturas tenga
+DISTINCT_MODES = ('exacto', 'hll')
+
+# Precisión de HyperLogLog: 2**HLL_PRECISION registros (error típico ~1.04 / sqrt(registros))
+HLL_PRECISION = 10
+
+
+def invoice_ids(facturas):
+    # Ids enteros de factura: el número mismo si es entero; si no, un hash de 64 bits
+    values = pd.Series(facturas)
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.to_numpy(dtype='int64', na_value=-1)
+    numeric = pd.to_numeric(values, errors='coerce')
+    if numeric.notna().sum() == values.notna().sum() and (numeric.dropna() % 1 == 0).all():
+        return numeric.to_numpy(dtype='float64', na_value=-1).astype('int64')
+    hashed = (pd.util.hash_array(values.astype(str).to_numpy()) >> np.uint64(1)).astype('int64')
+    return np.where(values.isna().to_numpy(), -1, hashed)
+
+
+def _bit_length(values):
+    # Número de bits significativos de cada uint64 (búsqueda binaria vectorizada)
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = values >= (np.uint64(1) << np.uint64(shift))
+        values[mask] >>= np.uint64(shift)
+        length[mask] += shift
+    return length + (values > 0)
+
+
+def hll_registers(cells, ids, num_cells, precision=HLL_PRECISION):
+    # Registros HyperLogLog (num_cells x 2**precision) a partir de pares (celda, id)
+    m = 1 << precision
+    registers = np.zeros((num_cells, m), dtype=np.uint8)
+    if len(ids) == 0:
+        return registers
+    hashes = pd.util.hash_array(ids.astype('int64'))
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = (hashes << np.uint64(precision)) | (np.uint64(1) << np.uint64(precision - 1))
+    rho = (64 - _bit_length(rest) + 1).astype(np.uint8)
+    np.maximum.at(registers, (cells, index), rho)
+    return registers
+
+
+def hll_estimate(registers):
+    # Estimación de HyperLogLog con la corrección para cardinalidades pequeñas
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros > 0:
+        estimate = m * np.log(m / zeros)
+    return estimate
+
+
+def build_sketches(cells, ids, num_cells, mode='exacto'):
+    # Una estructura por celda. cells/ids son pares (celda, id de factura) ordenados por
+    # celda y luego por id, como salen del cubo con FACTURA como grano
+    valid = ids >= 0
+    cells, ids = cells[valid], ids[valid]
+    if mode == 'hll':
+        return list(hll_registers(cells, ids, num_cells))
+    bounds = np.searchsorted(cells, np.arange(num_cells + 1))
+    return [np.unique(ids[bounds[i]:bounds[i + 1]]) for i in range(num_cells)]
+
+
+def merge_sketches(sketches):
+    # Une las estructuras de varias celdas (exacto: unión de ids; hll: máximo de registros)
+    sketches = list(sketches)
+    if not sketches:
+        return np.empty(0, dtype=np.int64)
+    if sketches[0].dtype == np.uint8:
+        return np.maximum.reduce(sketches)
+    return np.unique(np.concatenate(sketches))
+
+
+def sketch_count(sketch):
+    # Número de facturas distintas de una estructura
+    if sketch.dtype == np.uint8:
+        return int(round(hll_estimate(sketch)))
+    return len(sketch)
+
+
+def distinct_count(sketches):
+    # Agregación para groupby: facturas distintas de la unión de las celdas del grupo
+    return sketch_count(merge_sketches(sketches))
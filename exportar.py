@@ -0,0 +1,90 @@
+import os
+import tempfile
+
+import numpy as np
+
+# Filas por bloque al exportar: acota la memoria extra a un bloque a la vez
+EXPORT_CHUNK_ROWS = 50_000
+
+# Filas máximas de una descarga desde el dashboard: Streamlit guarda los bytes del archivo
+# completo en memoria (media storage), así que el límite es lo que acota la memoria.
+# Las exportaciones más grandes se hacen fuera del dashboard (reportes.py)
+EXPORT_MAX_ROWS = int(os.environ.get('DASHBOARD_EXPORT_MAX_ROWS', '250000'))
+
+# Formatos de exportación: extensión y tipo MIME
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def _row_chunks(df, rows, chunk_size):
+    # Recorre las filas seleccionadas (o todas) por bloques, sin copiar la selección completa
+    if rows is None:
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+    else:
+        rows = np.asarray(rows)
+        for start in range(0, len(rows), chunk_size):
+            yield df.iloc[rows[start:start + chunk_size]]
+
+
+def iter_csv(df, rows=None, columns=None, chunk_size=EXPORT_CHUNK_ROWS):
+    # Bytes CSV por bloques: encabezado en el primero
+    header = True
+    for chunk in _row_chunks(df, rows, chunk_size):
+        if columns is not None:
+            chunk = chunk[columns]
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+    if header:
+        # Selección vacía: solo el encabezado
+        empty = df.iloc[:0] if columns is None else df.iloc[:0][columns]
+        yield empty.to_csv(index=False).encode('utf-8')
+
+
+def write_csv(target, df, rows=None, columns=None, chunk_size=EXPORT_CHUNK_ROWS):
+    for data in iter_csv(df, rows, columns, chunk_size):
+        target.write(data)
+
+
+def write_parquet(target, df, rows=None, columns=None, chunk_size=EXPORT_CHUNK_ROWS):
+    # Un row group por bloque con ParquetWriter
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in _row_chunks(df, rows, chunk_size):
+            if columns is not None:
+                chunk = chunk[columns]
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(target, table.schema)
+            writer.write_table(table)
+        if writer is None:
+            empty = df.iloc[:0] if columns is None else df.iloc[:0][columns]
+            table = pa.Table.from_pandas(empty, preserve_index=False)
+            writer = pq.ParquetWriter(target, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export_invoices(df, rows=None, columns=None, formato='CSV', chunk_size=EXPORT_CHUNK_ROWS):
+    # Escribe la exportación por bloques en un archivo temporal en disco y lo devuelve
+    # listo para leer; solo se llama cuando alguien pide la descarga
+    target = tempfile.TemporaryFile()
+    if formato == 'Parquet':
+        write_parquet(target, df, rows, columns, chunk_size)
+    else:
+        write_csv(target, df, rows, columns, chunk_size)
+    target.seek(0)
+    return target
+
+
+def read_export(exportado):
+    # Bytes de un archivo de export_invoices (o DuckDBQueries.export); lo cierra al terminar
+    with exportado:
+        return exportado.read()
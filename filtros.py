@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+
+# Columnas con índice de filtros (una lista de posiciones por valor)
+FILTER_COLS = ['CLIENTE', 'PERIODO', 'BROKER']
+
+# Medidas con sumas acumuladas en el índice de fechas
+RANGE_MEASURES = ['TOTAL_COBRADO', 'PAGO_BROKER', 'UTILIDAD_BRUTA']
+
+# Ventanas móviles de la barra lateral (días hacia atrás desde la última fecha con datos)
+ROLLING_WINDOWS = {
+    'Todo el período': None,
+    'Últimos 7 días': 7,
+    'Últimos 30 días': 30,
+    'Últimos 90 días': 90,
+    'Año a la fecha': 'YTD',
+    'Rango personalizado': 'RANGO',
+}
+
+
+def normalize_selection(value):
+    # 'Todos', None o una lista vacía no filtran; un valor suelto se vuelve lista
+    if value is None or (isinstance(value, str) and value == 'Todos'):
+        return None
+    if isinstance(value, (list, tuple, set, np.ndarray, pd.Index)):
+        values = [v for v in value if not (isinstance(v, str) and v == 'Todos')]
+        return values or None
+    return [value]
+
+
+def selection_key(value):
+    # Forma inmutable de una selección, para usarla en llaves de caché
+    values = normalize_selection(value)
+    return 'Todos' if values is None else tuple(values)
+
+
+def selection_label(value):
+    # Texto para títulos y métricas
+    values = normalize_selection(value)
+    if values is None:
+        return 'Todos'
+    return ', '.join(str(v) for v in values)
+
+
+def _intersect_sorted(a, b):
+    # Intersección de dos arreglos ordenados sin repetidos, buscando el más chico en el más grande
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return a
+    idx = np.searchsorted(b, a)
+    idx[idx == len(b)] = len(b) - 1
+    return a[b[idx] == a]
+
+
+class FilterIndex:
+    # Índice invertido por columna: para cada valor, las posiciones (ordenadas) de sus filas.
+    # Se construye una vez por carga de datos y responde cualquier combinación de filtros
+    # intersectando listas, sin recorrer ni copiar el DataFrame completo
+
+    def __init__(self, df, columns=FILTER_COLS):
+        self.num_rows = len(df)
+        self._postings = {}
+        for col in columns:
+            codes, uniques = pd.factorize(df[col], sort=False)
+            # argsort estable: dentro de cada valor las posiciones quedan ordenadas
+            order = np.argsort(codes, kind='stable')
+            sorted_codes = codes[order]
+            starts = np.searchsorted(sorted_codes, np.arange(len(uniques)), side='left')
+            ends = np.searchsorted(sorted_codes, np.arange(len(uniques)), side='right')
+            self._postings[col] = (
+                {value: (start, end) for value, start, end in zip(uniques, starts, ends)},
+                order,
+            )
+
+    def postings(self, col, value):
+        # Posiciones de las filas con ese valor (vista sobre el arreglo ordenado, sin copia)
+        bounds, order = self._postings[col]
+        if value not in bounds:
+            return order[:0]
+        start, end = bounds[value]
+        return order[start:end]
+
+    def _column_rows(self, col, values):
+        lists = [self.postings(col, value) for value in values]
+        if len(lists) == 1:
+            return lists[0]
+        return np.sort(np.concatenate(lists))
+
+    def rows(self, within=None, **selections):
+        # Posiciones que cumplen todos los filtros; None significa "todas las filas".
+        # within restringe además a un arreglo ordenado de posiciones (p. ej. un rango de fechas)
+        result = None
+        candidates = [] if within is None else [within]
+        for col, value in selections.items():
+            values = normalize_selection(value)
+            if values is not None:
+                candidates.append(self._column_rows(col, values))
+        for rows in sorted(candidates, key=len):
+            result = rows if result is None else _intersect_sorted(result, rows)
+        return result
+
+
+def rolling_window(name, max_date, start=None, end=None):
+    # Traduce una ventana de ROLLING_WINDOWS a (inicio, fin) anclada en la última fecha
+    # con datos; el rango personalizado usa start/end tal cual
+    days = ROLLING_WINDOWS.get(name)
+    if days is None or max_date is None:
+        return None, None
+    if days == 'RANGO':
+        return start, end
+    if days == 'YTD':
+        return pd.Timestamp(year=max_date.year, month=1, day=1), max_date
+    return max_date - pd.Timedelta(days=days - 1), max_date
+
+
+def period_bounds(periodo):
+    # Primer y último día de un período 'YYYY-MM'
+    start = pd.Timestamp(f'{periodo}-01')
+    return start, start + pd.offsets.MonthEnd(0)
+
+
+class DateRangeIndex:
+    # Filas ordenadas por FECHA con sumas acumuladas de las medidas: los totales de
+    # cualquier rango salen de dos búsquedas binarias y una resta, O(log n)
+
+    def __init__(self, df, measures=RANGE_MEASURES, distinct_cols=('FACTURA', 'CLIENTE')):
+        fechas = df['FECHA'].to_numpy(dtype='datetime64[ns]')
+        dated = ~np.isnat(fechas)
+        order = np.flatnonzero(dated)
+        order = order[np.argsort(fechas[order], kind='stable')]
+        self.num_rows = len(df)
+        self.order = order
+        self.fechas = fechas[order]
+        self.prefix = {}
+        self.undated = {}
+        for col in measures:
+            # Los nulos cuentan como cero, igual que en sum()
+            values = df[col].to_numpy(dtype='float64', na_value=np.nan)
+            self.prefix[col] = np.concatenate(([0.0], np.cumsum(np.nan_to_num(values[order]))))
+            self.undated[col] = float(np.nansum(values[~dated]))
+        self.undated['NUM_FILAS'] = int((~dated).sum())
+        # Códigos enteros (ordenados por fecha) para contar valores distintos en un rango
+        self.codes = {}
+        self.distinct_total = {}
+        for col in distinct_cols:
+            codes, _ = pd.factorize(df[col])
+            self.codes[col] = codes[order]
+            self.distinct_total[col] = int(df[col].nunique())
+        # Rango de cada fila en el orden por fecha (-1 para filas sin fecha)
+        self.rank = np.full(len(df), -1, dtype=np.int64)
+        self.rank[order] = np.arange(len(order))
+        self.min_date = pd.Timestamp(self.fechas[0]) if len(order) else None
+        self.max_date = pd.Timestamp(self.fechas[-1]) if len(order) else None
+
+    def bounds(self, start=None, end=None):
+        # Posiciones [lo, hi) dentro del arreglo ordenado; end es inclusivo (día completo)
+        lo = 0 if start is None else np.searchsorted(self.fechas, np.datetime64(pd.Timestamp(start).normalize(), 'ns'), side='left')
+        if end is None:
+            hi = len(self.fechas)
+        else:
+            end_exclusive = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+            hi = np.searchsorted(self.fechas, np.datetime64(end_exclusive, 'ns'), side='left')
+        return int(lo), int(max(hi, lo))
+
+    def totals(self, start=None, end=None):
+        # Sumas de las medidas y número de filas en el rango; sin rango se incluyen
+        # también las filas sin fecha, como en la suma sobre todo el DataFrame
+        lo, hi = self.bounds(start, end)
+        result = {col: float(prefix[hi] - prefix[lo]) for col, prefix in self.prefix.items()}
+        result['NUM_FILAS'] = hi - lo
+        if start is None and end is None:
+            for col, value in self.undated.items():
+                result[col] = result.get(col, 0) + value
+        return result
+
+    def totals_for_periods(self, periodos=None, start=None, end=None):
+        # Totales de uno o varios períodos 'YYYY-MM', recortados al rango [start, end]
+        if periodos is None:
+            return self.totals(start, end)
+        result = dict.fromkeys(list(self.prefix) + ['NUM_FILAS'], 0)
+        for periodo in periodos:
+            p_start, p_end = period_bounds(periodo)
+            if start is not None:
+                p_start = max(p_start, pd.Timestamp(start))
+            if end is not None:
+                p_end = min(p_end, pd.Timestamp(end))
+            if p_start > p_end:
+                continue
+            for col, value in self.totals(p_start, p_end).items():
+                result[col] += value
+        return result
+
+    def nunique(self, col, start=None, end=None):
+        # Valores distintos en el rango (recorre solo las filas del rango)
+        if start is None and end is None:
+            return self.distinct_total[col]
+        lo, hi = self.bounds(start, end)
+        codes = self.codes[col][lo:hi]
+        return len(np.unique(codes[codes >= 0]))
+
+    def rows(self, start=None, end=None):
+        # Posiciones (ordenadas) de las filas en el rango; None significa "todas las filas"
+        if start is None and end is None:
+            return None
+        lo, hi = self.bounds(start, end)
+        return np.sort(self.order[lo:hi])
+
+    def sort_desc(self, rows=None):
+        # Ordena posiciones por FECHA descendente (las filas sin fecha al final)
+        # usando el rango precalculado: solo se ordenan enteros de las filas pedidas
+        if rows is None:
+            undated = np.flatnonzero(self.rank < 0)
+            return np.concatenate((self.order[::-1], undated))
+        return rows[np.argsort(-self.rank[rows], kind='stable')]
@@ -0,0 +1,336 @@
+import numpy as np
+
+from filtros import selection_label
+
+# A partir de cuántos puntos una traza se dibuja con WebGL (scattergl)
+WEBGL_MIN_POINTS = 1000
+
+# Clientes con color propio en el scatter; el resto va al grupo 'Otros'
+SCATTER_MAX_GROUPS = 15
+OTROS = 'Otros'
+
+# Puntos máximos por serie de tiempo (se reduce en el servidor antes de graficar)
+SERIES_MAX_POINTS = 500
+
+# Las funciones build_* reciben los resúmenes ya filtrados (CubeSummaries o las consultas
+# de otro motor: resumenes['resumen_cliente'], resumenes.top(...)) y devuelven las figuras
+# y tablas formateadas de una vista, sin llamar a Streamlit: así se pueden guardar en
+# caché y reutilizar fuera del dashboard. plotly se importa dentro de las funciones: el
+# arranque no paga su importación hasta la primera figura
+
+
+def render_mode(num_points):
+    # WebGL para trazas grandes (el navegador no crea un nodo SVG por punto)
+    return 'webgl' if num_points >= WEBGL_MIN_POINTS else 'auto'
+
+
+def scatter_trace(num_points, **kwargs):
+    import plotly.graph_objects as go
+
+    return (go.Scattergl if num_points >= WEBGL_MIN_POINTS else go.Scatter)(**kwargs)
+
+
+def group_long_tail(frame, label_col, value_col, max_groups=SCATTER_MAX_GROUPS):
+    # Etiquetas de grupo: las max_groups mayores por value_col conservan su nombre y el
+    # resto se junta en 'Otros' (una sola traza en vez de una por valor)
+    labels = frame[label_col].astype(object)
+    if labels.nunique() <= max_groups:
+        return labels
+    top = set(frame.nlargest(max_groups, value_col)[label_col])
+    return labels.where(labels.isin(top), OTROS)
+
+
+def lttb_indices(values, max_points=SERIES_MAX_POINTS):
+    # Largest-Triangle-Three-Buckets: en cada bucket se queda el punto que forma el
+    # triángulo más grande con el elegido antes y el promedio del bucket siguiente.
+    # Conserva la forma de la serie (picos incluidos) con max_points puntos
+    y = np.asarray(values, dtype='float64')
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype='float64')
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    selected = [0]
+    a = 0
+    for i in range(len(edges) - 1):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = min(n, next_start + 1)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = np.nanmean(y[next_start:next_end]) if np.isfinite(y[next_start:next_end]).any() else y[a]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        selected.append(a)
+    selected.append(n - 1)
+    return np.unique(selected)
+
+
+def minmax_indices(frame, columns, max_points=SERIES_MAX_POINTS):
+    # Mínimo y máximo de cada columna por bucket (más el primer y último punto)
+    n = len(frame)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(1, (max_points - 2) // (2 * len(columns)))
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    selected = {0, n - 1}
+    for col in columns:
+        y = np.nan_to_num(frame[col].to_numpy(dtype='float64', na_value=np.nan), nan=0.0)
+        for start, end in zip(edges[:-1], edges[1:]):
+            if end > start:
+                selected.add(start + int(np.argmin(y[start:end])))
+                selected.add(start + int(np.argmax(y[start:end])))
+    return np.array(sorted(selected))
+
+
+def downsample(frame, columns, max_points=SERIES_MAX_POINTS):
+    # Serie de línea o scatter reducida en el servidor: LTTB con una columna, mínimo/máximo
+    # con varias (así ninguna pierde sus picos). No se usa en barras: quitarían categorías
+    if len(frame) <= max_points:
+        return frame
+    if len(columns) == 1:
+        return frame.iloc[lttb_indices(frame[columns[0]], max_points)]
+    return frame.iloc[minmax_indices(frame, columns, max_points)]
+
+
+def figure_bytes(fig):
+    # Tamaño del JSON que viaja al navegador
+    return len(fig.to_json().encode('utf-8'))
+
+
+def figure_html(fig, include_plotlyjs='cdn'):
+    # Fragmento HTML estático de una figura (reportes fuera del dashboard)
+    return fig.to_html(full_html=False, include_plotlyjs=include_plotlyjs, config={'displaylogo': False})
+
+
+def payload_report(vista):
+    # Bytes de cada figura de una vista
+    import plotly.graph_objects as go
+
+    return {name: figure_bytes(fig) for name, fig in vista.items() if isinstance(fig, go.Figure)}
+
+
+def build_resumen_general(resumenes, cliente_seleccionado='Todos'):
+    import plotly.express as px
+
+    resumen_periodo = resumenes['resumen_periodo']
+    vista = {'fig_pie': None}
+
+    # Gráfico de pastel: Distribución de ingresos por cliente
+    if cliente_seleccionado == 'Todos':
+        top_clientes = resumenes.top('resumen_cliente', 'TOTAL_COBRADO', 10)
+        vista['fig_pie'] = px.pie(top_clientes, values='TOTAL_COBRADO', names='CLIENTE',
+                                  title='Top 10 Clientes por Ingresos',
+                                  hole=0.3)
+    else:
+        # Para los clientes seleccionados, mostrar distribución por proyecto
+        # (los resúmenes ya vienen filtrados por cliente)
+        cliente_data = resumenes['resumen_proyecto']
+        if not cliente_data.empty:
+            vista['fig_pie'] = px.pie(cliente_data, values='TOTAL_COBRADO', names='PROYECTO',
+                                      title=f'Distribución de Ingresos por Proyecto - {selection_label(cliente_seleccionado)}',
+                                      hole=0.3)
+
+    # Gráfico de barras: Margen por cliente
+    margen_data = resumenes.top('resumen_cliente', 'MARGEN_PORCENTAJE', 15, positive='TOTAL_COBRADO')
+    vista['fig_margen'] = px.bar(margen_data,
+                                 x='MARGEN_PORCENTAJE', y='CLIENTE', orientation='h',
+                                 title='Top 15 Clientes por Margen (%)',
+                                 labels={'MARGEN_PORCENTAJE': 'Margen (%)'},
+                                 color='MARGEN_PORCENTAJE',
+                                 color_continuous_scale='RdYlGn')
+
+    # Evolución temporal de ingresos y pagos
+    serie = downsample(resumen_periodo, ['TOTAL_COBRADO', 'PAGO_BROKER'])
+    fig_evolucion = px.line(serie, x='PERIODO', y=['TOTAL_COBRADO', 'PAGO_BROKER'],
+                            title='Evolución de Ingresos y Pagos a Brokers por Período',
+                            markers=True, render_mode=render_mode(2 * len(serie)))
+    fig_evolucion.update_layout(xaxis_title="Período", yaxis_title="Monto ($)")
+    vista['fig_evolucion'] = fig_evolucion
+    return vista
+
+
+def build_clientes(resumenes):
+    import plotly.express as px
+
+    resumen_cliente = resumenes['resumen_cliente']
+
+    # Tabla interactiva de clientes
+    display_clients = resumen_cliente[['CLIENTE', 'NUM_FACTURAS', 'TOTAL_COBRADO',
+                                       'PAGO_BROKER', 'UTILIDAD_BRUTA', 'MARGEN_PORCENTAJE']].copy()
+    display_clients = display_clients.sort_values('UTILIDAD_BRUTA', ascending=False)
+    display_clients['TOTAL_COBRADO'] = display_clients['TOTAL_COBRADO'].map('${:,.2f}'.format)
+    display_clients['PAGO_BROKER'] = display_clients['PAGO_BROKER'].map('${:,.2f}'.format)
+    display_clients['UTILIDAD_BRUTA'] = display_clients['UTILIDAD_BRUTA'].map('${:,.2f}'.format)
+    display_clients['MARGEN_PORCENTAJE'] = display_clients['MARGEN_PORCENTAJE'].map('{:.2f}%'.format)
+
+    # Gráfico de barras de ingresos por cliente
+    fig_ingresos = px.bar(resumenes.top('resumen_cliente', 'TOTAL_COBRADO', 10),
+                          x='TOTAL_COBRADO', y='CLIENTE', orientation='h',
+                          title='Top 10 Ingresos por Cliente',
+                          color='TOTAL_COBRADO',
+                          color_continuous_scale='Blues')
+
+    # Scatter plot: Ingresos vs Margen (los clientes fuera del top comparten el color 'Otros')
+    datos_scatter = resumen_cliente.assign(GRUPO=group_long_tail(resumen_cliente, 'CLIENTE', 'TOTAL_COBRADO'))
+    fig_scatter = px.scatter(datos_scatter,
+                             x='TOTAL_COBRADO',
+                             y='MARGEN_PORCENTAJE',
+                             size='NUM_FACTURAS',
+                             color='GRUPO',
+                             title='Ingresos vs Margen por Cliente',
+                             hover_name='CLIENTE',
+                             hover_data=['NUM_FACTURAS', 'UTILIDAD_BRUTA'],
+                             labels={'GRUPO': 'Cliente'},
+                             render_mode=render_mode(len(datos_scatter)))
+    fig_scatter.update_layout(xaxis_title="Total Cobrado ($)", yaxis_title="Margen (%)")
+
+    return {'display_clients': display_clients, 'fig_ingresos': fig_ingresos, 'fig_scatter': fig_scatter}
+
+
+def project_clients(resumenes):
+    # Opciones del filtro adicional por cliente de la vista de proyectos
+    return sorted(resumenes['resumen_proyecto']['CLIENTE'].unique().tolist())
+
+
+def build_proyectos(resumenes, cliente_proyecto='Todos'):
+    import plotly.express as px
+
+    resumen_proyecto = resumenes['resumen_proyecto']
+    vista = {'fig_proy_utilidad': None, 'fig_proy_margen': None}
+
+    if cliente_proyecto != 'Todos':
+        proyectos_data = resumen_proyecto[resumen_proyecto['CLIENTE'] == cliente_proyecto]
+        por_cliente = {'CLIENTE': cliente_proyecto}
+    else:
+        proyectos_data = resumen_proyecto
+        por_cliente = {}
+
+    # Top proyectos más rentables
+    top_proyectos_utilidad = resumenes.top('resumen_proyecto', 'UTILIDAD_BRUTA', 10, **por_cliente)
+    if not top_proyectos_utilidad.empty:
+        vista['fig_proy_utilidad'] = px.bar(top_proyectos_utilidad,
+                                            x='UTILIDAD_BRUTA', y='PROYECTO', orientation='h',
+                                            title='Top 10 Proyectos por Utilidad Bruta',
+                                            color='UTILIDAD_BRUTA',
+                                            color_continuous_scale='Greens')
+
+    top_proyectos_margen = resumenes.top('resumen_proyecto', 'MARGEN_PORCENTAJE', 10, **por_cliente)
+    if not top_proyectos_margen.empty:
+        vista['fig_proy_margen'] = px.bar(top_proyectos_margen,
+                                          x='MARGEN_PORCENTAJE', y='PROYECTO', orientation='h',
+                                          title='Top 10 Proyectos por Margen (%)',
+                                          color='MARGEN_PORCENTAJE',
+                                          color_continuous_scale='RdYlGn')
+
+    # Tabla filtrable de proyectos
+    display_proyectos = proyectos_data[['CLIENTE', 'PROYECTO', 'NUM_FACTURAS',
+                                        'TOTAL_COBRADO', 'PAGO_BROKER',
+                                        'UTILIDAD_BRUTA', 'MARGEN_PORCENTAJE']].copy()
+    display_proyectos = display_proyectos.sort_values('UTILIDAD_BRUTA', ascending=False)
+
+    # Formatear valores
+    display_proyectos['TOTAL_COBRADO'] = display_proyectos['TOTAL_COBRADO'].map('${:,.2f}'.format)
+    display_proyectos['PAGO_BROKER'] = display_proyectos['PAGO_BROKER'].map('${:,.2f}'.format)
+    display_proyectos['UTILIDAD_BRUTA'] = display_proyectos['UTILIDAD_BRUTA'].map('${:,.2f}'.format)
+    display_proyectos['MARGEN_PORCENTAJE'] = display_proyectos['MARGEN_PORCENTAJE'].map('{:.2f}%'.format)
+    vista['display_proyectos'] = display_proyectos
+    return vista
+
+
+def build_periodos(resumenes):
+    import plotly.express as px
+    from plotly.subplots import make_subplots
+
+    resumen_periodo = resumenes['resumen_periodo']
+    vista = {}
+
+    # Métricas por período: las barras no se reducen (cada período es una categoría);
+    # downsample solo aplica a las líneas
+    vista['fig_periodo_ingresos'] = px.bar(resumen_periodo,
+                                           x='PERIODO', y='TOTAL_COBRADO',
+                                           title='Ingresos por Período',
+                                           color='TOTAL_COBRADO',
+                                           color_continuous_scale='Blues')
+
+    vista['fig_periodo_utilidad'] = px.bar(resumen_periodo,
+                                           x='PERIODO', y='UTILIDAD_BRUTA',
+                                           title='Utilidad Bruta por Período',
+                                           color='UTILIDAD_BRUTA',
+                                           color_continuous_scale='Greens')
+
+    serie_margen = downsample(resumen_periodo, ['MARGEN_PORCENTAJE'])
+    fig_periodo_margen = px.line(serie_margen, x='PERIODO', y='MARGEN_PORCENTAJE',
+                                 title='Margen % por Período',
+                                 markers=True, render_mode=render_mode(len(serie_margen)))
+    fig_periodo_margen.update_traces(line=dict(color='orange', width=3))
+    vista['fig_periodo_margen'] = fig_periodo_margen
+
+    # Análisis de tendencia
+    resumen_periodo_sorted = resumen_periodo.sort_values('PERIODO')
+    resumen_periodo_sorted['TENDENCIA_INGRESOS'] = resumen_periodo_sorted['TOTAL_COBRADO'].pct_change() * 100
+    resumen_periodo_sorted['TENDENCIA_UTILIDAD'] = resumen_periodo_sorted['UTILIDAD_BRUTA'].pct_change() * 100
+    # Se reduce después de calcular el crecimiento sobre la serie completa
+    tendencia_ingresos = downsample(resumen_periodo_sorted, ['TENDENCIA_INGRESOS'])
+    tendencia_utilidad = downsample(resumen_periodo_sorted, ['TENDENCIA_UTILIDAD'])
+
+    fig_tendencia = make_subplots(rows=2, cols=1,
+                                  subplot_titles=('Tendencia de Crecimiento de Ingresos (%)',
+                                                  'Tendencia de Crecimiento de Utilidad (%)'))
+
+    fig_tendencia.add_trace(
+        scatter_trace(len(tendencia_ingresos),
+                      x=tendencia_ingresos['PERIODO'],
+                      y=tendencia_ingresos['TENDENCIA_INGRESOS'],
+                      name='Ingresos',
+                      line=dict(color='blue', width=2)),
+        row=1, col=1
+    )
+
+    fig_tendencia.add_trace(
+        scatter_trace(len(tendencia_utilidad),
+                      x=tendencia_utilidad['PERIODO'],
+                      y=tendencia_utilidad['TENDENCIA_UTILIDAD'],
+                      name='Utilidad',
+                      line=dict(color='green', width=2)),
+        row=2, col=1
+    )
+
+    fig_tendencia.update_layout(height=600, showlegend=True)
+    fig_tendencia.update_xaxes(title_text="Período", row=2, col=1)
+    fig_tendencia.update_yaxes(title_text="Crecimiento (%)", row=1, col=1)
+    fig_tendencia.update_yaxes(title_text="Crecimiento (%)", row=2, col=1)
+    vista['fig_tendencia'] = fig_tendencia
+    return vista
+
+
+def build_brokers(resumenes):
+    import plotly.express as px
+
+    resumen_broker = resumenes['resumen_broker']
+
+    # Top brokers por pago
+    top_brokers = resumenes.top('resumen_broker', 'TOTAL_PAGADO', 15)
+    fig_broker = px.bar(top_brokers, x='TOTAL_PAGADO', y='BROKER', orientation='h',
+                        title='Top 15 Brokers por Total Pagado',
+                        color='TOTAL_PAGADO',
+                        color_continuous_scale='Purples')
+    fig_broker.update_layout(xaxis_title="Total Pagado ($)", yaxis_title="Broker")
+
+    # Distribución de brokers
+    top_10_brokers = resumenes.top('resumen_broker', 'TOTAL_PAGADO', 10)
+    fig_broker_pie = px.pie(top_10_brokers,
+                            values='TOTAL_PAGADO', names='BROKER',
+                            title='Distribución Top 10 Brokers',
+                            hole=0.4)
+
+    # Tabla de brokers
+    display_brokers = resumen_broker[['BROKER', 'NUM_SERVICIOS', 'TOTAL_PAGADO', 'TOTAL_COBRADO']].copy()
+    display_brokers = display_brokers.sort_values('TOTAL_PAGADO', ascending=False)
+
+    # Formatear valores
+    display_brokers['TOTAL_PAGADO'] = display_brokers['TOTAL_PAGADO'].map('${:,.2f}'.format)
+    display_brokers['TOTAL_COBRADO'] = display_brokers['TOTAL_COBRADO'].map('${:,.2f}'.format)
+
+    return {'fig_broker': fig_broker, 'fig_broker_pie': fig_broker_pie, 'display_brokers': display_brokers}
@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Caché acotado para figuras y tablas ya formateadas: expulsa la entrada menos
+    # usada al llenarse y descarta las que superan ttl segundos. Seguro entre hilos
+    # (Streamlit atiende cada sesión en su propio hilo)
+
+    def __init__(self, max_entries=128, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl is None or self._clock() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_build(self, key, builder):
+        # Si dos sesiones piden la misma llave a la vez ambas pueden construirla;
+        # el resultado es el mismo, así que basta con guardar el último
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = builder()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entradas': len(self._entries),
+                'max_entradas': self.max_entries,
+                'ttl_segundos': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'tasa_hits': self.hits / total if total else 0.0,
+                'expulsiones': self.evictions,
+                'expiraciones': self.expirations,
+            }
@@ -0,0 +1,151 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from datos import CACHE_DIR, DATA_SOURCE, data_version, load_workbooks, snapshot_tables
+from filtros import FILTER_COLS
+
+# Artefactos de arranque: se generan en el build (render.yaml) para que el primer request
+# después de un deploy no parsee los libros ni calcule los resúmenes. Los datos, el cubo
+# y los resúmenes quedan en el caché compartido (Arrow con memory-map) y los snapshots de
+# los libros, de donde cada proceso carga su base DuckDB; aquí se guardan además las
+# opciones de los filtros por versión
+WARM_DIR = os.path.join(CACHE_DIR, 'arranque')
+
+# Script que se mide al arrancar
+DASHBOARD_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard2.py')
+
+
+def options_path(version, directory=WARM_DIR):
+    return os.path.join(directory, f'opciones_{version[:16]}.json')
+
+
+def write_filter_options(fuente, directory=WARM_DIR, **extra):
+    # Opciones de Cliente, Período y Broker (orden ascendente) de la versión de fuente
+    os.makedirs(directory, exist_ok=True)
+    artefacto = {
+        'version': fuente.version,
+        'opciones': {col: fuente.options(col) for col in FILTER_COLS},
+        'creado': datetime.now().isoformat(timespec='seconds'),
+        **extra,
+    }
+    path = options_path(fuente.version, directory)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(artefacto, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_filter_options(version, directory=WARM_DIR):
+    # {columna: opciones ascendentes} de esa versión o None si no se precalcularon
+    try:
+        with open(options_path(version, directory), encoding='utf-8') as f:
+            artefacto = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if artefacto.get('version') != version:
+        return None
+    return artefacto['opciones']
+
+
+def precompute(source=DATA_SOURCE, cache_dir=CACHE_DIR, backend=None):
+    # Genera los artefactos de la versión actual con el mismo código que usa el dashboard
+    # al arrancar; devuelve los segundos de cada paso
+    from consultas import QUERY_BACKEND, DuckDBBackend, PandasQueries
+
+    backend = backend or QUERY_BACKEND
+    segundos = {}
+    start = time.perf_counter()
+    version = data_version(source, cache_dir)
+    if backend == 'duckdb':
+        db = DuckDBBackend()
+        db.refresh(version, lambda: snapshot_tables(source, cache_dir))
+        segundos['duckdb'] = time.perf_counter() - start
+        fuente = db.queries()
+    else:
+        from compartido import SHARED_CACHE, SharedCache
+        from filtros import DateRangeIndex, FilterIndex
+        from resumenes import IncrementalSummaries
+
+        if not SHARED_CACHE:
+            print('Aviso: DASHBOARD_SHARED_CACHE=0, solo se generan los snapshots de los libros')
+        estado = IncrementalSummaries.load(version, lambda: load_workbooks(source, cache_dir),
+                                           shared=SharedCache() if SHARED_CACHE else None)
+        segundos['datos_y_resumenes'] = time.perf_counter() - start
+        version, df, cubo, _, carga = estado.current
+        fuente = PandasQueries(version, df, cubo, FilterIndex(df), DateRangeIndex(df), carga)
+
+    paso = time.perf_counter()
+    path = write_filter_options(fuente, motor=backend)
+    segundos['opciones'] = time.perf_counter() - paso
+    if backend == 'duckdb':
+        db.close()
+    segundos['total'] = time.perf_counter() - start
+    return {'version': version, 'motor': backend, 'opciones': path, 'segundos': segundos}
+
+
+# Se corre en un intérprete nuevo: mide importar Streamlit y el primer run completo
+_STARTUP_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+importado = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[2]))
+at.run()
+fin = time.perf_counter()
+print(json.dumps({'importar_streamlit': importado - start, 'primer_run': fin - importado,
+                  'errores': len(at.exception)}))
+"""
+
+
+def measure_startup(cache_dir=CACHE_DIR, script=DASHBOARD_SCRIPT, timeout=900):
+    # Segundos desde que arranca el proceso hasta la primera página completa (AppTest en
+    # un intérprete nuevo), con los artefactos de cache_dir
+    env = dict(os.environ, DASHBOARD_CACHE_DIR=cache_dir)
+    for name in ('DASHBOARD_SHARED_CACHE_DIR', 'DASHBOARD_DUCKDB'):
+        env.pop(name, None)
+    start = time.perf_counter()
+    salida = subprocess.run([sys.executable, '-c', _STARTUP_SNIPPET, script, str(timeout)], env=env,
+                            capture_output=True, text=True, timeout=timeout)
+    total = time.perf_counter() - start
+    if salida.returncode != 0:
+        raise RuntimeError(salida.stderr.strip().splitlines()[-1] if salida.stderr.strip() else 'falló el arranque')
+    return {'total': total, **json.loads(salida.stdout.strip().splitlines()[-1])}
+
+
+def compare_startup(source=DATA_SOURCE, cache_dir=CACHE_DIR):
+    # Arranque en frío (caché vacío, como un deploy sin precálculo) contra el arranque con
+    # los artefactos ya generados en cache_dir
+    with tempfile.TemporaryDirectory() as vacio:
+        frio = measure_startup(vacio)
+    precalculado = measure_startup(cache_dir)
+    return {'frio': frio, 'precalculado': precalculado}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Artefactos de arranque del dashboard (se corre en el build)')
+    parser.add_argument('--datos', default=DATA_SOURCE, help='Libro, directorio o patrón glob de los datos')
+    parser.add_argument('--medir', action='store_true',
+                        help='Medir el arranque hasta la primera página, en frío y con los artefactos')
+    parser.add_argument('--salida', help='Archivo JSON con los tiempos')
+    args = parser.parse_args()
+
+    reporte = precompute(args.datos)
+    pasos = ' · '.join(f'{paso}: {segundos:.2f} s' for paso, segundos in reporte['segundos'].items())
+    print(f"Versión {reporte['version'][:8]} ({reporte['motor']}) · {pasos}")
+    if args.medir:
+        reporte['arranque'] = compare_startup(args.datos)
+        for nombre, medida in reporte['arranque'].items():
+            print(f"Arranque {nombre}: {medida['total']:.2f} s hasta la primera página "
+                  f"(importar Streamlit {medida['importar_streamlit']:.2f} s · primer run "
+                  f"{medida['primer_run']:.2f} s · errores {medida['errores']})")
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(reporte, f, indent=2)
@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+
+from datos import data_version, source_signature
+
+# Segundos entre revisiones de los libros de origen; 0 desactiva el hilo y la revisión
+# se hace en cada rerun
+REFRESH_SECONDS = float(os.environ.get('DASHBOARD_REFRESH_SECONDS', '30'))
+
+
+class DataRefresher:
+    # Vigila los libros de origen (tamaño y fecha de modificación, sin leerlos) desde un
+    # hilo en segundo plano. Cuando cambian, carga la versión nueva y la publica en el
+    # estado (IncrementalSummaries) con un solo reemplazo de current: mientras tanto las
+    # sesiones siguen leyendo la versión anterior completa
+
+    def __init__(self, estado, source, loader, interval=REFRESH_SECONDS, signature=None):
+        self.estado = estado
+        self.source = source
+        self.loader = loader
+        self.interval = interval
+        # Firma de los archivos de la versión cargada (tomarla antes de cargar evita
+        # perder un cambio hecho durante la carga)
+        self.signature = source_signature(source) if signature is None else signature
+        self.refreshing = False
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def check(self):
+        # Una revisión; devuelve la info de la actualización o None si no hubo cambios.
+        # Si la carga falla (p. ej. el libro se está guardando) se reintenta en la siguiente
+        with self._lock:
+            signature = source_signature(self.source)
+            if signature == self.signature:
+                return None
+            self.refreshing = True
+            try:
+                info = self.estado.refresh(data_version(self.source), self.loader)
+            except Exception as error:
+                self.error = f'{type(error).__name__}: {error}'
+                return None
+            finally:
+                self.refreshing = False
+            self.signature = signature
+            self.error = None
+            return info
+
+    def _run(self):
+        # Hilo daemon: termina con el proceso
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='refresco-datos', daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
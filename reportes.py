@@ -0,0 +1,309 @@
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from compartido import SHARED_CACHE, SharedCache
+from consultas import DETALLE_VISTA_COLS, PandasQueries
+from datos import CACHE_DIR, DATA_SOURCE, data_version, load_workbooks
+from filtros import DateRangeIndex, FilterIndex, normalize_selection, selection_label
+from resumenes import DISTINCT_MODE, IncrementalSummaries
+
+# Carpeta de salida de los reportes por cliente
+REPORTS_DIR = os.environ.get('DASHBOARD_REPORTS_DIR', 'reportes')
+
+# Formatos que se generan por cliente
+REPORT_FORMATS = ('html', 'parquet')
+
+# Cambiar al modificar el contenido de los reportes: invalida las huellas guardadas
+REPORT_VERSION = 1
+
+# Filas del detalle que se incluyen en el HTML (el Parquet lleva todas)
+REPORT_DETAIL_ROWS = 500
+
+# Cómo incluye Plotly cada HTML: 'cdn' (liviano, requiere internet) o True (autónomo, ~4 MB)
+REPORT_PLOTLYJS = 'cdn'
+
+MANIFEST = 'manifest.json'
+
+# Columnas que definen el contenido de un reporte: si no cambian, no se regenera
+FINGERPRINT_COLS = DETALLE_VISTA_COLS + ['PERIODO', 'PROYECTO']
+
+# Datos de la versión en cada worker del pool (se cargan una vez por proceso)
+_fuente = None
+
+
+def load_version(source=DATA_SOURCE, cache_dir=CACHE_DIR, shared=None, mode=DISTINCT_MODE, version=None):
+    # Datos, cubo y resúmenes de una versión, como en el dashboard: con shared la versión
+    # queda en el caché compartido y los demás procesos la abren con memory-map
+    if version is None:
+        version = data_version(source, cache_dir)
+    return IncrementalSummaries.load(version, lambda: load_workbooks(source, cache_dir), shared=shared,
+                                     mode=mode)
+
+
+def queries_for(estado):
+    version, df, cubo, _, carga = estado.current
+    return PandasQueries(version, df, cubo, FilterIndex(df), DateRangeIndex(df), carga)
+
+
+def _init_worker(version, source, cache_dir, shared_dir, mode):
+    # Cada worker adjunta la versión que dejó el proceso principal en el caché compartido
+    # (sin volver a parsear los libros); sin caché la carga por su cuenta desde los snapshots
+    global _fuente
+    shared = SharedCache(shared_dir) if shared_dir else None
+    _fuente = queries_for(load_version(source, cache_dir, shared, mode, version))
+
+
+def client_fingerprints(df, periodo='Todos'):
+    # Huella por cliente de las filas que entran en su reporte: suma (módulo 2**64) de los
+    # hashes de cada fila, así que no depende del orden y cambia con cualquier fila
+    cols = [col for col in FINGERPRINT_COLS if col in df.columns]
+    periodos = normalize_selection(periodo)
+    if periodos is not None:
+        df = df[df['PERIODO'].isin(periodos)]
+    hashes = pd.Series(pd.util.hash_pandas_object(df[cols], index=False).to_numpy(), index=df.index)
+    sumas = hashes.groupby(df['CLIENTE'].astype(object)).sum()
+    filas = df.groupby(df['CLIENTE'].astype(object)).size()
+    return {
+        cliente: f'{REPORT_VERSION}-{selection_label(periodo)}-{filas[cliente]}-{int(suma) & (2 ** 64 - 1):016x}'
+        for cliente, suma in sumas.items()
+    }
+
+
+def client_dir(output_dir, cliente, periodo='Todos'):
+    # Carpeta de un cliente: nombre legible más un hash corto (nombres con caracteres
+    # raros o que solo difieren en mayúsculas no chocan)
+    slug = re.sub(r'[^0-9A-Za-z]+', '_', str(cliente)).strip('_')[:60] or 'cliente'
+    digest = hashlib.sha1(str(cliente).encode('utf-8')).hexdigest()[:8]
+    etiqueta = 'todo' if normalize_selection(periodo) is None else re.sub(r'[^0-9A-Za-z]+', '_', selection_label(periodo))
+    return os.path.join(output_dir, f'{slug}_{digest}', etiqueta)
+
+
+def _money(value):
+    return f'${value:,.2f}'
+
+
+def _table_html(frame):
+    return frame.to_html(index=False, classes='tabla', border=0, na_rep='', escape=True)
+
+
+def render_html(fuente, cliente, periodo, resumenes, vista_proyectos, vista_periodos, detalle, total_filas):
+    # Página estática con las mismas vistas del dashboard para un cliente
+    from graficas import figure_html
+
+    resumen = resumenes['resumen_cliente']
+    fila = resumen.iloc[0] if not resumen.empty else None
+    kpis = ''
+    if fila is not None:
+        margen = (fila['UTILIDAD_BRUTA'] / fila['TOTAL_COBRADO'] * 100) if fila['TOTAL_COBRADO'] > 0 else 0
+        kpis = ''.join(
+            f'<div class="kpi"><span>{html.escape(nombre)}</span><b>{valor}</b></div>'
+            for nombre, valor in (
+                ('Total Cobrado', _money(fila['TOTAL_COBRADO'])),
+                ('Pago Broker', _money(fila['PAGO_BROKER'])),
+                ('Utilidad Bruta', _money(fila['UTILIDAD_BRUTA'])),
+                ('Margen', f'{margen:.2f}%'),
+                ('Facturas', f"{int(fila['NUM_FACTURAS']):,}"),
+            )
+        )
+
+    figuras = [vista_proyectos.get('fig_proy_utilidad'), vista_proyectos.get('fig_proy_margen')]
+    figuras_periodos = [vista_periodos[nombre] for nombre in
+                        ('fig_periodo_ingresos', 'fig_periodo_utilidad', 'fig_periodo_margen', 'fig_tendencia')]
+    incluir = [REPORT_PLOTLYJS]
+
+    def fig(figura):
+        if figura is None:
+            return ''
+        # plotly.js se incluye solo con la primera figura
+        contenido = figure_html(figura, incluir[0])
+        incluir[0] = False
+        return f'<div class="figura">{contenido}</div>'
+
+    periodo_texto = 'Todos los períodos' if normalize_selection(periodo) is None else selection_label(periodo)
+    nota_detalle = ''
+    if total_filas > len(detalle):
+        nota_detalle = (f'<p class="nota">Se muestran las {len(detalle):,} filas más recientes de '
+                        f'{total_filas:,}; el detalle completo está en detalle.parquet.</p>')
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>Reporte {html.escape(str(cliente))} - {html.escape(periodo_texto)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2rem; color: #262730; }}
+.kpis {{ display: flex; gap: 1rem; flex-wrap: wrap; }}
+.kpi {{ border: 1px solid #ddd; border-radius: 6px; padding: .6rem 1rem; }}
+.kpi span {{ display: block; font-size: .8rem; color: #666; }}
+.figuras {{ display: grid; grid-template-columns: 1fr 1fr; gap: 1rem; }}
+.tabla {{ border-collapse: collapse; font-size: .85rem; }}
+.tabla th, .tabla td {{ padding: .25rem .6rem; border-bottom: 1px solid #eee; text-align: right; }}
+.nota {{ color: #666; font-size: .85rem; }}
+</style>
+</head>
+<body>
+<h1>📊 {html.escape(str(cliente))}</h1>
+<p>{html.escape(periodo_texto)} · Datos versión {fuente.carga['numero']} ({html.escape(str(fuente.version)[:8])})
+ · Generado {datetime.now():%d/%m/%Y %H:%M}</p>
+<div class="kpis">{kpis}</div>
+<h2>🏗️ Proyectos</h2>
+<div class="figuras">{''.join(fig(figura) for figura in figuras)}</div>
+{_table_html(vista_proyectos['display_proyectos'])}
+<h2>📅 Períodos</h2>
+<div class="figuras">{''.join(fig(figura) for figura in figuras_periodos[:3])}</div>
+{fig(figuras_periodos[3])}
+<h2>📄 Detalle</h2>
+{nota_detalle}
+{_table_html(detalle)}
+</body>
+</html>
+"""
+
+
+def render_client_report(fuente, cliente, periodo='Todos', output_dir=REPORTS_DIR, formatos=REPORT_FORMATS):
+    # Escribe los archivos de un cliente en una carpeta temporal y la publica con un
+    # rename (un reporte a medias nunca reemplaza al anterior). Devuelve los archivos
+    from graficas import build_periodos, build_proyectos
+
+    directory = client_dir(output_dir, cliente, periodo)
+    tmp_dir = f'{directory}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    resumenes = fuente.summaries(cliente, periodo)
+    archivos = []
+    if 'parquet' in formatos:
+        resumenes['resumen_proyecto'].to_parquet(os.path.join(tmp_dir, 'proyectos.parquet'), index=False)
+        resumenes['resumen_periodo'].to_parquet(os.path.join(tmp_dir, 'periodos.parquet'), index=False)
+        with fuente.export(cliente, periodo, formato='Parquet') as exportado, \
+                open(os.path.join(tmp_dir, 'detalle.parquet'), 'wb') as f:
+            shutil.copyfileobj(exportado, f)
+        archivos += ['proyectos.parquet', 'periodos.parquet', 'detalle.parquet']
+    if 'html' in formatos:
+        total_filas = fuente.detail_count(cliente, periodo)
+        detalle = fuente.detail_page(cliente, periodo, pagina=0, tamano_pagina=REPORT_DETAIL_ROWS)
+        pagina = render_html(fuente, cliente, periodo, resumenes, build_proyectos(resumenes, cliente),
+                             build_periodos(resumenes), detalle, total_filas)
+        with open(os.path.join(tmp_dir, 'reporte.html'), 'w', encoding='utf-8') as f:
+            f.write(pagina)
+        archivos.append('reporte.html')
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    os.replace(tmp_dir, directory)
+    return [os.path.join(directory, archivo) for archivo in archivos]
+
+
+def _report_task(cliente, periodo, output_dir, formatos):
+    start = time.perf_counter()
+    try:
+        archivos = render_client_report(_fuente, cliente, periodo, output_dir, formatos)
+    except Exception as error:
+        return cliente, None, f'{type(error).__name__}: {error}', time.perf_counter() - start
+    return cliente, archivos, None, time.perf_counter() - start
+
+
+def _read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def generate_reports(clientes=None, periodo='Todos', output_dir=REPORTS_DIR, formatos=REPORT_FORMATS,
+                     max_workers=None, force=False, source=DATA_SOURCE, cache_dir=CACHE_DIR):
+    # Reportes de todos los clientes (o de la lista dada) en un pool de procesos. Los
+    # clientes cuya huella no cambió desde la última corrida (y sus archivos siguen ahí)
+    # se saltan. Devuelve {'generados', 'saltados', 'errores', 'segundos'}
+    start = time.perf_counter()
+    shared = SharedCache() if SHARED_CACHE else None
+    estado = load_version(source, cache_dir, shared)
+    version, df, _, _, _ = estado.current
+
+    huellas = client_fingerprints(df, periodo)
+    if clientes is None:
+        clientes = sorted(huellas)
+    desconocidos = [cliente for cliente in clientes if cliente not in huellas]
+    clientes = [cliente for cliente in clientes if cliente in huellas]
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _read_manifest(output_dir)
+    formatos = tuple(formatos)
+    pendientes, saltados = [], []
+    for cliente in clientes:
+        clave = f'{cliente}|{selection_label(periodo)}'
+        previo = manifest.get(clave)
+        if (not force and previo and previo['huella'] == huellas[cliente]
+                and tuple(previo['formatos']) == formatos
+                and all(os.path.exists(path) for path in previo['archivos'])):
+            saltados.append(cliente)
+        else:
+            pendientes.append(cliente)
+
+    generados, errores = [], {cliente: 'sin filas para el período' for cliente in desconocidos}
+    if pendientes:
+        workers = max(1, min(len(pendientes), max_workers or os.cpu_count() or 1))
+        shared_dir = shared.directory if shared is not None else None
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(version, source, cache_dir, shared_dir, estado.mode)) as pool:
+            futures = [pool.submit(_report_task, cliente, periodo, output_dir, formatos) for cliente in pendientes]
+            for future in futures:
+                cliente, archivos, error, segundos = future.result()
+                if error is not None:
+                    errores[cliente] = error
+                    continue
+                generados.append(cliente)
+                manifest[f'{cliente}|{selection_label(periodo)}'] = {
+                    'cliente': cliente,
+                    'periodo': selection_label(periodo),
+                    'huella': huellas[cliente],
+                    'formatos': list(formatos),
+                    'archivos': archivos,
+                    'version_datos': version,
+                    'generado': datetime.now().isoformat(timespec='seconds'),
+                    'segundos': round(segundos, 3),
+                }
+        _write_manifest(output_dir, manifest)
+    return {'generados': generados, 'saltados': saltados, 'errores': errores,
+            'segundos': time.perf_counter() - start}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Reportes estáticos por cliente (HTML y Parquet) sin Streamlit')
+    parser.add_argument('--salida', default=REPORTS_DIR, help='Carpeta de salida')
+    parser.add_argument('--clientes', nargs='+', help='Solo estos clientes (por defecto, todos)')
+    parser.add_argument('--periodo', nargs='+', help='Solo estos períodos YYYY-MM (por defecto, todos)')
+    parser.add_argument('--formatos', nargs='+', choices=REPORT_FORMATS, default=list(REPORT_FORMATS))
+    parser.add_argument('--workers', type=int, help='Procesos en paralelo (por defecto, uno por CPU)')
+    parser.add_argument('--forzar', action='store_true', help='Regenerar aunque los datos no hayan cambiado')
+    parser.add_argument('--datos', default=DATA_SOURCE, help='Libro, directorio o patrón glob de los datos')
+    args = parser.parse_args()
+
+    periodo = 'Todos' if not args.periodo else (args.periodo[0] if len(args.periodo) == 1 else args.periodo)
+    resultado = generate_reports(args.clientes, periodo, args.salida, args.formatos, args.workers,
+                                 args.forzar, args.datos)
+    print(f"Generados: {len(resultado['generados'])} · Sin cambios: {len(resultado['saltados'])} · "
+          f"Errores: {len(resultado['errores'])} · {resultado['segundos']:.1f} s")
+    for cliente, error in resultado['errores'].items():
+        print(f'  {cliente}: {error}')
+    if resultado['errores']:
+        raise SystemExit(1)
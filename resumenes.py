@@ -0,0 +1,377 @@
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from distintos import DISTINCT_MODES, build_sketches, distinct_count, invoice_ids
+from filtros import normalize_selection
+
+# Dimensiones del cubo pre-agregado
+CUBE_DIMS = ['CLIENTE', 'PROYECTO_OK', 'PERIODO', 'BROKER']
+
+# Medidas aditivas del cubo
+CUBE_MEASURES = ['TOTAL_COBRADO', 'PAGO_BROKER', 'UTILIDAD_BRUTA']
+
+# Columnas que lee el cubo: basta que no cambien en las filas viejas para fusionar solo las
+# nuevas (el detalle siempre se lee del DataFrame nuevo)
+CUBE_INPUTS = CUBE_DIMS + ['FACTURA'] + CUBE_MEASURES
+
+# Conteo de facturas distintas: 'exacto' (ids por celda) o 'hll' (aproximado, HyperLogLog)
+DISTINCT_MODE = os.environ.get('DASHBOARD_DISTINCT', 'exacto')
+if DISTINCT_MODE not in DISTINCT_MODES:
+    DISTINCT_MODE = 'exacto'
+
+# Las diferencias de la verificación incremental se reportan aquí (stderr si no hay handler)
+logger = logging.getLogger('dashboard.resumenes')
+
+
+def _add_margin(resumen):
+    # Calcular margen (evitar división por cero)
+    return resumen.assign(MARGEN_PORCENTAJE=np.where(
+        resumen['TOTAL_COBRADO'] > 0,
+        (resumen['UTILIDAD_BRUTA'] / resumen['TOTAL_COBRADO']) * 100,
+        0
+    ))
+
+
+def build_cube(df):
+    # Cubo base CLIENTE x PROYECTO_OK x PERIODO x BROKER x FACTURA con las medidas
+    # aditivas y el número de filas. Es la base exacta de las actualizaciones
+    # incrementales; los resúmenes usan el cubo colapsado de collapse_cube()
+    cube = df.groupby(CUBE_DIMS + ['FACTURA'], observed=True, dropna=False).agg(
+        **{col: (col, 'sum') for col in CUBE_MEASURES},
+        NUM_FILAS=('TOTAL_COBRADO', 'size'),
+    ).reset_index()
+    return cube
+
+
+def collapse_cube(base, mode=DISTINCT_MODE):
+    # Colapsa el cubo base a una fila por celda CLIENTE x PROYECTO_OK x PERIODO x BROKER.
+    # FACTURAS guarda por celda una estructura unible de sus facturas (ids ordenados o
+    # registros HyperLogLog): las facturas distintas de cualquier corte salen de unir
+    # las celdas del corte, sin volver a las filas
+    grouped = base.groupby(CUBE_DIMS, observed=True, dropna=False)
+    cells = grouped.agg(
+        **{col: (col, 'sum') for col in CUBE_MEASURES},
+        NUM_FILAS=('NUM_FILAS', 'sum'),
+    ).reset_index()
+    ids = invoice_ids(base['FACTURA'])
+    codes = grouped.ngroup().to_numpy()
+    order = np.lexsort((ids, codes))
+    cells['FACTURAS'] = build_sketches(codes[order], ids[order], len(cells), mode)
+    return cells
+
+
+def invoice_cube(df, mode=DISTINCT_MODE):
+    # Cubo colapsado directo desde las facturas
+    return collapse_cube(build_cube(df), mode)
+
+
+def slice_cube(cube, cliente='Todos', periodo='Todos', broker='Todos'):
+    # Aplica los filtros de la barra lateral sobre el cubo (no sobre las facturas)
+    # Cada filtro puede ser 'Todos', un valor o una lista de valores
+    mask = np.ones(len(cube), dtype=bool)
+    for col, value in (('CLIENTE', cliente), ('PERIODO', periodo), ('BROKER', broker)):
+        values = normalize_selection(value)
+        if values is not None:
+            mask &= cube[col].isin(values).to_numpy()
+    return cube[mask] if not mask.all() else cube
+
+
+def rollup(cube, keys):
+    # Agrega el cubo a las llaves pedidas; las facturas distintas salen de unir las
+    # estructuras FACTURAS de las celdas de cada grupo
+    resumen = cube.groupby(keys, observed=True).agg(
+        NUM_FACTURAS=('FACTURAS', distinct_count),
+        **{col: (col, 'sum') for col in CUBE_MEASURES},
+        NUM_FILAS=('NUM_FILAS', 'sum'),
+    ).reset_index()
+    resumen['NUM_FACTURAS'] = resumen['NUM_FACTURAS'].astype('int64')
+    return resumen
+
+
+def client_summary(cube):
+    # Resumen por cliente
+    resumen_cliente = rollup(cube, 'CLIENTE')
+    return _add_margin(resumen_cliente[
+        ['CLIENTE', 'NUM_FACTURAS', 'TOTAL_COBRADO', 'PAGO_BROKER', 'UTILIDAD_BRUTA']
+    ])
+
+
+def project_summary(cube):
+    # Resumen por proyecto
+    resumen_proyecto = rollup(cube, ['CLIENTE', 'PROYECTO_OK'])
+    resumen_proyecto = resumen_proyecto.rename(columns={'PROYECTO_OK': 'PROYECTO'})
+    return _add_margin(resumen_proyecto[
+        ['CLIENTE', 'PROYECTO', 'NUM_FACTURAS', 'TOTAL_COBRADO', 'PAGO_BROKER', 'UTILIDAD_BRUTA']
+    ])
+
+
+def period_summary(cube):
+    # Resumen por período
+    resumen_periodo = rollup(cube, 'PERIODO')
+    return _add_margin(resumen_periodo[
+        ['PERIODO', 'NUM_FACTURAS', 'TOTAL_COBRADO', 'PAGO_BROKER', 'UTILIDAD_BRUTA']
+    ])
+
+
+def broker_summary(cube):
+    # Resumen por broker
+    resumen_broker = rollup(cube, 'BROKER')
+    return resumen_broker[['BROKER', 'NUM_FACTURAS', 'PAGO_BROKER', 'TOTAL_COBRADO']].rename(columns={
+        'NUM_FACTURAS': 'NUM_SERVICIOS',
+        'PAGO_BROKER': 'TOTAL_PAGADO'
+    })
+
+
+def summaries_from_cube(cube):
+    # Los cuatro resúmenes (cada pestaña puede pedir solo el suyo)
+    return client_summary(cube), project_summary(cube), period_summary(cube), broker_summary(cube)
+
+
+def create_summaries(df, mode=DISTINCT_MODE):
+    # Resúmenes sobre todos los datos (equivalente a no filtrar el cubo)
+    return summaries_from_cube(invoice_cube(df, mode))
+
+
+# Resumen -> (función, llaves en el cubo, llaves en el resumen)
+SUMMARY_KEYS = {
+    'resumen_cliente': (client_summary, ['CLIENTE'], ['CLIENTE']),
+    'resumen_proyecto': (project_summary, ['CLIENTE', 'PROYECTO_OK'], ['CLIENTE', 'PROYECTO']),
+    'resumen_periodo': (period_summary, ['PERIODO'], ['PERIODO']),
+    'resumen_broker': (broker_summary, ['BROKER'], ['BROKER']),
+}
+
+
+class CubeSummaries:
+    # Resúmenes de un cubo (ya filtrado) bajo demanda: cada uno se calcula la primera vez
+    # que se pide. top() da los n mayores de un resumen (como nlargest)
+
+    def __init__(self, cube):
+        self.cube = cube
+        self._frames = {}
+
+    def __getitem__(self, nombre):
+        if nombre not in self._frames:
+            self._frames[nombre] = SUMMARY_KEYS[nombre][0](self.cube)
+        return self._frames[nombre]
+
+    def top(self, nombre, columna, n, positive=None, **equal):
+        # positive: columna que debe ser > 0; equal: columnas con un valor fijo
+        resumen = self[nombre]
+        for col, value in equal.items():
+            resumen = resumen[resumen[col] == value]
+        if positive is not None:
+            resumen = resumen[resumen[positive] > 0]
+        return resumen.nlargest(n, columna)
+
+
+def _key_mask(frame, cols, keys):
+    # Filas de frame cuyas llaves están en keys (MultiIndex)
+    return pd.MultiIndex.from_frame(frame[cols].astype(object)).isin(keys)
+
+
+def _with_dtypes(frame, dtypes):
+    # Ajusta las categorías/tipos de las llaves a los del DataFrame nuevo
+    frame = frame.copy(deep=False)
+    for col, dtype in dtypes.items():
+        if col in frame.columns and frame[col].dtype != dtype:
+            frame[col] = frame[col].astype(dtype)
+    return frame
+
+
+def merge_appended(df, cube, cells, summaries, start, mode=DISTINCT_MODE):
+    # Actualiza cubo base, cubo colapsado y resúmenes con las filas df[start:] (agregadas
+    # al final). Se recalculan completas solo las celdas del cubo base de las facturas
+    # nuevas (con todas sus filas, en el orden original), las celdas colapsadas que las
+    # contienen y, en cada resumen, solo las llaves afectadas; así el resultado es
+    # idéntico al de recalcular todo
+    cube_cols = CUBE_DIMS + ['FACTURA']
+    nuevas = df.iloc[start:]
+    if nuevas.empty:
+        return cube, cells, summaries
+
+    # Filas (viejas y nuevas) de las facturas que aparecen en las filas nuevas
+    facturas = nuevas['FACTURA'].dropna().unique()
+    candidatas = df['FACTURA'].isin(facturas).to_numpy()
+    if nuevas['FACTURA'].isna().any():
+        candidatas |= df['FACTURA'].isna().to_numpy()
+    celdas = build_cube(df[candidatas])
+
+    # Cubo: se reemplazan las celdas de esas facturas y se reordena como groupby
+    cube = _with_dtypes(cube, {col: df[col].dtype for col in cube_cols})
+    viejas = cube['FACTURA'].isin(facturas).to_numpy()
+    if nuevas['FACTURA'].isna().any():
+        viejas |= cube['FACTURA'].isna().to_numpy()
+    cube = pd.concat([cube[~viejas], celdas], ignore_index=True)
+    cube = cube.sort_values(cube_cols, na_position='last', kind='stable').reset_index(drop=True)
+
+    # Cubo colapsado: se reconstruyen las celdas que contienen esas facturas
+    tocadas = pd.MultiIndex.from_frame(celdas[CUBE_DIMS].astype(object)).unique()
+    colapsadas = collapse_cube(cube[_key_mask(cube, CUBE_DIMS, tocadas)], mode)
+    cells = _with_dtypes(cells, {col: df[col].dtype for col in CUBE_DIMS})
+    cells = pd.concat([cells[~_key_mask(cells, CUBE_DIMS, tocadas)], colapsadas], ignore_index=True)
+    cells = cells.sort_values(CUBE_DIMS, na_position='last', kind='stable').reset_index(drop=True)
+
+    # Resúmenes: solo se recalculan las llaves tocadas por las celdas nuevas
+    merged = []
+    for resumen, (name, (summary_fn, cube_keys, summary_keys)) in zip(summaries, SUMMARY_KEYS.items()):
+        afectadas = pd.MultiIndex.from_frame(celdas[cube_keys].astype(object)).unique()
+        recalculado = summary_fn(cells[_key_mask(cells, cube_keys, afectadas)])
+        resumen = _with_dtypes(resumen, {k: cells[c].dtype for c, k in zip(cube_keys, summary_keys)})
+        resumen = resumen[~_key_mask(resumen, summary_keys, afectadas)]
+        resumen = pd.concat([resumen, recalculado], ignore_index=True)
+        merged.append(resumen.sort_values(summary_keys, kind='stable').reset_index(drop=True))
+    return cube, cells, tuple(merged)
+
+
+def _same_sketches(actual, expected):
+    return len(actual) == len(expected) and all(
+        np.array_equal(a, b) for a, b in zip(actual, expected))
+
+
+def verify_summaries(df, cube, cells, summaries, mode=DISTINCT_MODE):
+    # Compara cubos y resúmenes con un recálculo completo; devuelve las tablas que difieren
+    diferencias = []
+    cube_full = build_cube(df)
+    cells_full = collapse_cube(cube_full, mode)
+    if not _same_sketches(cells['FACTURAS'], cells_full['FACTURAS']):
+        diferencias.append(('facturas por celda', 'Las estructuras de facturas distintas no coinciden'))
+    checks = [('cubo', cube, cube_full),
+              ('celdas', cells.drop(columns='FACTURAS'), cells_full.drop(columns='FACTURAS'))]
+    checks += list(zip(SUMMARY_KEYS, summaries, summaries_from_cube(cells_full)))
+    for name, actual, expected in checks:
+        try:
+            pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True),
+                                          check_exact=True)
+        except AssertionError as error:
+            diferencias.append((name, str(error)))
+    return diferencias
+
+
+class IncrementalSummaries:
+    # Cubo y resúmenes de una versión de los datos. update() detecta si la versión nueva
+    # solo agrega filas al final y en ese caso fusiona únicamente esas filas; si no,
+    # recalcula todo. Con verify=True cada actualización incremental se compara contra
+    # el recálculo completo (y se usa este si difieren). current expone el cubo colapsado
+    # y los datos de la carga (número consecutivo y hora); el cubo base (grano FACTURA)
+    # se guarda aparte para las actualizaciones. Con shared (SharedCache) cada versión
+    # la calcula un solo proceso y los demás la adjuntan desde el caché compartido
+
+    def __init__(self, df, version=None, verify=False, mode=DISTINCT_MODE, shared=None, parts=None):
+        self.verify = verify
+        self.mode = mode
+        self.shared = shared
+        self._lock = threading.Lock()
+        if parts is None:
+            self._base = build_cube(df)
+            cells = collapse_cube(self._base, mode)
+            summaries = summaries_from_cube(cells)
+        else:
+            self._base, cells, summaries = parts
+        self.current = (version, df, cells, summaries, self._load_info(1))
+        self.last_update = {'modo': 'completo', 'filas_nuevas': len(df), 'diferencias': []}
+
+    @classmethod
+    def load(cls, version, loader, verify=False, mode=DISTINCT_MODE, shared=None):
+        # Estado de una versión: del caché compartido si otro proceso ya lo calculó
+        if shared is None:
+            return cls(loader(), version, verify, mode)
+        frames = shared.get_or_build((version, mode), lambda: cls(loader(), version, verify, mode).frames())
+        return cls(frames['facturas'], version, verify, mode, shared, parts=cls._parts(frames))
+
+    @staticmethod
+    def _parts(frames):
+        return frames['cubo'], frames['celdas'], tuple(frames[name] for name in SUMMARY_KEYS)
+
+    def frames(self):
+        # DataFrames de la versión actual por nombre (para el caché compartido)
+        _, df, cells, summaries, _ = self.current
+        return {'facturas': df, 'cubo': self._base, 'celdas': cells, **dict(zip(SUMMARY_KEYS, summaries))}
+
+    @property
+    def version(self):
+        return self.current[0]
+
+    @staticmethod
+    def _load_info(numero):
+        return {'numero': numero, 'cargado': datetime.now()}
+
+    def refresh(self, version, loader):
+        # Carga y fusiona la versión nueva si cambió; con el candado solo un hilo lo hace
+        with self._lock:
+            if version == self.version:
+                return None
+            if self.shared is None:
+                return self.update(loader(), version)
+            key = (version, self.mode)
+            frames = self.shared.get(key)
+            if frames is None:
+                with self.shared.building(key):
+                    frames = self.shared.get(key)
+                    if frames is None:
+                        # Este proceso la calcula (incremental si se puede) y la publica
+                        info = self.update(loader(), version)
+                        self.shared.put(key, self.frames())
+                        return info
+            return self._adopt(frames, version)
+
+    def _adopt(self, frames, version):
+        # Versión calculada por otro proceso
+        self._base, cells, summaries = self._parts(frames)
+        carga = self.current[4]
+        self.current = (version, frames['facturas'], cells, summaries, self._load_info(carga['numero'] + 1))
+        self.last_update = {'modo': 'compartido', 'filas_nuevas': len(frames['facturas']), 'diferencias': []}
+        return self.last_update
+
+    def update(self, new_df, version=None):
+        from datos import find_appended_rows
+
+        _, old_df, cells, summaries, carga = self.current
+        start = find_appended_rows(old_df, new_df, CUBE_INPUTS)
+        info = {'modo': 'completo', 'filas_nuevas': len(new_df), 'diferencias': []}
+        if start is not None:
+            cube, cells, summaries = merge_appended(new_df, self._base, cells, summaries, start, self.mode)
+            info = {'modo': 'incremental', 'filas_nuevas': len(new_df) - start, 'diferencias': []}
+            if self.verify:
+                info['diferencias'] = verify_summaries(new_df, cube, cells, summaries, self.mode)
+                for name, error in info['diferencias']:
+                    logger.warning('Versión %s: la actualización incremental difiere en %s: %s', version, name, error)
+        if start is None or info['diferencias']:
+            # Si la verificación encontró diferencias se usa (y se reporta) el recálculo completo
+            info['modo'] = 'completo'
+            cube = build_cube(new_df)
+            cells = collapse_cube(cube, self.mode)
+            summaries = summaries_from_cube(cells)
+        # Se reemplaza la tupla completa de una vez: los lectores ven la versión vieja o la nueva
+        self._base = cube
+        self.current = (version, new_df, cells, summaries, self._load_info(carga['numero'] + 1))
+        self.last_update = info
+        return info
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from datos import load_workbooks
+
+    parser = argparse.ArgumentParser(description='Verifica la actualización incremental de los resúmenes')
+    parser.add_argument('anterior', help='Libro, directorio o patrón con los datos anteriores')
+    parser.add_argument('nuevo', help='Libro, directorio o patrón con los datos con filas agregadas')
+    parser.add_argument('--verificar', action='store_true', help='Comparar contra un recálculo completo')
+    parser.add_argument('--distintos', choices=DISTINCT_MODES, default=DISTINCT_MODE,
+                        help='Conteo de facturas distintas: exacto o aproximado (hll)')
+    args = parser.parse_args()
+
+    estado = IncrementalSummaries(load_workbooks(args.anterior), verify=args.verificar, mode=args.distintos)
+    info = estado.update(load_workbooks(args.nuevo))
+    print(f"Modo: {info['modo']}, filas nuevas: {info['filas_nuevas']}")
+    if args.verificar:
+        if info['diferencias']:
+            for name, error in info['diferencias']:
+                print(f'DIFERENCIA en {name}:\n{error}')
+            raise SystemExit(1)
+        print('Verificación: idéntico al recálculo completo')
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+# Paridad pandas vs DuckDB (consultas.compare_backends) como prueba automática:
+#   pip install -r requirements-dev.txt && python -m pytest
+# Sin duckdb instalado la prueba se salta
+
+pytest.importorskip('duckdb')
+
+from benchmark import generate_invoices, write_workbook  # noqa: E402
+from consultas import compare_backends  # noqa: E402
+from datos import DATA_FILE  # noqa: E402
+
+SAMPLE_WORKBOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATA_FILE)
+
+# Selecciones al azar por libro (la CLI usa 30; aquí basta menos para que sea rápida)
+PARITY_SAMPLES = 10
+
+
+def _assert_parity(source, cache_dir):
+    diferencias = compare_backends(source, cache_dir=cache_dir, samples=PARITY_SAMPLES)
+    assert not diferencias, '\n'.join(f'{nombre}: {error}' for nombre, error in diferencias[:5])
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_parity_synthetic_workbook(tmp_path, seed):
+    path = tmp_path / 'facturas.xlsx'
+    write_workbook(generate_invoices(3000, seed), path)
+    _assert_parity(str(path), str(tmp_path / 'cache'))
+
+
+def test_parity_several_workbooks(tmp_path):
+    # Directorio con dos libros: ARCHIVO, FILA y las categorías unidas de ambos motores
+    datos = tmp_path / 'libros'
+    datos.mkdir()
+    write_workbook(generate_invoices(1500, 2), datos / 'a.xlsx')
+    write_workbook(generate_invoices(1500, 3), datos / 'b.xlsx')
+    _assert_parity(str(datos), str(tmp_path / 'cache'))
+
+
+@pytest.mark.skipif(not os.path.exists(SAMPLE_WORKBOOK), reason='sin el libro de muestra')
+def test_parity_sample_workbook(tmp_path):
+    _assert_parity(SAMPLE_WORKBOOK, str(tmp_path / 'cache'))